@@ -21,6 +21,34 @@ class Config:
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")
 
+    # LLM transport: one pooled httpx client shared by every provider (HTTP/2 needs the 'h2' package)
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+    LLM_HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "30"))
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+    LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+    LLM_READ_TIMEOUT_SECONDS = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "60"))
+
+    # Retries (jittered exponential backoff) per provider, then failover to the next configured one.
+    # A provider's circuit opens after LLM_BREAKER_FAILURES consecutive failed calls.
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+    LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+    # Query embeddings only fail over if both providers serve the same embedding model (same vector space)
+    LLM_EMBED_FAILOVER = os.getenv("LLM_EMBED_FAILOVER", "false").lower() == "true"
+    # Inputs per embeddings request; index builds are split to stay under the provider's per-request limits
+    LLM_EMBED_BATCH_SIZE = int(os.getenv("LLM_EMBED_BATCH_SIZE", "256"))
+
+    # Rate scheduling: "deployment=rpm:tpm,..." (unlisted deployments are unlimited). Calls queue in
+    # priority order chat > router > embeddings > batch; interactive calls give up after the deadline,
+    # batch work (index builds) waits indefinitely but never takes the last LLM_BATCH_RESERVE of a bucket
+    LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+    LLM_QUEUE_DEADLINE_SECONDS = float(os.getenv("LLM_QUEUE_DEADLINE_SECONDS", "15"))
+    LLM_BATCH_RESERVE = float(os.getenv("LLM_BATCH_RESERVE", "0.2"))
+    LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "500"))  # TPM charge for output
+
     # Paths — use runtime_resolver for robust path resolution
     _runtime = get_runtime_dir()
     RUNTIME_DIR = str(_runtime)
@@ -31,13 +59,114 @@ class Config:
 
     INDEX_PATH = str(_runtime / "index" / "faiss.index")
     META_PATH = str(_runtime / "index" / "meta.json")
+    INDEX_INFO_PATH = str(_runtime / "index" / "index_info.json")
+    VECTORS_PATH = str(_runtime / "index" / "vectors.npy")
+    LOCAL_EMBEDDER_PATH = str(_runtime / "index" / "local_embedder.npz")
     LEADS_PATH = str(_runtime / "leads" / "leads.csv")
     AUDIT_PATH = str(_runtime / "leads" / "audit.csv")
 
+    # Embeddings: provider | local (CPU-only hashed TF-IDF + SVD) | auto (provider, local if it fails)
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "auto")
+    LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "256"))
+
+    # FAISS index type: flat_l2 | flat_ip | hnsw | ivf_flat (all but flat_l2 use normalised vectors + IP)
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat_ip")
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80"))
+    FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+    FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))  # 0 = ~4*sqrt(n)
+    FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "8"))
+    # Vector storage: none | fp16 | int8 | pq — quantized hits are re-ranked exactly against vectors.npy
+    FAISS_QUANTIZATION = os.getenv("FAISS_QUANTIZATION", "none")
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "16"))
+    FAISS_RERANK_FACTOR = int(os.getenv("FAISS_RERANK_FACTOR", "4"))
+
+    # Chunk-level index: candidates fetched per requested project, aggregation, chunks kept as context
+    RAG_CHUNK_FANOUT = int(os.getenv("RAG_CHUNK_FANOUT", "8"))
+    RAG_CHUNK_AGGREGATION = os.getenv("RAG_CHUNK_AGGREGATION", "max")  # max | sum
+    RAG_CHUNKS_PER_PROJECT = int(os.getenv("RAG_CHUNKS_PER_PROJECT", "2"))
+
+    # Hybrid retrieval — score fusion and relevance cutoff
+    RAG_FUSION_METHOD = os.getenv("RAG_FUSION_METHOD", "weighted")  # weighted | rrf
+    RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+    RAG_MIN_RELEVANCE = float(os.getenv("RAG_MIN_RELEVANCE", "0.3"))
+    RAG_SOURCE_WEIGHTS = {
+        "faiss": float(os.getenv("RAG_WEIGHT_FAISS", "1.0")),
+        "faiss_local": float(os.getenv("RAG_WEIGHT_FAISS", "1.0")),
+        "fuzzy": float(os.getenv("RAG_WEIGHT_FUZZY", "0.9")),
+        "bm25": float(os.getenv("RAG_WEIGHT_BM25", "0.8")),
+    }
+    # Raw-score (floor, ceiling) per retriever, mapped onto [0, 1]. The "faiss" band suits
+    # ada-002 cosine similarities; indexes built with a model in RAG_FAISS_MODEL_BOUNDS use that band.
+    RAG_SCORE_BOUNDS = {
+        "faiss": (float(os.getenv("RAG_FAISS_SIM_FLOOR", "0.70")), float(os.getenv("RAG_FAISS_SIM_CEIL", "0.88"))),
+        "faiss_local": (0.2, 0.75),
+        "fuzzy": (0.6, 1.0),
+        "bm25": (0.15, 0.8),
+    }
+    # FAISS band per embedding model, matched as a substring of the model/deployment that built the
+    # index (the OpenAI fallback's text-embedding-3-* cosines sit far lower than ada-002's)
+    RAG_FAISS_MODEL_BOUNDS = {
+        "text-embedding-3": (float(os.getenv("RAG_FAISS_V3_SIM_FLOOR", "0.15")), float(os.getenv("RAG_FAISS_V3_SIM_CEIL", "0.55"))),
+    }
+
+    # Direct entity resolution: router entities → project_ids, skipping embedding + FAISS
+    RAG_ENTITY_INTENTS = tuple(os.getenv("RAG_ENTITY_INTENTS", "compare,project_query").split(","))
+    RAG_ENTITY_MIN_SCORE = float(os.getenv("RAG_ENTITY_MIN_SCORE", "90"))
+    RAG_ENTITY_MARGIN = float(os.getenv("RAG_ENTITY_MARGIN", "5"))  # lead over the runner-up project
+    RAG_ENTITY_MAX = int(os.getenv("RAG_ENTITY_MAX", "4"))
+
+    # Broad turns ("all properties") rarely clear the relevance cutoff; they fall back to a plain listing
+    RAG_LISTING_INTENTS = tuple(os.getenv("RAG_LISTING_INTENTS", "list_projects").split(","))
+    RAG_LISTING_MAX = int(os.getenv("RAG_LISTING_MAX", "8"))
+
+    # Answer-prompt history: token budget, recent messages kept verbatim, rolling summary for the rest
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+    HISTORY_KEEP_RECENT = int(os.getenv("HISTORY_KEEP_RECENT", "6"))
+    HISTORY_SUMMARY_STEP = int(os.getenv("HISTORY_SUMMARY_STEP", "4"))  # re-summarise every N messages
+    HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+    HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "1000"))
+
+    # Server-side chat sessions: idle TTL, LRU cap, on-disk backend shared by every worker and
+    # surviving restarts ("" = memory only, for a single worker process)
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "7200"))
+    SESSION_ID_BYTES = int(os.getenv("SESSION_ID_BYTES", "24"))  # entropy of server-minted ids
+    SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "5000"))
+    SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+    SESSION_PURGE_SECONDS = float(os.getenv("SESSION_PURGE_SECONDS", "300"))  # expired/overflow sweep interval
+    _session_dir = os.getenv("SESSION_STORE_DIR", "sessions")  # relative paths live under runtime/
+    SESSION_STORE_DIR = str(_runtime / _session_dir) if _session_dir else ""
+
+    # Semantic answer cache for history-free turns: same KB version, intent, filters and named
+    # projects, query embedding cosine ≥ MIN_SIMILARITY → replay the answer, no LLM call (SIZE=0 disables)
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "500"))
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.95"))
+    ANSWER_CACHE_INTENTS = tuple(os.getenv("ANSWER_CACHE_INTENTS", "list_projects,project_query,compare,pricing").split(","))
+
+    # Chat SSE: buffered frames before backpressure reaches the LLM stream, idle heartbeat interval
+    CHAT_STREAM_QUEUE_SIZE = int(os.getenv("CHAT_STREAM_QUEUE_SIZE", "32"))
+    CHAT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("CHAT_STREAM_HEARTBEAT_SECONDS", "10"))
+
+    # Tool calls (save_lead, ...): a call is acknowledged once journaled to TOOL_JOURNAL_PATH;
+    # one worker process (the journal's owner) runs the jobs and replays pending ones
+    TOOL_JOURNAL_PATH = str(_runtime / "queue" / "tool_jobs.jsonl")
+    LEAD_JOBS_PATH = str(_runtime / "queue" / "lead_jobs.txt")  # save_lead job ids already written
+    TOOL_QUEUE_SIZE = int(os.getenv("TOOL_QUEUE_SIZE", "256"))
+    TOOL_MAX_ATTEMPTS = int(os.getenv("TOOL_MAX_ATTEMPTS", "3"))
+
+    # Per-stage timings: Server-Timing header on /api/chat, "timings" in the stream done event
+    # (also per request via "X-Debug-Timings: 1")
+    DEBUG_TIMINGS = os.getenv("DEBUG_TIMINGS", "false").lower() == "true"
+
     # Admin
     ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin")
+    ADMIN_STREAM_QUEUE_SIZE = int(os.getenv("ADMIN_STREAM_QUEUE_SIZE", "100"))
+    ADMIN_STREAM_HEARTBEAT_SECONDS = float(os.getenv("ADMIN_STREAM_HEARTBEAT_SECONDS", "15"))
+    ADMIN_STREAM_POLL_SECONDS = float(os.getenv("ADMIN_STREAM_POLL_SECONDS", "1"))  # CSV tail interval
 
     # Ensure runtime dirs exist
     os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
     os.makedirs(os.path.dirname(LEADS_PATH), exist_ok=True)
+    os.makedirs(os.path.dirname(TOOL_JOURNAL_PATH), exist_ok=True)
     os.makedirs(str(_runtime / "exports"), exist_ok=True)
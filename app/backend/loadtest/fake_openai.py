@@ -0,0 +1,226 @@
+"""
+Local stand-in for the OpenAI / Azure OpenAI API, for load tests that must not burn quota.
+
+    python -m app.backend.loadtest.fake_openai --port 9100 --ttft-ms 400 --tokens-per-sec 60
+
+Serves chat completions (plain and streamed, with include_usage), JSON-mode router
+replies and embeddings, on both OpenAI (/v1/...) and Azure
+(/openai/deployments/{name}/...) paths. Latency, token rate, completion length and an
+injected error rate are configurable; embeddings are deterministic per input text.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SETTINGS: Dict[str, Any] = {
+    "ttft_ms": 400.0,
+    "tokens_per_sec": 60.0,
+    "completion_tokens": 120,
+    "embed_ms": 80.0,
+    "embed_dim": 1536,
+    "jitter": 0.2,
+    "error_rate": 0.0,
+}
+
+_WORDS = (
+    "Palm Hills offers a range of residential communities across West Cairo, East Cairo and the North Coast, "
+    "with villas, townhouses and apartments at several price points. I would be glad to arrange a site visit "
+    "or a call with our sales team to walk you through availability and payment plans."
+).split()
+
+app = FastAPI(title="PalmX fake OpenAI")
+
+
+def _delay(ms: float) -> float:
+    j = SETTINGS["jitter"]
+    return max(0.0, ms * random.uniform(1 - j, 1 + j)) / 1000.0
+
+
+def _failure():
+    if SETTINGS["error_rate"] and random.random() < SETTINGS["error_rate"]:
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Injected failure", "type": "server_error", "code": None}},
+        )
+    return None
+
+
+def _count(messages: List[Dict[str, Any]]) -> int:
+    return sum(max(1, len(str(m.get("content") or "")) // 4) + 4 for m in messages)
+
+
+def _router_reply(messages: List[Dict[str, Any]]) -> str:
+    """A plausible router JSON object for the last user line."""
+    text = str(messages[-1].get("content") or "").replace("Contextualize:", "").strip()
+    lower = text.lower()
+    if any(w in lower for w in ("price", "cost", "how much")):
+        intent = "pricing"
+    elif "compare" in lower:
+        intent = "compare"
+    elif any(w in lower for w in ("call me", "visit", "interested", "book")):
+        intent = "lead_capture"
+    elif any(w in lower for w in ("list", "available", "properties", "projects")):
+        intent = "list_projects"
+    else:
+        intent = "project_query"
+    return json.dumps({"intent": intent, "needs": [], "filters": {}, "query_rewrite": text, "entities": []})
+
+
+def _words(n: int) -> List[str]:
+    return [_WORDS[i % len(_WORDS)] + " " for i in range(n)]
+
+
+def _usage(prompt: int, completion: int) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+async def _chat(body: Dict[str, Any]):
+    failure = _failure()
+    if failure is not None:
+        await asyncio.sleep(_delay(SETTINGS["ttft_ms"]))
+        return failure
+
+    messages = body.get("messages") or []
+    model = body.get("model", "fake")
+    prompt_tokens = _count(messages)
+    json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+    if json_mode:
+        pieces = [_router_reply(messages)]
+    else:
+        n = min(int(body.get("max_tokens") or SETTINGS["completion_tokens"]), SETTINGS["completion_tokens"])
+        pieces = _words(n)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        # Whole completion at once: first-token latency plus generation time
+        generation = 0.0 if json_mode else len(pieces) / SETTINGS["tokens_per_sec"]
+        await asyncio.sleep(_delay(SETTINGS["ttft_ms"]) + generation)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(pieces)},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(prompt_tokens, len(pieces)),
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    def chunk(delta: Dict[str, Any], finish: Any = None) -> str:
+        return "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }) + "\n\n"
+
+    async def events():
+        await asyncio.sleep(_delay(SETTINGS["ttft_ms"]))
+        yield chunk({"role": "assistant", "content": ""})
+        gap = 1.0 / SETTINGS["tokens_per_sec"]
+        for piece in pieces:
+            yield chunk({"content": piece})
+            await asyncio.sleep(gap)
+        yield chunk({}, "stop")
+        if include_usage:
+            yield "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": _usage(prompt_tokens, len(pieces)),
+            }) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _vector(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(SETTINGS["embed_dim"]).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+async def _embeddings(body: Dict[str, Any]):
+    inputs = body.get("input") or []
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    await asyncio.sleep(_delay(SETTINGS["embed_ms"]))
+    failure = _failure()
+    if failure is not None:
+        return failure
+    as_base64 = body.get("encoding_format") == "base64"  # The Python SDK asks for base64 by default
+    data = []
+    for i, text in enumerate(inputs):
+        v = _vector(str(text))
+        embedding = base64.b64encode(v.astype("<f4").tobytes()).decode("ascii") if as_base64 else v.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(max(1, len(str(t)) // 4) for t in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "fake-embedding"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(request: Request, deployment: str = ""):
+    body = await request.json()
+    if deployment:
+        body.setdefault("model", deployment)
+    return await _chat(body)
+
+
+@app.post("/v1/embeddings")
+@app.post("/openai/deployments/{deployment}/embeddings")
+async def embeddings(request: Request, deployment: str = ""):
+    body = await request.json()
+    if deployment:
+        body.setdefault("model", deployment)
+    return await _embeddings(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI/Azure OpenAI server for PalmX load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=SETTINGS["ttft_ms"], help="Delay before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=SETTINGS["tokens_per_sec"])
+    parser.add_argument("--completion-tokens", type=int, default=SETTINGS["completion_tokens"])
+    parser.add_argument("--embed-ms", type=float, default=SETTINGS["embed_ms"])
+    parser.add_argument("--embed-dim", type=int, default=SETTINGS["embed_dim"])
+    parser.add_argument("--jitter", type=float, default=SETTINGS["jitter"], help="± fraction applied to latencies")
+    parser.add_argument("--error-rate", type=float, default=SETTINGS["error_rate"], help="Fraction of calls answered with HTTP 500")
+    args = parser.parse_args()
+
+    SETTINGS.update({k: getattr(args, k) for k in SETTINGS})
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
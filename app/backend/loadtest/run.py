@@ -0,0 +1,354 @@
+"""
+Load test for the PalmX chat API that replays real conversations.
+
+    python -m app.backend.loadtest.run --spawn --sessions 200 --concurrency 20 --endpoint mixed
+
+The user messages in the audit log (runtime/leads/audit.csv) are grouped by session in
+their original order. Each recorded conversation is replayed turn by turn as a fresh
+virtual session against /api/chat, /api/chat/stream or both ("mixed" alternates per
+session). --concurrency sessions are in flight at once.
+
+--spawn starts a fake OpenAI server (app.backend.loadtest.fake_openai) and a backend
+pointed at it, on a throwaway runtime directory with its own index built through the
+fake embeddings endpoint. No real quota is used and the real audit/leads files are not
+touched. Without --spawn, --target must be a running backend; whatever LLM it is
+configured with gets the traffic.
+
+Reported per endpoint: sessions and requests, throughput, error rate, and latency
+p50/p95/p99, plus time-to-first-token for the stream.
+"""
+import argparse
+import csv
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+from app.backend.config import Config
+
+
+def load_conversations(path: str, max_turns: int) -> List[List[str]]:
+    """User messages grouped by session_id, in recorded order."""
+    sessions: Dict[str, List[str]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            message = (row.get("user_message") or "").strip()
+            if message:
+                sessions.setdefault(row.get("session_id") or "", []).append(message)
+    return [turns[:max_turns] for turns in sessions.values() if turns]
+
+
+class Client:
+    """One keep-alive HTTP connection per virtual session."""
+
+    def __init__(self, target: str, timeout: float):
+        url = urlparse(target)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.https = url.scheme == "https"
+        self.timeout = timeout
+        self.conn = None
+
+    def _connection(self):
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, self.port, timeout=self.timeout)
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def post(self, path: str, body: Dict[str, Any]) -> http.client.HTTPResponse:
+        conn = self._connection()
+        try:
+            conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+            return conn.getresponse()
+        except Exception:
+            self.close()
+            raise
+
+    def create_session(self) -> str:
+        response = self.post("/api/session", {})
+        payload = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"Session creation failed: HTTP {response.status}")
+        return json.loads(payload)["session_id"]
+
+    def chat(self, session_id: str, message: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = {"endpoint": "chat", "ok": False, "ttft": None, "error": None}
+        try:
+            response = self.post("/api/chat", {"session_id": session_id, "message": message})
+            payload = response.read()
+            result["status"] = response.status
+            if response.status != 200:
+                result["error"] = f"HTTP {response.status}"
+            elif "message" in json.loads(payload):
+                result["ok"] = True
+            else:
+                result["error"] = "no message in reply"
+        except Exception as e:
+            self.close()
+            result["error"] = type(e).__name__
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    def stream(self, session_id: str, message: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = {"endpoint": "stream", "ok": False, "ttft": None, "error": None}
+        try:
+            response = self.post("/api/chat/stream", {"session_id": session_id, "message": message})
+            result["status"] = response.status
+            if response.status != 200:
+                response.read()
+                result["error"] = f"HTTP {response.status}"
+            else:
+                event = "message"
+                while True:
+                    line = response.readline()
+                    if not line:
+                        break
+                    line = line.decode("utf-8").rstrip("\r\n")
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:"):
+                        if event == "token" and result["ttft"] is None:
+                            result["ttft"] = time.perf_counter() - start
+                        elif event == "done":
+                            result["ok"] = True
+                    elif not line:
+                        event = "message"
+                if not result["ok"]:
+                    result["error"] = "stream ended without done"
+                    self.close()  # The connection state is unknown
+        except Exception as e:
+            self.close()
+            result["error"] = type(e).__name__
+        result["latency"] = time.perf_counter() - start
+        return result
+
+
+def run_session(target: str, turns: List[str], endpoint: str, think: float, timeout: float) -> List[Dict[str, Any]]:
+    client = Client(target, timeout)
+    try:
+        session_id = client.create_session()
+    except Exception as e:
+        client.close()
+        # Every turn of the session fails with it, so the error rate stays per request
+        return [{"endpoint": endpoint, "ok": False, "ttft": None, "error": f"session: {type(e).__name__}", "latency": 0.0}
+                for _ in turns]
+    results = []
+    try:
+        for message in turns:
+            results.append(client.stream(session_id, message) if endpoint == "stream" else client.chat(session_id, message))
+            if think:
+                time.sleep(think)
+    finally:
+        client.close()
+    return results
+
+
+def run(args, target: str) -> Dict[str, Any]:
+    conversations = load_conversations(args.audit, args.max_turns)
+    if not conversations:
+        raise SystemExit(f"No user messages in {args.audit}")
+
+    plan = []
+    for i in range(args.sessions):
+        endpoint = args.endpoint if args.endpoint != "mixed" else ("chat", "stream")[i % 2]
+        plan.append((conversations[i % len(conversations)], endpoint))
+
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    done = [0]
+
+    def worker(item):
+        turns, endpoint = item
+        out = run_session(target, turns, endpoint, args.think_ms / 1000.0, args.timeout)
+        with lock:
+            results.extend(out)
+            done[0] += 1
+            if not args.json and done[0] % max(1, args.sessions // 10) == 0:
+                print(f"  {done[0]}/{args.sessions} sessions", file=sys.stderr)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, plan))
+    wall = time.perf_counter() - start
+
+    report = {"target": target, "sessions": args.sessions, "concurrency": args.concurrency,
+              "wall_s": round(wall, 3), "endpoints": []}
+    for endpoint in ("chat", "stream"):
+        rows = [r for r in results if r["endpoint"] == endpoint]
+        if not rows:
+            continue
+        ok = [r for r in rows if r["ok"]]
+        latencies = np.array([r["latency"] for r in ok]) if ok else np.zeros(1)
+        ttfts = np.array([r["ttft"] for r in ok if r["ttft"] is not None])
+        errors: Dict[str, int] = {}
+        for r in rows:
+            if not r["ok"]:
+                errors[r["error"]] = errors.get(r["error"], 0) + 1
+        entry = {
+            "endpoint": endpoint,
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "error_rate": round((len(rows) - len(ok)) / len(rows), 4),
+            "throughput_rps": round(len(ok) / wall, 3),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1e3, 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1e3, 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1e3, 1),
+            "error_kinds": errors,
+        }
+        if len(ttfts):
+            entry.update({
+                "ttft_p50_ms": round(float(np.percentile(ttfts, 50)) * 1e3, 1),
+                "ttft_p95_ms": round(float(np.percentile(ttfts, 95)) * 1e3, 1),
+                "ttft_p99_ms": round(float(np.percentile(ttfts, 99)) * 1e3, 1),
+            })
+        report["endpoints"].append(entry)
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{report['sessions']} sessions × concurrency {report['concurrency']} against {report['target']} "
+          f"in {report['wall_s']:.1f}s")
+    header = f"{'endpoint':<10}{'requests':>9}{'err %':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}" \
+             f"{'ttft p50':>10}{'ttft p95':>10}{'ttft p99':>10}"
+    print(header)
+    print("-" * len(header))
+    for e in report["endpoints"]:
+        ttft = "".join(f"{e[k]:>10.1f}" if k in e else f"{'-':>10}" for k in ("ttft_p50_ms", "ttft_p95_ms", "ttft_p99_ms"))
+        print(f"{e['endpoint']:<10}{e['requests']:>9}{e['error_rate'] * 100:>8.2f}{e['throughput_rps']:>8.2f}"
+              f"{e['p50_ms']:>9.1f}{e['p95_ms']:>9.1f}{e['p99_ms']:>9.1f}{ttft}")
+        if e["error_kinds"]:
+            print(f"{'':<10}errors: {e['error_kinds']}")
+
+
+# --- --spawn: fake provider + isolated backend ---
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float, proc: subprocess.Popen):
+    parsed = urlparse(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Process for {url} exited with {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=2)
+            conn.request("GET", parsed.path)
+            if conn.getresponse().status < 500:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+class Stack:
+    """Fake OpenAI server + backend on a throwaway runtime dir; nothing is written to the real runtime."""
+
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix="palmx-loadtest-")
+        self.procs: List[subprocess.Popen] = []
+
+    def start(self) -> str:
+        a = self.args
+        fake_port, backend_port = _free_port(), _free_port()
+        fake = [sys.executable, "-m", "app.backend.loadtest.fake_openai", "--port", str(fake_port),
+                "--ttft-ms", str(a.fake_ttft_ms), "--tokens-per-sec", str(a.fake_tokens_per_sec),
+                "--completion-tokens", str(a.fake_completion_tokens), "--embed-ms", str(a.fake_embed_ms),
+                "--error-rate", str(a.fake_error_rate)]
+        self.procs.append(subprocess.Popen(fake))
+        _wait_for(f"http://127.0.0.1:{fake_port}/docs", 30, self.procs[-1])
+
+        runtime = os.path.join(self.tmp, "runtime")
+        os.makedirs(runtime)
+        env = dict(os.environ)
+        env.update({
+            "PALMX_RUNTIME_DIR": runtime,
+            "KB_CSV_PATH": os.path.abspath(Config.KB_CSV_PATH),
+            "AZURE_OPENAI_API_KEY": "",  # Blank beats .env: only the fake provider is configured
+            "AZURE_OPENAI_ENDPOINT": "",
+            "OPENAI_API_KEY": "sk-loadtest",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+            "EMBEDDING_BACKEND": "provider",
+        })
+        subprocess.run([sys.executable, "-m", "app.backend.retrieval.build_index"], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        self.procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.backend.main:app", "--host", "127.0.0.1",
+             "--port", str(backend_port), "--log-level", "warning"],
+            env=env,
+        ))
+        target = f"http://127.0.0.1:{backend_port}"
+        _wait_for(f"{target}/api/health", 120, self.procs[-1])
+        return target
+
+    def stop(self):
+        for proc in reversed(self.procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if not self.args.keep:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+        else:
+            print(f"Runtime kept at {self.tmp}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay audit.csv conversations against the PalmX chat API.")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Backend base URL (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Start a fake OpenAI server and a backend wired to it")
+    parser.add_argument("--audit", default=Config.AUDIT_PATH, help="Audit CSV to replay (default: runtime/leads/audit.csv)")
+    parser.add_argument("--sessions", type=int, default=100, help="Virtual sessions to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="Sessions in flight at once")
+    parser.add_argument("--endpoint", choices=["chat", "stream", "mixed"], default="mixed")
+    parser.add_argument("--max-turns", type=int, default=6, help="Turns replayed per recorded conversation")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause between a session's turns")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request socket timeout (s)")
+    parser.add_argument("--fake-ttft-ms", type=float, default=400.0)
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--fake-completion-tokens", type=int, default=120)
+    parser.add_argument("--fake-embed-ms", type=float, default=80.0)
+    parser.add_argument("--fake-error-rate", type=float, default=0.0)
+    parser.add_argument("--keep", action="store_true", help="Keep the --spawn runtime dir (audit, timings) for inspection")
+    parser.add_argument("--json", action="store_true", help="Print the raw report as JSON")
+    args = parser.parse_args()
+
+    stack = Stack(args) if args.spawn else None
+    try:
+        target = stack.start() if stack else args.target
+        report = run(args, target)
+    finally:
+        if stack:
+            stack.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,24 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import json
 import logging
 import os
-from datetime import datetime
+import time
 
 from app.backend.config import Config
-from app.backend.models import ChatRequest, ChatResponse, Lead, Message
-from app.backend.services.llm_service import llm_service
+from app.backend.models import ChatRequest, ChatResponse, Lead, BatchSearchRequest, BatchSearchResponse, SearchHit, SearchResult, SessionState
 from app.backend.services.rag_service import rag_service
 from app.backend.services.leads_service import leads_service
-from app.backend.services.kb_service import kb_service
+from app.backend.services.prompt_service import PromptBuilder
+from app.backend.services.chat_pipeline import ChatPipeline
+from app.backend.services.session_service import session_store
+from app.backend.services.tools_service import tool_executor, tool_registry
+from app.backend.services.sse_service import relay
+from app.backend.services.metrics_service import metrics, CONTENT_TYPE, HTTP_LATENCY, HTTP_REQUESTS, SSE_STREAMS
 from app.backend.routes.admin_routes import router as admin_router
 
 # Logging setup
@@ -34,13 +39,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template, not the raw path, keeps label cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+        HTTP_LATENCY.observe(time.perf_counter() - start, route=route)
+
 CONCIERGE_SYSTEM_PROMPT = """
 You are PalmX Concierge, the Senior Sales Executive for Palm Hills.
 Your goal is to convert inquiries into site visits or calls by being intelligent, human, and persuasive.
 You are NOT a support bot. You are a "closer" with a discreet, luxurious, and sharp commercial brain.
 
 ### 8. Temporal Logic (STRICT)
-- **TODAY IS**: {current_date}.
+- **TODAY IS**: the date given in the TODAY section at the end of these instructions.
 - **Year Inference**: If the user mentions a month (e.g., "March") or a relative time (e.g., "this month", "next month"), you MUST calculate the year relative to TODAY.
 - **2024 REGRESSION PREVENTION**: Never output "2024" for future timelines. If it is currently February 2026, then "March" refers to March 2026.
 - **Format**: In the confirmation summary (Stage 6), you MUST always explicitly include the year in the Timeline field (e.g., "Timeline: March 2026").
@@ -124,123 +143,55 @@ You are NOT a support bot. You are a "closer" with a discreet, luxurious, and sh
 - Use validated data from CONTEXT only.
 """
 
+# Static persona first, date and context after it — see PromptBuilder
+concierge_prompt = PromptBuilder(CONCIERGE_SYSTEM_PROMPT)
+
 @app.get("/api/health")
 async def health_check():
     """Simple health check for frontend to poll during startup."""
     return {"status": "ready", "rag_ready": rag_service.is_ready}
 
 # --- Tools ---
-TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "save_lead",
-            "description": "Save a verified, confirmed lead with ALL gathered details. Call ONLY after the buyer explicitly confirms their information is correct. Populate every field you have gathered during the conversation — leave unknown fields empty rather than guessing.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "name": {"type": "string", "description": "The buyer's full name"},
-                    "phone": {"type": "string", "description": "Phone or WhatsApp number"},
-                    "interest_projects": {"type": "string", "description": "Comma-separated list of project names they showed interest in"},
-                    "preferred_region": {"type": "string", "description": "Their preferred region", "enum": ["West", "East", "Coast", "New Capital", "Alex", "Sokhna"]},
-                    "unit_type": {"type": "string", "description": "Villa, Apartment, Townhouse, Duplex, Penthouse, Commercial, etc."},
-                    "budget_min": {"type": "string", "description": "Minimum budget in EGP (e.g. '5000000')"},
-                    "budget_max": {"type": "string", "description": "Maximum budget in EGP (e.g. '15000000')"},
-                    "purpose": {"type": "string", "description": "Buy, Rent, or Invest", "enum": ["Buy", "Rent", "Invest"]},
-                    "timeline": {"type": "string", "description": "When they plan to purchase — Immediately, 3 months, 6 months, 1 year, etc."},
-                    "next_step": {"type": "string", "description": "Agreed next action", "enum": ["callback", "site_visit", "send_details"]},
-                    "lead_summary": {"type": "string", "description": "A 2-3 line natural-language summary of the entire conversation and the buyer's needs, preferences, and any notable context"},
-                    "tags": {"type": "string", "description": "Auto-generated comma-separated tags capturing key attributes: e.g. 'high-budget,villa,west-cairo,investor,urgent'"},
-                    "kb_version_hash": {"type": "string", "description": "Version hash of the knowledge base used"}
-                },
-                "required": ["name", "phone"]
-            }
-        }
-    }
-]
+# Schemas and handlers live in tools_service; the pipeline queues calls on tool_executor
+TOOLS = tool_registry.definitions()
+
+chat_pipeline = ChatPipeline(concierge_prompt, TOOLS)
+
+@app.on_event("startup")
+def start_tool_executor():
+    # One worker process becomes the journal owner and replays jobs left pending
+    tool_executor.start()
 
 # --- Endpoints ---
 
+def _debug_timings(debug_header: Optional[str]) -> bool:
+    return Config.DEBUG_TIMINGS or debug_header == "1"
+
+async def _session(session_id: str) -> SessionState:
+    # Only ids minted by /api/session are served; the client mints a new one on 404
+    state = await run_in_threadpool(session_store.lookup, session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return state
+
+@app.post("/api/session")
+def create_session():
+    """Starts a conversation; the returned session_id goes with every chat request."""
+    return {"session_id": session_store.create().session_id}
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(
+    request: ChatRequest,
+    response: Response,
+    debug_timings: Optional[str] = Header(None, alias="X-Debug-Timings")
+):
+    state = await _session(request.session_id)
     try:
-        user_msg = request.messages[-1].content
-        session_id = request.session_id
-        
-        # 1. Router
-        history = request.messages[:-1]
-        router_out = llm_service.router_completion(user_msg, history=history)
-        logger.info(f"Router intent: {router_out.intent} | Filters: {router_out.filters}")
-
-        # 2. Retrieval
-        retrieved_docs = []
-        if router_out.intent not in ("support_contact", "lead_capture"):
-            results = rag_service.search(
-                router_out.query_rewrite, 
-                k=3, 
-                filters=router_out.filters
-            )
-            retrieved_docs = [r['project'] for r in results]
-
-        # 3. Context Construction
-        context_text = ""
-        for p in retrieved_docs:
-            context_text += f"---\n{kb_service.build_project_card(p)}\n"
-            
-        current_date = datetime.now().strftime("%B %d, %Y")
-        full_system_msg = CONCIERGE_SYSTEM_PROMPT.format(current_date=current_date) + f"\n\nCONTEXT:\n{context_text}"
-        
-        # 4. Answer Generation
-        response_data = llm_service.answer_completion(
-            full_system_msg, 
-            request.messages,
-            tools=TOOLS
-        )
-        
-        final_text = ""
-        
-        # 5. Handle Tool Calls
-        if isinstance(response_data, list):
-            for tool_call in response_data:
-                if tool_call.function.name == "save_lead":
-                    args = json.loads(tool_call.function.arguments)
-                    logger.info(f"Tool Call 'save_lead' Args: {args}")
-                    
-                    lead = Lead(
-                        session_id=session_id,
-                        name=args.get('name'),
-                        phone=args.get('phone'),
-                        interest_projects=args.get('interest_projects', '').split(',') if args.get('interest_projects') else [],
-                        preferred_region=args.get('preferred_region'),
-                        unit_type=args.get('unit_type'),
-                        budget_min=args.get('budget_min'),
-                        budget_max=args.get('budget_max'),
-                        purpose=args.get('purpose'),
-                        timeline=args.get('timeline'),
-                        next_step=args.get('next_step'),
-                        lead_summary=args.get('lead_summary'),
-                        tags=args.get('tags', '').split(',') if args.get('tags') else [],
-                        kb_version_hash=args.get('kb_version_hash', 'v1.0')
-                    )
-                    leads_service.save_lead(lead)
-                    final_text = f"Thank you {lead.name}. Your details have been saved. A sales representative will contact you at {lead.phone} shortly."
-        else:
-            final_text = response_data
-
-        # 6. Audit
-        leads_service.log_audit(
-            session_id, 
-            user_msg, 
-            router_out.intent, 
-            [p.project_id for p in retrieved_docs], 
-            [] 
-        )
-        
-        return ChatResponse(
-            message=final_text,
-            retrieved_projects=[p.project_name for p in retrieved_docs],
-            mode="lead_capture" if router_out.intent == "lead_capture" else "concierge"
-        )
+        # Blocking LLM + retrieval calls run in the threadpool, not on the event loop
+        chat_response, turn = await run_in_threadpool(chat_pipeline.respond, request, state)
+        if _debug_timings(debug_timings):
+            response.headers["Server-Timing"] = turn.timer.server_timing()
+        return chat_response
 
     except Exception as e:
         logger.error(f"Chat error: {e}")
@@ -250,93 +201,94 @@ async def chat_endpoint(request: ChatRequest):
             mode="concierge"
         )
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/api/chat/stream")
-async def chat_stream_endpoint(request: ChatRequest):
-    try:
-        user_msg = request.messages[-1].content
-        session_id = request.session_id
-        
-        # 1. Router
-        history = request.messages[:-1]
-        router_out = llm_service.router_completion(user_msg, history=history)
-        logger.info(f"[Stream] Router intent: {router_out.intent}")
-
-        # 2. Retrieval
-        retrieved_docs = []
-        if router_out.intent not in ("support_contact", "lead_capture"):
-            results = rag_service.search(
-                router_out.query_rewrite, k=3, filters=router_out.filters
-            )
-            retrieved_docs = [r['project'] for r in results]
-
-        # 3. Context
-        context_text = ""
-        for p in retrieved_docs:
-            context_text += f"---\n{kb_service.build_project_card(p)}\n"
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    http_request: Request,
+    debug_timings: Optional[str] = Header(None, alias="X-Debug-Timings")
+):
+    debug = _debug_timings(debug_timings)
+    state = await _session(request.session_id)
+
+    # Typed events, each sent the moment its stage finishes:
+    # router → retrieval → token* (tool) → done. Payloads of token/done are unchanged.
+    async def frames():
+        try:
+            turn = await run_in_threadpool(chat_pipeline.start, request, state)
+            await run_in_threadpool(chat_pipeline.route, turn)
+            logger.info(f"[Stream] Router intent: {turn.router_out.intent}")
+            yield _sse("router", turn.router_event())
+
+            await run_in_threadpool(chat_pipeline.retrieve, turn)
+            yield _sse("retrieval", turn.retrieval_event())
+
+            chat_pipeline.build_context(turn)
+        except Exception as e:
+            logger.error(f"Stream chat error: {e}")
+            yield _sse("token", {'token': 'I apologize, but I encountered a temporary issue. Please try again.'})
+            yield _sse("done", {'done': True, 'retrieved_projects': [], 'mode': 'concierge'})
+            return
+
+        # 4. Stream tokens — natively async; relay() adds backpressure, heartbeats and
+        # cancels the upstream completion as soon as the client goes away
+        async for event, data in chat_pipeline.astream(turn):
+            yield _sse(event, data)
         
-        current_date = datetime.now().strftime("%B %d, %Y")
-        full_system_msg = CONCIERGE_SYSTEM_PROMPT.format(current_date=current_date) + f"\n\nCONTEXT:\n{context_text}"
-
-        # 4. Stream tokens
-        def generate():
-            full_response = ""
-            for chunk in llm_service.stream_answer_completion(
-                full_system_msg, request.messages, tools=TOOLS
+        done = {'done': True, 'retrieved_projects': turn.retrieved_projects, 'mode': turn.mode}
+        if debug:
+            done['timings'] = turn.timer.timings
+        yield _sse("done", done)
+
+    async def generate():
+        SSE_STREAMS.inc(stream="chat")
+        try:
+            async for frame in relay(
+                http_request, frames(),
+                heartbeat_seconds=Config.CHAT_STREAM_HEARTBEAT_SECONDS,
+                queue_size=Config.CHAT_STREAM_QUEUE_SIZE
             ):
-                if "__TOOL_CALLS__" in chunk:
-                    tc_json = chunk.split("__TOOL_CALLS__")[1]
-                    tool_calls = json.loads(tc_json)
-                    for tc in tool_calls:
-                        if tc["function"]["name"] == "save_lead":
-                            args = json.loads(tc["function"]["arguments"])
-                            lead = Lead(
-                                session_id=session_id,
-                                name=args.get('name'),
-                                phone=args.get('phone'),
-                                interest_projects=args.get('interest_projects', '').split(',') if args.get('interest_projects') else [],
-                                preferred_region=args.get('preferred_region'),
-                                unit_type=args.get('unit_type'),
-                                budget_min=args.get('budget_min'),
-                                budget_max=args.get('budget_max'),
-                                purpose=args.get('purpose'),
-                                timeline=args.get('timeline'),
-                                next_step=args.get('next_step'),
-                                lead_summary=args.get('lead_summary'),
-                                tags=args.get('tags', '').split(',') if args.get('tags') else [],
-                                kb_version_hash=args.get('kb_version_hash', 'v1.0')
-                            )
-                            leads_service.save_lead(lead)
-                            confirm_msg = f"Thank you {lead.name}. Your details have been saved. A sales representative will contact you at {lead.phone} shortly."
-                            yield f"data: {json.dumps({'token': confirm_msg})}\n\n"
-                else:
-                    full_response += chunk
-                    yield f"data: {json.dumps({'token': chunk})}\n\n"
-            
-            yield f"data: {json.dumps({'done': True, 'retrieved_projects': [p.project_name for p in retrieved_docs], 'mode': 'lead_capture' if router_out.intent == 'lead_capture' else 'concierge'})}\n\n"
-            
-            leads_service.log_audit(
-                session_id, user_msg, router_out.intent,
-                [p.project_id for p in retrieved_docs], []
-            )
-
-        return StreamingResponse(
-            generate(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
-        )
-    except Exception as e:
-        logger.error(f"Stream chat error: {e}")
-        return StreamingResponse(
-            iter([f"data: {json.dumps({'token': 'I apologize, but I encountered a temporary issue. Please try again.', 'done': True})}\n\n"]),
-            media_type="text/event-stream"
+                yield frame
+        finally:
+            SSE_STREAMS.dec(stream="chat")
+
+    # Headers go out before any stage runs; with debug on, timings ride the done event
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.post("/api/search/batch", response_model=BatchSearchResponse)
+def batch_search_endpoint(request: BatchSearchRequest):
+    # Plain def: FastAPI runs it in the threadpool, so a large batch never blocks chat streams
+    batch = rag_service.search_batch([(q.query, q.k, q.filters) for q in request.queries])
+    return BatchSearchResponse(results=[
+        SearchResult(
+            query=q.query,
+            results=[
+                SearchHit(
+                    project_id=r['project'].project_id,
+                    project_name=r['project'].project_name,
+                    score=r['score'],
+                    source=r['source'],
+                    matched_chunks=[c['label'] for c in r.get('chunks', [])]
+                )
+                for r in results
+            ]
         )
+        for q, results in zip(request.queries, batch)
+    ])
 
 @app.post("/api/lead")
 async def create_lead(lead: Lead):
+    await _session(lead.session_id)
     success = leads_service.save_lead(lead)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to save lead")
@@ -366,3 +318,7 @@ async def export_leads(password: str = Header(None, alias="x-admin-password")):
 @app.get("/health")
 async def health():
     return {"status": "ok", "rag_ready": rag_service.is_ready}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
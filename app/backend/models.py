@@ -1,5 +1,5 @@
 from typing import List, Optional, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 # --- KB Models ---
 class Project(BaseModel):
@@ -35,15 +35,61 @@ class Message(BaseModel):
     
 class ChatRequest(BaseModel):
     session_id: str
-    messages: List[Message]
+    message: Optional[str] = None # New user turn; history lives in the server-side session store
+    messages: List[Message] = [] # Legacy: full history resent by the client (replaces the stored one)
     locale: str = "en"
 
+    @model_validator(mode="after")
+    def _require_turn(self):
+        if not self.message and not self.messages:
+            raise ValueError("Either 'message' or 'messages' is required")
+        return self
+
 class ChatResponse(BaseModel):
     message: str
     next_action: Optional[str] = None
     retrieved_projects: List[str] = []
     mode: str = "concierge" # concierge | lead_capture
 
+# --- Prompt Models ---
+class PromptSegments(BaseModel):
+    """Answer prompt split by volatility, most stable first, so provider prefix caching can hit."""
+    static: str # Persona + rules: byte-identical across requests
+    daily: str # Date-dependent rules, rendered once per day
+    context: str = "" # Retrieved project context for this turn
+
+# --- Session Models ---
+class SessionState(BaseModel):
+    session_id: str
+    history: List[Message] = []
+    last_router: Optional[RouterOutput] = None
+    retrieved_project_ids: List[str] = []
+    trimmed: int = 0  # Messages dropped from the front of history so far: history[0]'s absolute index
+    updated_at: float = 0.0
+
+# --- Search Models ---
+class SearchQuery(BaseModel):
+    query: str
+    k: int = Field(3, ge=1, le=20)
+    filters: dict = Field(default_factory=dict, description="project_type, project_status, region")
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchQuery] = Field(..., min_length=1, max_length=256)
+
+class SearchHit(BaseModel):
+    project_id: str
+    project_name: str
+    score: float
+    source: str
+    matched_chunks: List[str] = [] # Labels of the best-matching zones/listings/FAQs
+
+class SearchResult(BaseModel):
+    query: str
+    results: List[SearchHit] = []
+
+class BatchSearchResponse(BaseModel):
+    results: List[SearchResult]
+
 # --- Lead Models ---
 class Lead(BaseModel):
     name: str
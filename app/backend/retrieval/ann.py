@@ -0,0 +1,118 @@
+"""
+FAISS index factory for PalmX.
+flat_l2 (legacy), flat_ip, hnsw and ivf_flat — the last three over L2-normalised
+vectors with inner-product metric, so scores are cosine similarities directly.
+Any type can store its vectors quantized (fp16 / int8 scalar or product quantization);
+exact scores are then recovered by re-ranking candidates against the raw vectors on disk.
+"""
+import math
+from typing import Any, Dict
+
+import faiss
+import numpy as np
+
+from app.backend.config import Config
+
+INDEX_TYPES = ("flat_l2", "flat_ip", "hnsw", "ivf_flat")
+QUANTIZATIONS = ("none", "fp16", "int8", "pq")
+
+
+def metric_for(index_type: str) -> str:
+    return "l2" if index_type == "flat_l2" else "ip"
+
+
+def prepare_vectors(vectors: np.ndarray, index_type: str) -> np.ndarray:
+    """float32, C-contiguous and, for inner-product indexes, unit length."""
+    x = np.ascontiguousarray(vectors, dtype=np.float32)
+    if metric_for(index_type) == "ip":
+        x = x.copy()
+        faiss.normalize_L2(x)
+    return x
+
+
+def ivf_nlist(n: int) -> int:
+    """Config value, or ~4·sqrt(n) capped so every list gets >= 39 training points."""
+    if Config.FAISS_IVF_NLIST > 0:
+        return max(1, min(Config.FAISS_IVF_NLIST, n))
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_code(dim: int, n: int) -> str:
+    """PQ{m}x{nbits}: m = largest divisor of dim <= FAISS_PQ_M; nbits shrinks for tiny corpora."""
+    m = max(d for d in range(1, min(Config.FAISS_PQ_M, dim) + 1) if dim % d == 0)
+    nbits = min(8, max(1, int(math.log2(max(n, 2))) - 1))
+    return f"PQ{m}x{nbits}"
+
+
+def factory_string(index_type: str, quantization: str, dim: int, n: int) -> str:
+    storage = {
+        "none": "Flat",
+        "fp16": "SQfp16",
+        "int8": "SQ8",
+        "pq": _pq_code(dim, n),
+    }[quantization]
+    if index_type in ("flat_l2", "flat_ip"):
+        return storage
+    if index_type == "hnsw":
+        return f"HNSW{Config.FAISS_HNSW_M}" + ("" if quantization == "none" else f"_{storage}")
+    return f"IVF{ivf_nlist(n)},{storage}"
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str = None, quantization: str = None) -> faiss.Index:
+    index_type = index_type or Config.FAISS_INDEX_TYPE
+    quantization = quantization or Config.FAISS_QUANTIZATION
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}' (expected one of {INDEX_TYPES})")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown FAISS quantization '{quantization}' (expected one of {QUANTIZATIONS})")
+
+    x = prepare_vectors(vectors, index_type)
+    metric = faiss.METRIC_L2 if metric_for(index_type) == "l2" else faiss.METRIC_INNER_PRODUCT
+    index = faiss.index_factory(x.shape[1], factory_string(index_type, quantization, x.shape[1], len(x)), metric)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = Config.FAISS_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(x)
+
+    index.add(x)
+    configure_search(index)
+    return index
+
+
+def index_metric(index: faiss.Index) -> str:
+    """Metric the index actually reports (HNSW+PQ falls back to L2 even on an IP request)."""
+    return "ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def rerank(q: np.ndarray, ids: np.ndarray, raw_vectors: np.ndarray) -> np.ndarray:
+    """
+    Exact cosine similarity of one query against candidate rows of the raw vectors.
+    raw_vectors is typically np.load(..., mmap_mode="r"), so only candidate rows are read.
+    """
+    cand = np.asarray(raw_vectors[ids], dtype=np.float32)
+    cand /= np.maximum(np.linalg.norm(cand, axis=1, keepdims=True), 1e-12)
+    qn = q.reshape(-1) / max(float(np.linalg.norm(q)), 1e-12)
+    return np.clip(cand @ qn, 0.0, 1.0)
+
+
+def configure_search(index: faiss.Index, params: Dict[str, Any] = None):
+    """Apply query-time knobs (nprobe / efSearch); neither survives write_index/read_index."""
+    params = params or {}
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(params.get("nprobe", Config.FAISS_IVF_NPROBE), index.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params.get("ef_search", Config.FAISS_HNSW_EF_SEARCH)
+
+
+def to_similarity(D: np.ndarray, metric: str) -> np.ndarray:
+    """
+    Search distances → cosine similarity in [0, 1]. Inner-product indexes already return
+    cosine; IndexFlatL2 returns squared L2 over unit vectors, so cosine = 1 - d/2.
+    """
+    sims = D if metric == "ip" else 1.0 - D / 2.0
+    return np.clip(sims, 0.0, 1.0)
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    """Serialized size — a close proxy for the index's resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,154 @@
+"""
+ANN recall/latency/memory benchmark for the PalmX retrieval index.
+
+    python -m app.backend.retrieval.benchmark --scale 1,10000,100000 --k 10
+
+Corpus: the stored index vectors (runtime/index/vectors.npy) or, if absent, KB chunks
+embedded with the local backend — no API calls either way. Each --scale > 1 is a
+synthetic corpus of that many rows made by jittering real vectors. Recall@k is
+measured against exact Flat-IP search on the same corpus.
+
+--quant sweeps vector storage (none, fp16, int8, pq); quantized runs are reported
+both raw and re-ranked exactly from the full-precision vectors (--rerank factor),
+so the memory-versus-recall trade-off is visible side by side.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+from app.backend.config import Config
+from app.backend.retrieval.ann import build_ann_index, configure_search, index_nbytes, prepare_vectors, rerank
+
+
+def load_real_vectors() -> np.ndarray:
+    if os.path.exists(Config.VECTORS_PATH):
+        return np.load(Config.VECTORS_PATH)
+
+    from app.backend.retrieval.embeddings import HashedSVDEmbedder
+    from app.backend.services.kb_service import kb_service
+
+    texts = [f"{p.project_name} — {c['label']}\n{c['body']}"
+             for p in kb_service.projects.values() for c in kb_service.build_chunks(p)]
+    embedder = HashedSVDEmbedder(dim=Config.LOCAL_EMBED_DIM).fit(texts)
+    return np.array(embedder.embed_many(texts), dtype=np.float32)
+
+
+def jitter(base: np.ndarray, n: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    """n unit vectors scattered around randomly chosen rows of `base`."""
+    rows = base[rng.integers(0, len(base), size=n)]
+    out = rows + rng.normal(scale=noise / np.sqrt(base.shape[1]), size=rows.shape)
+    return prepare_vectors(out, "flat_ip")
+
+
+def _sweep(index_type: str, args) -> List[Dict[str, Any]]:
+    if index_type == "hnsw":
+        return [{"ef_search": v} for v in args.ef_search]
+    if index_type == "ivf_flat":
+        return [{"nprobe": v} for v in args.nprobe]
+    return [{}]
+
+
+def run(args) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(args.seed)
+    real = prepare_vectors(load_real_vectors(), "flat_ip")
+    report = []
+
+    for scale in args.scale:
+        corpus = real if scale <= 1 else jitter(real, scale, args.noise, rng)
+        queries = jitter(real, args.queries, args.noise, rng)
+        label = f"real ({len(corpus)})" if scale <= 1 else f"synthetic ({scale})"
+
+        exact = faiss.IndexFlatIP(corpus.shape[1])
+        exact.add(corpus)
+        k = min(args.k, len(corpus))
+        _, truth = exact.search(queries, k)
+
+        for index_type in args.types:
+            for quant in args.quant:
+                t0 = time.perf_counter()
+                index = build_ann_index(corpus, index_type, quant)
+                build_s = time.perf_counter() - t0
+                memory_mb = round(index_nbytes(index) / 2**20, 3)
+
+                rerank_factors = [0] if quant == "none" or not args.rerank else [0, args.rerank]
+                for params in _sweep(index_type, args):
+                    configure_search(index, params)
+                    for factor in rerank_factors:
+                        fetch = min(len(corpus), k * factor) if factor else k
+                        latencies = np.empty(len(queries))
+                        found = np.full((len(queries), k), -1, dtype=np.int64)  # -1 never matches the truth
+                        for i in range(len(queries)):
+                            t = time.perf_counter()
+                            _, I = index.search(queries[i:i + 1], fetch)
+                            ids = I[0]
+                            if factor:
+                                ids = ids[ids >= 0]
+                                ids = ids[np.argsort(-rerank(queries[i], ids, corpus))][:k]
+                            latencies[i] = time.perf_counter() - t
+                            found[i, :len(ids[:k])] = ids[:k]
+
+                        hits = sum(len(set(f) & set(g)) for f, g in zip(found, truth))
+                        report.append({
+                            "corpus": label,
+                            "index": index_type,
+                            "quant": quant,
+                            "rerank": f"x{factor}" if factor else "-",
+                            "params": params,
+                            f"recall@{k}": round(hits / (k * len(queries)), 4),
+                            "p50_ms": round(float(np.percentile(latencies, 50)) * 1e3, 4),
+                            "p99_ms": round(float(np.percentile(latencies, 99)) * 1e3, 4),
+                            "memory_mb": memory_mb,
+                            "build_s": round(build_s, 3),
+                        })
+    return report
+
+
+def print_table(report: List[Dict[str, Any]]):
+    if not report:
+        return
+    recall_key = next(k for k in report[0] if k.startswith("recall@"))
+    header = f"{'corpus':<22}{'index':<10}{'quant':<7}{'rerank':<8}{'params':<18}{recall_key:>10}{'p50 ms':>10}{'p99 ms':>10}{'mem MB':>10}{'build s':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in report:
+        params = ",".join(f"{k}={v}" for k, v in r["params"].items()) or "-"
+        print(f"{r['corpus']:<22}{r['index']:<10}{r['quant']:<7}{r['rerank']:<8}{params:<18}{r[recall_key]:>10.4f}"
+              f"{r['p50_ms']:>10.4f}{r['p99_ms']:>10.4f}{r['memory_mb']:>10.3f}{r['build_s']:>9.3f}")
+
+
+def _ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types for PalmX retrieval.")
+    parser.add_argument("--scale", type=_ints, default=[1, 10000, 100000],
+                        help="Corpus sizes; 1 = the real corpus as-is (default: 1,10000,100000)")
+    parser.add_argument("--types", type=lambda s: s.split(","), default=["flat_ip", "hnsw", "ivf_flat"])
+    parser.add_argument("--quant", type=lambda s: s.split(","), default=["none"],
+                        help="Vector storage to compare, e.g. none,fp16,int8,pq")
+    parser.add_argument("--rerank", type=int, default=Config.FAISS_RERANK_FACTOR,
+                        help="Candidate multiplier for exact re-ranking of quantized runs (0 = off)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--ef-search", type=_ints, default=[16, 64, 128])
+    parser.add_argument("--nprobe", type=_ints, default=[1, 8, 32])
+    parser.add_argument("--noise", type=float, default=0.5, help="Jitter applied to synthetic rows and queries")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print the raw report as JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
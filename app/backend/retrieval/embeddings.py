@@ -0,0 +1,125 @@
+"""
+Fully local, CPU-only embedding backend for PalmX.
+Hashed word n-gram TF-IDF projected through a truncated SVD fitted on
+the KB (classic LSA). Needs no network, so retrieval keeps working — with flat,
+predictable latency — while the embedding provider is unreachable.
+"""
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+from app.backend.retrieval.lexical import tokenize
+
+
+def _hashed_features(text: str, n_buckets: int) -> Dict[int, float]:
+    """
+    Term counts over word unigrams and bigrams, hashed with a stable CRC32.
+    Word-level grams only: character grams let any chit-chat project onto some
+    project's direction once the query vector is renormalised.
+    """
+    words = tokenize(text)
+    grams = list(words)
+    grams.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+
+    counts: Dict[int, float] = {}
+    for g in grams:
+        bucket = zlib.crc32(g.encode("utf-8")) % n_buckets
+        counts[bucket] = counts.get(bucket, 0.0) + 1.0
+    return counts
+
+
+def _top_right_singular_vectors(X: np.ndarray, k: int, oversample: int = 10, n_iter: int = 4) -> np.ndarray:
+    """
+    Leading k right singular vectors of X (k × n_features), by randomized range finding
+    (Halko et al.): only a (k + oversample)-wide sketch of X is ever decomposed, instead of
+    a full SVD over every hashed bucket. Seeded, so refits on the same KB agree.
+    """
+    width = k + oversample
+    if width >= min(X.shape):
+        return np.linalg.svd(X, full_matrices=False)[2][:k]  # Small enough that exact is no dearer
+    rng = np.random.default_rng(0)
+    Q = np.linalg.qr(X @ rng.standard_normal((X.shape[1], width)))[0]
+    for _ in range(n_iter):
+        # Power iterations sharpen the spectrum; re-orthonormalise each pass for stability
+        Q = np.linalg.qr(X.T @ Q)[0]
+        Q = np.linalg.qr(X @ Q)[0]
+    _, _, Vt = np.linalg.svd(Q.T @ X, full_matrices=False)
+    return Vt[:k]
+
+
+class HashedSVDEmbedder:
+    name = "local-hash-svd"
+
+    def __init__(self, dim: int = 256, n_buckets: int = 1 << 20):
+        self.dim = dim
+        self.n_buckets = n_buckets
+        self.buckets = np.empty(0, dtype=np.int64)      # sorted hash buckets seen while fitting
+        self.idf = np.empty(0, dtype=np.float32)        # per bucket
+        self.components = np.empty((0, 0), dtype=np.float32)  # buckets × dim
+
+    def fit(self, texts: List[str]) -> "HashedSVDEmbedder":
+        rows = [_hashed_features(t, self.n_buckets) for t in texts]
+        self.buckets = np.array(sorted({b for r in rows for b in r}), dtype=np.int64)
+
+        X = np.zeros((len(rows), len(self.buckets)), dtype=np.float64)
+        for i, r in enumerate(rows):
+            cols = np.searchsorted(self.buckets, np.fromiter(r.keys(), dtype=np.int64))
+            X[i, cols] = np.fromiter(r.values(), dtype=np.float64)
+
+        df = np.count_nonzero(X, axis=0)
+        self.idf = (np.log((1.0 + len(rows)) / (1.0 + df)) + 1.0).astype(np.float32)
+        X = self._tfidf(X)
+
+        Vt = _top_right_singular_vectors(X, self.dim)
+        # Deterministic sign per component so refits on the same KB give the same space
+        signs = np.sign(Vt[np.arange(len(Vt)), np.abs(Vt).argmax(axis=1)])
+        signs[signs == 0] = 1.0
+        self.components = (Vt * signs[:, None]).T.astype(np.float32)
+        return self
+
+    def _tfidf(self, X: np.ndarray) -> np.ndarray:
+        X = np.log1p(X) * self.idf
+        norms = np.linalg.norm(X, axis=-1, keepdims=True)
+        return X / np.where(norms == 0, 1.0, norms)
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        out = np.zeros((len(texts), self.components.shape[1]), dtype=np.float32)
+        for i, text in enumerate(texts):
+            feats = _hashed_features(text, self.n_buckets)
+            keys = np.fromiter(feats.keys(), dtype=np.int64, count=len(feats))
+            pos = np.searchsorted(self.buckets, keys)
+            pos = np.minimum(pos, len(self.buckets) - 1)
+            known = self.buckets[pos] == keys
+            if not known.any():
+                continue
+            tf = np.fromiter(feats.values(), dtype=np.float32, count=len(feats))[known]
+            cols = pos[known]
+            # Same log-TF × IDF, L2-normalised weighting as the fitted documents
+            w = np.log1p(tf) * self.idf[cols]
+            w /= np.linalg.norm(w) or 1.0
+            out[i] = w @ self.components[cols]
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return (out / np.where(norms == 0, 1.0, norms)).tolist()
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            dim=self.dim,
+            n_buckets=self.n_buckets,
+            buckets=self.buckets,
+            idf=self.idf,
+            components=self.components,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "HashedSVDEmbedder":
+        data = np.load(path)
+        emb = cls(dim=int(data["dim"]), n_buckets=int(data["n_buckets"]))
+        emb.buckets = data["buckets"]
+        emb.idf = data["idf"]
+        emb.components = data["components"]
+        return emb
@@ -0,0 +1,85 @@
+"""
+In-memory BM25 retriever for PalmX.
+Sparse inverted index over project text — no network, no embeddings — so it keeps
+answering amenity/zone/FAQ questions when the embedding provider is unreachable.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset("""
+a an and any are as at be by can do does for from have how i in is it me my of on or
+please show tell than that the their there these this to want what which with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords dropped and a light plural strip."""
+    tokens = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        if tok in _STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lens: List[int] = []
+        self.avg_len = 0.0
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.idf: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def build(self, documents: Dict[str, str]):
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_ids = []
+        self.doc_lens = []
+        for doc_idx, (doc_id, text) in enumerate(documents.items()):
+            terms = Counter(tokenize(text))
+            for term, tf in terms.items():
+                postings[term].append((doc_idx, tf))
+            self.doc_ids.append(doc_id)
+            self.doc_lens.append(sum(terms.values()))
+
+        n = len(self.doc_ids)
+        self.avg_len = (sum(self.doc_lens) / n) if n else 0.0
+        self.postings = dict(postings)
+        self.idf = {t: self._idf(len(p)) for t, p in self.postings.items()}
+
+    def _idf(self, df: int) -> float:
+        n = len(self.doc_ids)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Returns [(doc_id, score)] best first. Scores are normalised by the score of a
+        document holding every query term once at average length, so they sit in
+        [0, 1] and query words unknown to the KB (chit-chat) pull the score down.
+        """
+        terms = tokenize(query)
+        if not terms or not self.doc_ids:
+            return []
+
+        unseen_idf = self._idf(0)
+        scores: Dict[int, float] = defaultdict(float)
+        norm = 0.0
+        for term in terms:
+            idf = self.idf.get(term, unseen_idf)
+            norm += idf
+            for doc_idx, tf in self.postings.get(term, ()):
+                length_norm = 1.0 - self.b + self.b * self.doc_lens[doc_idx] / self.avg_len
+                scores[doc_idx] += idf * tf * (self.k1 + 1.0) / (tf + self.k1 * length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[i], round(min(1.0, s / norm), 4)) for i, s in ranked]
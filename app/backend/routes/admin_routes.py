@@ -9,16 +9,24 @@ import csv
 import json
 import logging
 import hashlib
+import time
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 from typing import Optional, Any
 from collections import Counter, defaultdict
+from functools import lru_cache
 
-from fastapi import APIRouter, Query, HTTPException, Response
+from fastapi import APIRouter, Query, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse, FileResponse
+import numpy as np
 import pandas as pd
 
+from app.backend.config import Config
 from app.backend.runtime_resolver import get_runtime_dir, get_leads_dir
+from app.backend.services.events_service import event_broker
+from app.backend.services.leads_service import LeadsService
+from app.backend.services.metrics_service import CACHE_REQUESTS, SSE_STREAMS
 
 logger = logging.getLogger("PalmX-Admin")
 router = APIRouter(prefix="/admin", tags=["Admin"])
@@ -29,6 +37,21 @@ router = APIRouter(prefix="/admin", tags=["Admin"])
 _df_cache: dict[tuple[str, float], pd.DataFrame] = {}
 
 
+def _read_widened_csv(filepath: Path) -> pd.DataFrame:
+    """
+    A CSV whose newer rows carry trailing fields its header predates — audit.csv files
+    created before stage_timings_ms keep their old header. Columns are named from
+    AUDIT_HEADERS when the header is a prefix of it, column_N otherwise.
+    """
+    with open(filepath, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        width = max([len(header)] + [len(row) for row in reader])
+    known = LeadsService.AUDIT_HEADERS if header == LeadsService.AUDIT_HEADERS[:len(header)] else header
+    names = (list(known) + [f"column_{i}" for i in range(len(known), width)])[:width]
+    return pd.read_csv(filepath, dtype=str, keep_default_na=False, header=None, skiprows=1, names=names)
+
+
 def _read_sheet(filepath: Path) -> pd.DataFrame:
     """Read a csv/xlsx file with mtime-keyed caching."""
     mtime = filepath.stat().st_mtime
@@ -37,7 +60,10 @@ def _read_sheet(filepath: Path) -> pd.DataFrame:
         return _df_cache[cache_key]
 
     if filepath.suffix.lower() == ".csv":
-        df = pd.read_csv(filepath, dtype=str, keep_default_na=False)
+        try:
+            df = pd.read_csv(filepath, dtype=str, keep_default_na=False)
+        except pd.errors.ParserError:
+            df = _read_widened_csv(filepath)
     elif filepath.suffix.lower() == ".xlsx":
         df = pd.read_excel(filepath, dtype=str, keep_default_na=False)
     else:
@@ -63,6 +89,54 @@ def _resolve_sheet(sheet: str) -> Path:
     return full_path
 
 
+def _conditional_get(
+    request: Request,
+    response: Response,
+    filepath: Path,
+    *params: Any,
+    volatile: bool = False,
+) -> Optional[Response]:
+    """
+    Stamp ETag/Last-Modified validators derived from (sheet, size, mtime, params).
+    Returns a ready 304 response when the client's copy is still current, so the
+    caller can bail out before any parsing or aggregation happens.
+    `volatile` views depend on more than the file, so only their ETag is trusted; when the
+    client sends an ETag it alone decides.
+    """
+    stat = filepath.stat()
+    digest = hashlib.sha1(
+        f"{filepath.name}|{stat.st_size}|{stat.st_mtime_ns}|{params!r}".encode("utf-8")
+    ).hexdigest()[:20]
+    validators = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "no-cache, must-revalidate",
+    }
+    # Last-Modified has 1s resolution: a file written within the current second may change
+    # again in that same second, so it only gets the (exact) ETag until the second is over
+    if time.time() - stat.st_mtime >= 1.0:
+        validators["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        if "*" in tags or validators["ETag"] in tags:
+            CACHE_REQUESTS.inc(cache="admin_conditional_get", result="hit")
+            return Response(status_code=304, headers=validators)
+    elif not volatile:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                    CACHE_REQUESTS.inc(cache="admin_conditional_get", result="hit")
+                    return Response(status_code=304, headers=validators)
+            except (TypeError, ValueError):
+                pass
+
+    CACHE_REQUESTS.inc(cache="admin_conditional_get", result="miss")
+    response.headers.update(validators)
+    return None
+
+
 # ---------------------------------------------------------------------------
 # 0) Health / Debug
 # ---------------------------------------------------------------------------
@@ -202,20 +276,50 @@ _COL_MAP = {
 }
 
 
+_AUDIT_COL_MAP = {
+    "projects": ["retrieved_projects", "projects", "retrieved"],
+    "scores": ["similarity_scores", "scores", "score"],
+    "intent": ["router_intent", "intent", "action"],
+    "timestamp": ["timestamp", "time", "created_at"],
+}
+
+_SCHEMAS = {"leads": _COL_MAP, "audit": _AUDIT_COL_MAP}
+
+
+def _normalize_col(s: str) -> str:
+    """Normalize: lower, strip whitespace, strip BOM, strip quotes."""
+    return s.lower().strip().replace('\ufeff', '').strip('"').strip("'")
+
+
+@lru_cache(maxsize=256)
+def _column_lookup(columns: tuple[str, ...]) -> dict[str, str]:
+    return {_normalize_col(c): c for c in columns}
+
+
 def _find_col(df_cols: list[str], candidates: list[str]) -> Optional[str]:
     """Find the first matching column from candidates list."""
-    # Normalize: lower, strip whitespace, strip BOM, strip quotes
-    def normalize(s):
-        return s.lower().strip().replace('\ufeff', '').strip('"').strip("'")
-
-    lower_map = {normalize(c): c for c in df_cols}
+    lower_map = _column_lookup(tuple(df_cols))
     for cand in candidates:
-        n_cand = normalize(cand)
+        n_cand = _normalize_col(cand)
         if n_cand in lower_map:
             return lower_map[n_cand]
     return None
 
 
+@lru_cache(maxsize=256)
+def _schema_for(columns: tuple[str, ...], schema: str) -> dict[str, Optional[str]]:
+    """Map a header signature to canonical fields once; memoized per header tuple."""
+    return {field: _find_col(list(columns), candidates) for field, candidates in _SCHEMAS[schema].items()}
+
+
+def _resolve_schema(df: pd.DataFrame, schema: str = "leads") -> dict[str, Optional[str]]:
+    """
+    Canonical field → actual column name for a sheet (None when absent).
+    Shared by every view over the sheet; the returned mapping must be treated as read-only.
+    """
+    return _schema_for(tuple(df.columns), schema)
+
+
 def _parse_list(val: Any) -> list[str]:
     """Parse a comma-separated or JSON string into a list."""
     if not val or pd.isna(val) if isinstance(val, float) else not val:
@@ -248,10 +352,12 @@ def _parse_num(val: Any) -> Optional[float]:
 
 
 @router.get("/leads")
-async def get_leads(response: Response, sheet: str = Query("leads.csv")):
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+async def get_leads(request: Request, response: Response, sheet: str = Query("leads.csv")):
     try:
         filepath = _resolve_sheet(sheet)
+        not_modified = _conditional_get(request, response, filepath, "leads")
+        if not_modified is not None:
+            return not_modified
         logger.info(f"Reading leads from: {filepath}")
         
         df = _read_sheet(filepath)
@@ -259,19 +365,20 @@ async def get_leads(response: Response, sheet: str = Query("leads.csv")):
         logger.info(f"Columns found in {sheet}: {cols}")
 
         # Map columns
-        col_ts = _find_col(cols, _COL_MAP["timestamp"])
-        col_name = _find_col(cols, _COL_MAP["name"])
-        col_contact = _find_col(cols, _COL_MAP["contact"])
-        col_summary = _find_col(cols, _COL_MAP["summary"])
-        col_projects = _find_col(cols, _COL_MAP["projects"])
-        col_primary = _find_col(cols, _COL_MAP["project_primary"])
-        col_region = _find_col(cols, _COL_MAP["region"])
-        col_unit = _find_col(cols, _COL_MAP["unit_type"])
-        col_purpose = _find_col(cols, _COL_MAP["purpose"])
-        col_bmin = _find_col(cols, _COL_MAP["budget_min"])
-        col_bmax = _find_col(cols, _COL_MAP["budget_max"])
-        col_timeline = _find_col(cols, _COL_MAP["timeline"])
-        col_tags = _find_col(cols, _COL_MAP["tags"])
+        schema = _resolve_schema(df)
+        col_ts = schema["timestamp"]
+        col_name = schema["name"]
+        col_contact = schema["contact"]
+        col_summary = schema["summary"]
+        col_projects = schema["projects"]
+        col_primary = schema["project_primary"]
+        col_region = schema["region"]
+        col_unit = schema["unit_type"]
+        col_purpose = schema["purpose"]
+        col_bmin = schema["budget_min"]
+        col_bmax = schema["budget_max"]
+        col_timeline = schema["timeline"]
+        col_tags = schema["tags"]
 
         logger.info(f"Mapping results for {sheet}: Contact='{col_contact}', Projects='{col_projects}', Summary='{col_summary}'")
 
@@ -308,15 +415,24 @@ async def get_leads(response: Response, sheet: str = Query("leads.csv")):
 # ---------------------------------------------------------------------------
 @router.get("/analytics")
 async def get_analytics(
+    request: Request,
+    response: Response,
     sheet: str = Query("leads.csv"),
     range: str = Query("all", alias="range"),
 ):
     filepath = _resolve_sheet(sheet)
+    # Range windows and the 24h KPI move with the clock, so the validator rolls every minute
+    not_modified = _conditional_get(
+        request, response, filepath, "analytics", range, datetime.now().strftime("%Y%m%d%H%M"),
+        volatile=True,
+    )
+    if not_modified is not None:
+        return not_modified
     df = _read_sheet(filepath)
-    cols = list(df.columns)
+    schema = _resolve_schema(df)
 
     # Parse timestamps
-    col_ts = _find_col(cols, _COL_MAP["timestamp"])
+    col_ts = schema["timestamp"]
     timestamps = []
     if col_ts:
         for v in df[col_ts]:
@@ -340,16 +456,11 @@ async def get_analytics(
     filtered_ts = [t for t, m in zip(timestamps, mask) if m]
 
     # Column mappings on filtered data
-    col_name = _find_col(cols, _COL_MAP["name"])
-    col_contact = _find_col(cols, _COL_MAP["contact"])
-    col_projects = _find_col(cols, _COL_MAP["projects"])
-    col_region = _find_col(cols, _COL_MAP["region"])
-    col_unit = _find_col(cols, _COL_MAP["unit_type"])
-    col_purpose = _find_col(cols, _COL_MAP["purpose"])
-    col_timeline = _find_col(cols, _COL_MAP["timeline"])
-    col_tags = _find_col(cols, _COL_MAP["tags"])
-    col_bmin = _find_col(cols, _COL_MAP["budget_min"])
-    col_bmax = _find_col(cols, _COL_MAP["budget_max"])
+    col_contact = schema["contact"]
+    col_projects = schema["projects"]
+    col_region = schema["region"]
+    col_bmin = schema["budget_min"]
+    col_bmax = schema["budget_max"]
 
     # KPIs
     total = len(filtered)
@@ -412,7 +523,7 @@ async def get_analytics(
 
     # Breakdowns helper
     def _breakdown(col_name_key: str, max_items: int = 8) -> list[dict]:
-        col = _find_col(cols, _COL_MAP.get(col_name_key, []))
+        col = schema.get(col_name_key)
         if not col:
             return []
         if col_name_key in ("projects", "tags"):
@@ -449,55 +560,56 @@ async def get_analytics(
 # 6) GET /admin/audit — audit sheet metrics
 # ---------------------------------------------------------------------------
 @router.get("/audit")
-async def get_audit():
+async def get_audit(request: Request, response: Response):
     leads_dir = get_leads_dir()
     # Look for audit.csv
     audit_path = leads_dir / "audit.csv"
     if not audit_path.is_file():
         return {"available": False, "message": "No audit dataset found. Place audit.csv in runtime/leads/ to enable."}
 
+    not_modified = _conditional_get(request, response, audit_path, "audit")
+    if not_modified is not None:
+        return not_modified
+
     try:
         df = _read_sheet(audit_path)
     except Exception as e:
         return {"available": False, "message": f"Error reading audit file: {e}"}
 
-    cols = list(df.columns)
+    schema = _resolve_schema(df, "audit")
 
     # Top retrieved projects
-    proj_col = _find_col(cols, ["retrieved_projects", "projects", "retrieved"])
+    proj_col = schema["projects"]
     project_freq: Counter = Counter()
     if proj_col:
         for val in df[proj_col]:
             for p in _parse_list(val):
                 project_freq[p] += 1
 
-    # Similarity scores
-    score_col = _find_col(cols, ["similarity_scores", "scores", "score"])
-    scores = []
+    # Similarity scores — flatten the per-row JSON lists in one vectorized pass
+    score_col = schema["scores"]
+    scores = np.empty(0)
     if score_col:
-        for val in df[score_col]:
-            for s in _parse_list(val):
-                n = _parse_num(s)
-                if n is not None:
-                    scores.append(n)
+        flat = df[score_col].str.strip("[] ").str.split(",").explode()
+        scores = pd.to_numeric(flat, errors="coerce").dropna().to_numpy(dtype=float)
 
-    # Histogram (10 bins 0-1)
+    # Histogram (10 bins 0-1; a perfect 1.0 lands in the last bin)
     score_histogram = []
-    if scores:
-        bins = [i / 10 for i in range(11)]
-        for i in range(10):
-            lo, hi = bins[i], bins[i + 1]
-            count = sum(1 for s in scores if lo <= s < hi)
-            score_histogram.append({"range": f"{lo:.1f}-{hi:.1f}", "count": count})
+    if scores.size:
+        counts, edges = np.histogram(scores, bins=10, range=(0.0, 1.0))
+        score_histogram = [
+            {"range": f"{lo:.1f}-{hi:.1f}", "count": int(c)}
+            for lo, hi, c in zip(edges[:-1], edges[1:], counts)
+        ]
 
     # Intent distribution
-    intent_col = _find_col(cols, ["router_intent", "intent", "action"])
+    intent_col = schema["intent"]
     intent_dist: Counter = Counter()
     if intent_col:
         intent_dist = Counter(v for v in df[intent_col] if v)
 
     # Query volume over time
-    ts_col = _find_col(cols, ["timestamp", "time", "created_at"])
+    ts_col = schema["timestamp"]
     query_volume = []
     if ts_col:
         buckets: Counter = Counter()
@@ -524,3 +636,37 @@ async def get_audit():
         "query_volume": query_volume,
         "empty_retrieval_rate": round(empty_count / total_count, 3) if total_count else 0,
     }
+
+
+# ---------------------------------------------------------------------------
+# 7) GET /admin/stream — live SSE feed of new leads and audit events
+# ---------------------------------------------------------------------------
+@router.get("/stream")
+async def stream_events(request: Request):
+    queue = event_broker.subscribe()
+
+    async def generate():
+        SSE_STREAMS.inc(stream="admin")
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                item = await event_broker.next_event(queue, Config.ADMIN_STREAM_HEARTBEAT_SECONDS)
+                if item is None:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+                    continue
+                event, data = item
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            SSE_STREAMS.dec(stream="admin")
+            event_broker.unsubscribe(queue)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
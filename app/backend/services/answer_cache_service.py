@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.backend.config import Config
+from app.backend.services.metrics_service import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class CachedAnswer:
+    def __init__(self, vector: np.ndarray, answer: str, tokens: List[str], results: List[Tuple[str, float, str]]):
+        self.vector = vector
+        self.answer = answer
+        self.tokens = tokens  # Streamed chunks, replayed as-is
+        self.results = results  # (project_id, score, source) the answer was grounded on
+        self.created = time.time()
+
+
+class AnswerCache:
+    """
+    Semantic cache for opening questions ("what do you have in West Cairo?").
+    An entry is found by exact (kb version, intent, filters, named projects) and then
+    by cosine similarity of the query embedding ≥ ANSWER_CACHE_MIN_SIMILARITY.
+    Bounded by LRU and TTL; a new KB version drops everything.
+    """
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 3600.0, min_similarity: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self._entries: "OrderedDict[Tuple, List[CachedAnswer]]" = OrderedDict()  # key -> entries, LRU by key
+        self._size = 0
+        self._kb_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(kb_version: str, intent: str, filters: Dict[str, Any], projects: List[str]) -> Tuple:
+        return (
+            kb_version,
+            intent,
+            tuple(sorted((k, str(v).strip().lower()) for k, v in (filters or {}).items() if v)),
+            tuple(sorted(p.strip().lower() for p in projects or [])),
+        )
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        v = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else None
+
+    def get(self, key: Tuple, embedding: List[float]) -> Optional[CachedAnswer]:
+        if not self.enabled:
+            return None
+        v = self._normalize(embedding) if embedding else None
+        hit = None
+        with self._lock:
+            self._sync_version(key[0])
+            bucket = self._entries.get(key)
+            if bucket and v is not None:
+                now = time.time()
+                live = [e for e in bucket if now - e.created < self.ttl_seconds and e.vector.shape == v.shape]
+                self._size -= len(bucket) - len(live)
+                bucket[:] = live
+                if live:
+                    sims = np.stack([e.vector for e in live]) @ v
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.min_similarity:
+                        hit = live[best]
+                        self._entries.move_to_end(key)
+                if not live:
+                    del self._entries[key]
+        CACHE_REQUESTS.inc(cache="answer", result="hit" if hit else "miss")
+        return hit
+
+    def put(self, key: Tuple, embedding: List[float], answer: str, tokens: List[str], results: List[Tuple[str, float, str]]):
+        if not self.enabled:
+            return
+        v = self._normalize(embedding) if embedding else None
+        if v is None:
+            return
+        with self._lock:
+            self._sync_version(key[0])
+            self._entries.setdefault(key, []).append(CachedAnswer(v, answer, tokens, results))
+            self._entries.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_entries and self._entries:
+                oldest_key, bucket = next(iter(self._entries.items()))
+                bucket.pop(0)
+                self._size -= 1
+                if not bucket:
+                    del self._entries[oldest_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _sync_version(self, kb_version: str):
+        # Caller holds the lock. Answers grounded on an older KB must never be replayed.
+        if kb_version != self._kb_version:
+            if self._size:
+                logger.info(f"KB version changed ({self._kb_version} → {kb_version}) — dropping {self._size} cached answers")
+            self._entries.clear()
+            self._size = 0
+            self._kb_version = kb_version
+
+
+answer_cache = AnswerCache(
+    max_entries=Config.ANSWER_CACHE_SIZE,
+    ttl_seconds=Config.ANSWER_CACHE_TTL_SECONDS,
+    min_similarity=Config.ANSWER_CACHE_MIN_SIMILARITY,
+)
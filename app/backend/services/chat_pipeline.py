@@ -0,0 +1,363 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from app.backend.config import Config
+from app.backend.models import ChatRequest, ChatResponse, Message, Project, PromptSegments, RouterOutput, SessionState
+from app.backend.services.answer_cache_service import CachedAnswer, answer_cache
+from app.backend.services.kb_service import kb_service
+from app.backend.services.leads_service import leads_service
+from app.backend.services.llm_service import FALLBACK_ANSWER, llm_service
+from app.backend.services.prompt_service import PromptBuilder
+from app.backend.services.rag_service import rag_service
+from app.backend.services.session_service import session_store
+from app.backend.services.tools_service import tool_executor
+from app.backend.services.metrics_service import STAGE_LATENCY
+from app.backend.services.timing_service import StageTimer
+
+logger = logging.getLogger(__name__)
+
+# Intents that may lean on the previous turn's projects when retrieval finds nothing new
+FOLLOW_UP_INTENTS = ("project_query", "pricing", "amenity_check")
+
+# Contact details in a turn keep it out of the answer cache: the answer may echo them back.
+# Phones: international/00 prefixes, Egyptian mobiles, or grouped digits ("012 345 6789").
+_PHONE = re.compile(r"(?:\+|\b00)\d[\d\s-]{7,}\d|\b01[0125]\d{8}\b|\b\d{3}[\s-]\d{3,4}[\s-]\d{3,4}\b")
+_NAME = re.compile(r"\b(?:my name(?:\s+is|'s)|name\s*:|call me)\b|اسمي", re.IGNORECASE)
+
+class ChatTurn:
+    """Everything one chat turn accumulates on its way through the pipeline."""
+
+    def __init__(self, session_id: str, messages: List[Message]):
+        self.session_id = session_id
+        self.messages = messages
+        self.user_msg = messages[-1].content
+        self.router_out: Optional[RouterOutput] = None
+        self.retrieved_docs: List[Project] = []
+        self.retrieved_scores: List[float] = []
+        self.retrieved_chunks: List[List[Dict[str, Any]]] = []
+        self.retrieved_sources: List[str] = []
+        self.previous_project_ids: List[str] = []
+        self.history_offset = 0  # Absolute index of messages[0] in the stored session
+        self.state: Optional[SessionState] = None  # Loaded once in start(), saved in finish()
+        self.prompt: Optional[PromptSegments] = None
+        self.cache_key: Optional[Tuple] = None  # Set on history-free turns the answer cache may serve
+        self.query_embedding: List[float] = []
+        self.cached: Optional[CachedAnswer] = None
+        self.timer = StageTimer()
+
+    @property
+    def mode(self) -> str:
+        return "lead_capture" if self.router_out and self.router_out.intent == "lead_capture" else "concierge"
+
+    @property
+    def retrieved_projects(self) -> List[str]:
+        return [p.project_name for p in self.retrieved_docs]
+
+    def router_event(self) -> Dict[str, Any]:
+        r = self.router_out
+        return {"intent": r.intent, "mode": self.mode, "entities": r.entities, "filters": r.filters}
+
+    def retrieval_event(self) -> Dict[str, Any]:
+        """Enough to render project cards before the answer starts."""
+        return {"projects": [
+            {
+                "project_id": p.project_id,
+                "project_name": p.project_name,
+                "region": p.region,
+                "city_area": p.city_area,
+                "project_type": p.project_type,
+                "project_status": p.project_status,
+                "official_project_url": p.official_project_url,
+                "score": score,
+                "source": source,
+            }
+            for p, score, source in zip(self.retrieved_docs, self.retrieved_scores, self.retrieved_sources)
+        ]}
+
+
+class ChatPipeline:
+    """
+    router → retrieval → context → answer (LLM, tools) → session + audit.
+    Both chat endpoints drive this one pipeline; every stage is timed into
+    turn.timer, and the timings land in the audit record.
+    """
+
+    def __init__(self, prompt_builder: PromptBuilder, tools: List[Dict]):
+        self.prompt_builder = prompt_builder
+        self.tools = tools
+
+    # --- Stages 1-3: everything before the answer ---
+    def prepare(self, request: ChatRequest, state: Optional[SessionState] = None) -> ChatTurn:
+        turn = self.start(request, state)
+        self.route(turn)
+        self.retrieve(turn)
+        self.build_context(turn)
+        return turn
+
+    def start(self, request: ChatRequest, state: Optional[SessionState] = None) -> ChatTurn:
+        state = state or session_store.get(request.session_id)
+        turn = ChatTurn(request.session_id, session_store.history_for(request, state))
+        turn.state = state
+        turn.previous_project_ids = state.retrieved_project_ids
+        if not request.messages:
+            turn.history_offset = state.trimmed
+        return turn
+
+    def route(self, turn: ChatTurn):
+        # 1. Router
+        with turn.timer.stage("router"):
+            turn.router_out = llm_service.router_completion(turn.user_msg, history=turn.messages[:-1])
+        logger.info(f"Router intent: {turn.router_out.intent} | Filters: {turn.router_out.filters}")
+
+    def retrieve(self, turn: ChatTurn):
+        # 2. Retrieval
+        if turn.router_out.intent not in ("support_contact", "lead_capture"):
+            # Named projects resolve without an embedding; only the remaining turns pay for one,
+            # shared by the answer-cache lookup and search
+            results = self._resolve_entities(turn)
+            if not results:
+                results = self._cached_results(turn)
+            if not results and turn.cached is None:
+                results = self._retrieve(turn, turn.previous_project_ids)
+            turn.retrieved_docs = [r['project'] for r in results]
+            turn.retrieved_scores = [r['score'] for r in results]
+            turn.retrieved_chunks = [r.get('chunks', []) for r in results]
+            turn.retrieved_sources = [r['source'] for r in results]
+
+    def build_context(self, turn: ChatTurn):
+        # 3. Context Construction
+        if turn.cached is not None:
+            return  # The answer is replayed; no prompt needed
+        with turn.timer.stage("context"):
+            context_text = ""
+            for p, chunks in zip(turn.retrieved_docs, turn.retrieved_chunks):
+                context_text += f"---\n{kb_service.build_context_block(p, chunks)}\n"
+            # Nothing cleared the relevance cutoff → no CONTEXT segment at all
+            turn.prompt = self.prompt_builder.build(context_text)
+
+    def _resolve_entities(self, turn: ChatTurn) -> List[Dict[str, Any]]:
+        router_out = turn.router_out
+        if router_out.intent not in Config.RAG_ENTITY_INTENTS:
+            return []
+        with turn.timer.stage("entity"):
+            results = rag_service.resolve_entities(router_out.entities)
+        if results:
+            logger.info(f"Entities resolved directly: {[r['project'].project_id for r in results]}")
+        return results
+
+    def _retrieve(self, turn: ChatTurn, previous_ids: List[str]) -> List[Dict[str, Any]]:
+        router_out = turn.router_out
+        results = rag_service.search(
+            router_out.query_rewrite, k=3, filters=router_out.filters, timer=turn.timer,
+            embedding=turn.query_embedding or None
+        )
+        if not results and router_out.intent in FOLLOW_UP_INTENTS:
+            # "How much is the first one?" — stay on the projects from the previous turn
+            results = rag_service.results_for_projects(
+                {pid: Config.RAG_MIN_RELEVANCE for pid in previous_ids}, "session"
+            )
+        if not results and router_out.intent in Config.RAG_LISTING_INTENTS:
+            # "What properties do you have?" matches nothing in particular — list what the filters allow
+            results = rag_service.list_projects(router_out.filters)
+        return results
+
+    def _cached_results(self, turn: ChatTurn) -> List[Dict[str, Any]]:
+        """
+        Answer cache lookup for opening turns that search would serve. On a hit sets
+        turn.cached and returns the projects the cached answer was grounded on; the query
+        embedding is kept either way so search doesn't embed the same query twice. Turns
+        resolved to named projects never get here: the lookup would cost the embedding
+        that entity resolution saves.
+        """
+        router_out = turn.router_out
+        if not answer_cache.enabled or len(turn.messages) != 1 or router_out.intent not in Config.ANSWER_CACHE_INTENTS:
+            return []
+        if self._personal(router_out):
+            return []  # Neither served from nor stored in the shared cache
+        turn.query_embedding = rag_service.embed_query(router_out.query_rewrite, timer=turn.timer)
+        if not turn.query_embedding:
+            return []
+        turn.cache_key = answer_cache.key(
+            rag_service.kb_version, router_out.intent, router_out.filters, self._named_projects(turn)
+        )
+        with turn.timer.stage("answer_cache"):
+            turn.cached = answer_cache.get(turn.cache_key, turn.query_embedding)
+        if turn.cached is None:
+            return []
+        logger.info(f"Answer cache hit for '{router_out.query_rewrite}'")
+        results = []
+        for pid, score, source in turn.cached.results:
+            results += rag_service.results_for_projects({pid: score}, source)
+        return results
+
+    @staticmethod
+    def _personal(router_out: RouterOutput) -> bool:
+        """Lead capture, or a name or phone number in the router's rewrite of the turn."""
+        text = router_out.query_rewrite or ""
+        return router_out.intent == "lead_capture" or bool(_PHONE.search(text) or _NAME.search(text))
+
+    @staticmethod
+    def _named_projects(turn: ChatTurn) -> List[str]:
+        """
+        The projects a question names, for the answer-cache key: names found in the message
+        itself plus the router's entities, as project_ids where the KB name index resolves
+        them (verbatim otherwise). "Tell me about Badya" and "Tell me about Hacienda Bay"
+        embed almost identically, so the key is what keeps their answers apart.
+        """
+        router_out = turn.router_out
+        names = set(kb_service.mentioned_projects(f"{turn.user_msg}\n{router_out.query_rewrite}"))
+        for entity in router_out.entities:
+            match = kb_service.resolve_entity(entity)
+            names.add(match[0] if match else entity)
+        return sorted(names)
+
+    def _remember(self, turn: ChatTurn, reply: str, tokens: List[str]):
+        """Caches a completed, tool-free answer for the turn's cache key."""
+        if turn.cache_key is None or turn.cached is not None or not reply or reply == FALLBACK_ANSWER:
+            return
+        answer_cache.put(
+            turn.cache_key, turn.query_embedding, reply, tokens,
+            [(p.project_id, score, source)
+             for p, score, source in zip(turn.retrieved_docs, turn.retrieved_scores, turn.retrieved_sources)]
+        )
+
+    # --- Stage 4: answer ---
+    def answer(self, turn: ChatTurn) -> str:
+        """Blocking answer; returns the reply text (tool confirmations included)."""
+        if turn.cached is not None:
+            return turn.cached.answer
+        start = time.perf_counter()
+        response_data = llm_service.answer_completion(
+            turn.prompt, turn.messages, tools=self.tools, session_id=turn.session_id,
+            history_offset=turn.history_offset
+        )
+        llm_ms = (time.perf_counter() - start) * 1000.0
+        # Without streaming the first token arrives with the last
+        turn.timer.add("llm_ttft", llm_ms)
+        turn.timer.add("llm_total", llm_ms)
+
+        if isinstance(response_data, list):
+            calls = [{"id": tc.id, "function": {"name": tc.function.name, "arguments": tc.function.arguments}}
+                     for tc in response_data]
+            return self.run_tools(turn, calls)[0]
+        self._remember(turn, response_data, [response_data])
+        return response_data
+
+    async def astream(self, turn: ChatTurn) -> AsyncGenerator[Tuple[str, Dict[str, Any]], None]:
+        """
+        Streams the answer as ("token", {...}) and ("tool", {...}) events. The turn is
+        finished (session + audit) however the stream ends — including a client
+        disconnect, which records the partial reply.
+        """
+        full_response = ""
+        if turn.cached is not None:
+            try:
+                for token in turn.cached.tokens:
+                    full_response += token
+                    yield "token", {"token": token}
+            finally:
+                self.finish(turn, full_response)
+            return
+
+        tokens: List[str] = []
+        used_tools = False
+        start = time.perf_counter()
+        first = True
+        completed = False
+        failed = False
+        try:
+            try:
+                async for chunk in llm_service.astream_answer_completion(
+                    turn.prompt, turn.messages, tools=self.tools, session_id=turn.session_id,
+                    history_offset=turn.history_offset
+                ):
+                    if first:
+                        turn.timer.add("llm_ttft", (time.perf_counter() - start) * 1000.0)
+                        first = False
+                    if "__TOOL_CALLS__" in chunk:
+                        calls = json.loads(chunk.split("__TOOL_CALLS__")[1])
+                        used_tools = True
+                        # Only the journal append happens here; the handler runs on the executor
+                        confirm_msg, events = await asyncio.to_thread(self.run_tools, turn, calls)
+                        for event in events:
+                            yield "tool", event
+                        if confirm_msg:
+                            full_response += confirm_msg
+                            yield "token", {"token": confirm_msg}
+                    else:
+                        full_response += chunk
+                        tokens.append(chunk)
+                        yield "token", {"token": chunk}
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Whatever streamed so far ends with an apology; a broken answer is never cached
+                failed = True
+                full_response += FALLBACK_ANSWER
+                yield "token", {"token": FALLBACK_ANSWER}
+            completed = True
+            if not used_tools and not failed:
+                self._remember(turn, full_response, tokens)
+        finally:
+            turn.timer.add("llm_total", (time.perf_counter() - start) * 1000.0 - turn.timer.timings.get("tool", 0.0))
+            if not completed:
+                logger.info(f"Stream for {turn.session_id} ended early after {len(full_response)} chars")
+            self.finish(turn, full_response)
+
+    # --- Stage 5: tools ---
+    def run_tools(self, turn: ChatTurn, calls: List[Dict]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Queues each call on the tool executor. Returns the confirmation text and one
+        event per call — "queued" once the job is durably journaled, "rejected" if the
+        arguments don't validate or the tool is unknown.
+        """
+        final_text = ""
+        events = []
+        with turn.timer.stage("tool"):
+            for tc in calls:
+                name = tc["function"]["name"]
+                try:
+                    args = json.loads(tc["function"]["arguments"] or "{}")
+                    logger.info(f"Tool Call '{name}' Args: {args}")
+                    job = tool_executor.submit(name, turn.session_id, args)
+                except Exception as e:
+                    logger.error(f"Tool call '{name}' rejected: {e}")
+                    events.append({"name": name, "status": "rejected"})
+                    continue
+                events.append({"name": name, "status": "queued", "job_id": job["id"]})
+                final_text = tool_executor.registry.get(name).confirm(job["payload"])
+        return final_text, events
+
+    # --- Stage 6: session + audit ---
+    def finish(self, turn: ChatTurn, reply: str):
+        session_store.record_turn(
+            turn.state or session_store.get(turn.session_id), turn.messages, reply, turn.router_out, [p.project_id for p in turn.retrieved_docs]
+        )
+        turn.timer.add("total", turn.timer.elapsed_ms())
+        with turn.timer.stage("audit"):
+            leads_service.log_audit(
+                turn.session_id,
+                turn.user_msg,
+                turn.router_out.intent,
+                [p.project_id for p in turn.retrieved_docs],
+                turn.retrieved_scores,
+                timings=dict(turn.timer.timings)
+            )
+        for stage, ms in turn.timer.timings.items():
+            STAGE_LATENCY.observe(ms / 1000.0, stage=stage)
+        logger.info(f"Turn timings (ms): {turn.timer.timings}")
+
+    def respond(self, request: ChatRequest, state: Optional[SessionState] = None) -> Tuple[ChatResponse, ChatTurn]:
+        """Non-streaming turn, start to finish."""
+        turn = self.prepare(request, state)
+        final_text = self.answer(turn)
+        self.finish(turn, final_text)
+        return ChatResponse(
+            message=final_text,
+            retrieved_projects=turn.retrieved_projects,
+            mode=turn.mode
+        ), turn
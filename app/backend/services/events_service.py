@@ -0,0 +1,132 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+class _CsvTail:
+    """Rows appended to one CSV since the last read, by byte offset."""
+
+    def __init__(self, path: str, event: str, headers: List[str]):
+        self.path = path
+        self.event = event
+        self.headers = headers
+        self.inode, self.offset = self._stat()
+
+    def _stat(self) -> Tuple[int, int]:
+        try:
+            st = os.stat(self.path)
+            return st.st_ino, st.st_size
+        except OSError:
+            return 0, 0
+
+    def read(self) -> List[Dict[str, str]]:
+        inode, size = self._stat()
+        if inode != self.inode or size < self.offset:
+            # Replaced or truncated (e.g. a widened header): follow the new file from its end
+            self.inode, self.offset = inode, size
+        if size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b"\n") + 1
+        # Only whole records: an unfinished write or a quoted field still open waits for the next poll
+        if end == 0 or chunk[:end].count(b'"') % 2:
+            return []
+        self.offset += end
+        rows = csv.reader(io.StringIO(chunk[:end].decode("utf-8", errors="replace"), newline=""))
+        return [dict(zip(self.headers, row)) for row in rows if row and row != self.headers[:len(row)]]
+
+
+class EventBroker:
+    """
+    Fan-out of lead/audit events to live dashboard subscribers.
+    Events come from tailing the CSVs the rows are appended to, so a subscriber on
+    any worker process sees rows written by every worker. Each subscriber owns a
+    bounded asyncio queue and never blocks the poller on a slow client.
+    """
+
+    def __init__(self, max_queue: int = 100, poll_seconds: float = 1.0):
+        self.max_queue = max_queue
+        self.poll_seconds = poll_seconds
+        self._subscribers: Dict[asyncio.Queue, asyncio.AbstractEventLoop] = {}
+        self._tails: List[_CsvTail] = []
+        self._poller: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def watch(self, path: str, event: str, headers: List[str]):
+        """Publish every row appended to `path` from now on as `event`."""
+        with self._lock:
+            self._tails.append(_CsvTail(path, event, headers))
+
+    def _ensure_poller(self):
+        # Caller holds the lock
+        if self._poller is None or not self._poller.is_alive():
+            self._poller = threading.Thread(target=self._poll, name="palmx-events", daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                tails = list(self._tails)
+            for tail in tails:
+                try:
+                    rows = tail.read()
+                except Exception as e:
+                    logger.warning(f"Failed to read new rows from {tail.path}: {e}")
+                    continue
+                for row in rows:
+                    self.publish(tail.event, row)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+            self._ensure_poller()
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        if not self._subscribers:
+            return
+        with self._lock:
+            targets = list(self._subscribers.items())
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, (event, data))
+            except RuntimeError:
+                # Subscriber's loop is gone (worker shutdown) — forget it
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, item: Tuple[str, Dict[str, Any]]):
+        # Slow client: drop its oldest pending event rather than grow without bound
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(item)
+
+    async def next_event(self, queue: asyncio.Queue, timeout: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+        try:
+            return await asyncio.wait_for(queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+event_broker = EventBroker(max_queue=Config.ADMIN_STREAM_QUEUE_SIZE, poll_seconds=Config.ADMIN_STREAM_POLL_SECONDS)
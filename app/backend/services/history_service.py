@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from app.backend.config import Config
+from app.backend.models import Message
+from app.backend.services.metrics_service import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception as e:  # Missing package or no network to fetch the BPE file
+    logger.warning(f"tiktoken unavailable ({e}) — history budgets use a conservative character estimate")
+    _ENCODING = None
+
+# Per-message framing the chat API adds around role + content
+_MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    # ~4 chars/token holds for Latin script only; Arabic and other scripts run close to a
+    # token per character, so count them that way and err on the side of the budget
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    return max(1, (len(text) - non_ascii + 3) // 4 + non_ascii)
+
+
+def message_tokens(m: Message) -> int:
+    return count_tokens(m.content) + _MESSAGE_OVERHEAD
+
+
+def _digest(m: Message) -> str:
+    return hashlib.sha1(f"{m.role}\x1f{m.content}".encode("utf-8")).hexdigest()
+
+
+class HistoryCompactor:
+    """
+    Keeps the answer prompt inside HISTORY_TOKEN_BUDGET.
+    Recent turns go through verbatim; everything older is folded into one rolling
+    summary per session. The summary is cached with the absolute offset of the first
+    message it does not cover and a digest of the message before it, so it survives the
+    session store trimming history from the front and is only extended when the verbatim
+    window moves past another HISTORY_SUMMARY_STEP messages — not recomputed every turn.
+    """
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._summaries: "OrderedDict[str, Tuple[int, str, str]]" = OrderedDict()  # session -> (covered, boundary digest, summary)
+        self._lock = threading.Lock()
+
+    def compact(
+        self,
+        session_id: Optional[str],
+        history: List[Message],
+        summarize: Callable[[str, List[Message]], str],
+        offset: int = 0,
+    ) -> Tuple[Optional[str], List[Message]]:
+        """
+        Returns (summary or None, messages to send verbatim).
+        `summarize(previous_summary, new_messages)` folds messages into a summary.
+        `offset` is history[0]'s absolute position in the session (SessionState.trimmed).
+        """
+        if sum(message_tokens(m) for m in history) <= Config.HISTORY_TOKEN_BUDGET:
+            return None, history
+
+        cut = self._cut_point(history, offset)
+        if cut <= 0:
+            return None, history
+        recent = history[cut:]
+        if not session_id:
+            # Nowhere to cache a summary: drop the oldest turns instead of paying for one per turn
+            return None, recent
+
+        with self._lock:
+            cached = self._summaries.get(session_id)
+        covered, summary = 0, ""
+        if cached and offset <= cached[0] < offset + len(history):
+            covered = cached[0] - offset
+            # Messages the store has trimmed since stay summarised; a boundary still in view must match
+            if covered == 0 or cached[1] == _digest(history[covered - 1]):
+                summary = cached[2]
+            else:
+                covered = 0
+        elif cached and cached[0] < offset:
+            summary = cached[2]  # Some older messages were trimmed before being summarised
+
+        if covered >= cut:
+            # The cached summary already reaches past the window start — reuse it as is
+            CACHE_REQUESTS.inc(cache="history_summary", result="hit")
+            recent = history[covered:]
+        else:
+            CACHE_REQUESTS.inc(cache="history_summary", result="miss")
+            try:
+                summary = summarize(summary, history[covered:cut])
+            except Exception as e:
+                logger.error(f"History summary failed for {session_id}: {e}")
+                # Keep whatever summary we had plus everything after it; with none, just truncate
+                return (summary or None), (history[covered:] if summary else recent)
+            covered = cut
+            with self._lock:
+                self._summaries[session_id] = (offset + covered, _digest(history[covered - 1]), summary)
+                self._summaries.move_to_end(session_id)
+                while len(self._summaries) > self.max_sessions:
+                    self._summaries.popitem(last=False)
+            logger.info(f"History compacted for {session_id}: {covered} messages summarised, {len(recent)} kept")
+
+        return summary, recent
+
+    def _cut_point(self, history: List[Message], offset: int = 0) -> int:
+        """
+        Index of the first message kept verbatim: at least HISTORY_KEEP_RECENT messages,
+        more while they fit the budget, always starting on a user turn. Its absolute
+        position is rounded down to a multiple of HISTORY_SUMMARY_STEP so the cached
+        summary is reused across turns.
+        """
+        budget = Config.HISTORY_TOKEN_BUDGET - Config.HISTORY_SUMMARY_MAX_TOKENS
+        keep = min(Config.HISTORY_KEEP_RECENT, len(history))
+        used = sum(message_tokens(m) for m in history[len(history) - keep:])
+        while keep < len(history) and used + message_tokens(history[-keep - 1]) <= budget:
+            keep += 1
+            used += message_tokens(history[-keep])
+
+        cut = len(history) - keep
+        cut = max(0, cut - (offset + cut) % max(1, Config.HISTORY_SUMMARY_STEP))
+        while 0 < cut < len(history) and history[cut].role != "user":
+            cut -= 1
+        return cut
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._summaries.pop(session_id, None)
+
+
+history_compactor = HistoryCompactor(max_sessions=Config.HISTORY_CACHE_SESSIONS)
@@ -2,9 +2,12 @@ import csv
 import json
 import logging
 import os
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, Set, Tuple
+from rapidfuzz import process, fuzz, utils
 from app.backend.config import Config
 from app.backend.models import Project
+from app.backend.retrieval.lexical import BM25Index
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +15,14 @@ class KBService:
     def __init__(self):
         self.projects: Dict[str, Project] = {}
         self.raw_rows: List[Dict[str, Any]] = []
+        self.lexical_index = BM25Index()
+        self.name_index: Dict[str, str] = {}  # normalised alias -> project_id
+        self.place_names: Set[str] = set()  # normalised regions / city areas / micro-locations
         self._load_kb()
+        self.lexical_index.build({
+            pid: self.build_search_document(p) for pid, p in self.projects.items()
+        })
+        self._build_name_index()
 
     def _load_kb(self):
         if not os.path.exists(Config.KB_CSV_PATH):
@@ -111,6 +121,169 @@ class KBService:
                 results.append(p)
         return results
 
+    def _build_name_index(self):
+        """
+        Aliases per project: its name, its id spelled out, and the name without the brand
+        prefix — unless that short form is also a place ("Palm Hills New Cairo" → "new cairo"
+        would claim every question about the area).
+        """
+        self.place_names = places = self._place_names()
+        for pid, p in self.projects.items():
+            aliases = {p.project_name, pid.replace('_', ' ')}
+            if p.project_name.lower().startswith('palm hills '):
+                short = utils.default_process(p.project_name[len('palm hills '):])
+                if not any(f" {short} " in f" {place} " for place in places):
+                    aliases.add(short)
+            for alias in aliases:
+                key = utils.default_process(alias)
+                if key:
+                    self.name_index.setdefault(key, pid)
+
+    def _place_names(self) -> Set[str]:
+        """Every region, city area and micro-location in the KB, normalised like the aliases."""
+        places = set()
+        for p in self.projects.values():
+            for key in ('region', 'city_area', 'micro_location'):
+                for part in re.split(r'[/,]', str(p.raw_data.get(key) or '')):
+                    place = utils.default_process(part)
+                    if place:
+                        places.add(place)
+        return places
+
+    def resolve_entity(self, name: str) -> Optional[Tuple[str, float]]:
+        """
+        Maps a project name as the user wrote it to (project_id, confidence 0-100).
+        Returns None unless the best project clears RAG_ENTITY_MIN_SCORE and beats the
+        best *other* project by RAG_ENTITY_MARGIN ("Hacienda" alone stays ambiguous).
+        """
+        query = utils.default_process(name or '')
+        if not query or not self.name_index:
+            return None
+        if query in self.name_index:
+            return self.name_index[query], 100.0
+        if query in self.place_names:
+            return None  # "Alexandria" is an area, not a fuzzy match for "Palm Hills Alexandria"
+
+        # Numbers name distinct projects ("Katameya 1" / "Katameya 2"), so a numbered query must agree
+        digits = {t for t in query.split() if t.isdigit()}
+        best: Dict[str, float] = {}
+        for alias, score, _ in process.extract(query, list(self.name_index.keys()), scorer=fuzz.WRatio, limit=10):
+            if digits and {t for t in alias.split() if t.isdigit()} != digits:
+                continue
+            pid = self.name_index[alias]
+            best[pid] = max(best.get(pid, 0.0), score)
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < Config.RAG_ENTITY_MIN_SCORE:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < Config.RAG_ENTITY_MARGIN:
+            return None
+        return ranked[0]
+
+    def mentioned_projects(self, text: str) -> List[str]:
+        """project_ids whose name or alias appears word-for-word in free text (a whole user question)."""
+        padded = f" {utils.default_process(text or '')} "
+        return sorted({pid for alias, pid in self.name_index.items() if f" {alias} " in padded})
+
+    def lexical_search(self, query: str, k: int = 5) -> List[tuple]:
+        """BM25 over project cards + raw KB text. Returns [(project_id, score 0-1)]."""
+        return self.lexical_index.search(query, k)
+
+    def build_search_document(self, project: Project) -> str:
+        """
+        Text for the lexical index: the project card plus raw KB detail the card drops
+        (micro-location, payment plan, listing/zone/phase names, FAQ text).
+        """
+        raw = project.raw_data
+        parts = [self.build_project_card(project)]
+        for key in ('brand_family', 'micro_location', 'payment_plan_headline', 'delivery_window'):
+            if raw.get(key):
+                parts.append(str(raw[key]))
+
+        text_keys = ('zone_name', 'zone_description', 'description', 'unit_type',
+                     'phase_name', 'question', 'answer', 'q', 'a')
+        for key in ('zones_json', 'listings_json', 'unit_templates_json', 'phases_json',
+                    'faqs_json', 'finishing_levels_offered_json'):
+            for item in raw.get(key) or []:
+                if isinstance(item, dict):
+                    values = [item.get(t) for t in text_keys]
+                else:
+                    values = [item]
+                parts.extend(str(v) for v in values if isinstance(v, str) and v.lower() != 'unknown')
+        return "\n".join(parts)
+
+    def build_chunks(self, project: Project) -> List[Dict[str, str]]:
+        """
+        Splits a project into independently embeddable chunks: the card, one per zone,
+        one per (zone, unit type) listing group, one per FAQ and one per phase.
+        Each chunk is {"kind", "label", "body"}; listing prices follow the card's rule
+        and are only shown when official.
+        """
+        raw = project.raw_data
+        chunks = [{"kind": "card", "label": "Overview", "body": self.build_project_card(project)}]
+
+        def known(v: Any) -> Optional[str]:
+            return str(v) if v not in (None, '') and str(v).lower() != 'unknown' else None
+
+        for z in raw.get('zones_json') or []:
+            if isinstance(z, dict) and known(z.get('zone_name')):
+                name = z['zone_name']
+                label = name if name.lower().startswith('zone') else f"Zone {name}"
+                desc = known(z.get('zone_description')) or known(z.get('description'))
+                chunks.append({"kind": "zone", "label": label,
+                               "body": desc or f"{name} is a zone within {project.project_name}."})
+
+        groups: Dict[tuple, List[dict]] = {}
+        for l in raw.get('listings_json') or []:
+            if isinstance(l, dict):
+                groups.setdefault((known(l.get('zone_name')), known(l.get('unit_type')) or 'Units'), []).append(l)
+        for (zone, unit_type), listings in groups.items():
+            facts = []
+            prices = sorted(float(l['price_value']) for l in listings
+                            if known(l.get('price_status')) == 'official' and str(l.get('price_value', '')).isdigit())
+            if prices:
+                currency = known(listings[0].get('currency')) or 'EGP'
+                facts.append(f"Price: {int(prices[0])} {currency}" if len(prices) == 1 or prices[0] == prices[-1]
+                             else f"Price: {int(prices[0])} - {int(prices[-1])} {currency}")
+            for key, label in (('bedrooms', 'Bedrooms'), ('bua_sqm', 'BUA (sqm)'),
+                               ('delivery', 'Delivery'), ('payment_plan_text', 'Payment Plan')):
+                values = sorted({known(l.get(key)) for l in listings} - {None})
+                if values:
+                    facts.append(f"{label}: {', '.join(values)}")
+            label = f"{unit_type} in {zone}" if zone and zone != unit_type else unit_type
+            chunks.append({"kind": "listing", "label": label,
+                           "body": "\n".join(facts) or f"{unit_type} units are offered."})
+
+        for faq in raw.get('faqs_json') or []:
+            if isinstance(faq, dict):
+                q = known(faq.get('question')) or known(faq.get('q'))
+                a = known(faq.get('answer')) or known(faq.get('a'))
+                if q and a:
+                    chunks.append({"kind": "faq", "label": q, "body": a})
+
+        for ph in raw.get('phases_json') or []:
+            if isinstance(ph, dict) and known(ph.get('phase_name')):
+                details = [f"{k.replace('_', ' ').title()}: {v}" for k, v in ph.items()
+                           if k != 'phase_name' and isinstance(v, str) and known(v) and not v.startswith('http')]
+                chunks.append({"kind": "phase", "label": ph['phase_name'],
+                               "body": "\n".join(details) or f"{ph['phase_name']} of {project.project_name}."})
+        return chunks
+
+    def build_context_block(self, project: Project, chunks: Optional[List[Dict[str, Any]]] = None) -> str:
+        """
+        Context for the answer LLM. When retrieval matched specific zones/listings/FAQs,
+        send those plus the project's headline lines instead of the whole card.
+        """
+        card = self.build_project_card(project)
+        chunks = chunks or []
+        if not chunks or any(c.get("kind") == "card" for c in chunks):
+            lines = [card]
+        else:
+            lines = card.split("\n")[:2]  # Project + Location
+        for c in chunks:
+            if c.get("kind") != "card":
+                lines.append(f"{c['label']}:\n{c['body']}")
+        return "\n".join(lines)
+
     def build_project_card(self, project: Project) -> str:
         """
         Creates the normalized text chunk for embedding.
@@ -2,25 +2,40 @@ import csv
 import os
 import logging
 import portalocker
+import time
 from datetime import datetime
 from openpyxl import Workbook
 from app.backend.config import Config
 from app.backend.models import Lead
+from app.backend.services.events_service import event_broker
+from app.backend.services.metrics_service import CSV_WRITE_LATENCY
 
 logger = logging.getLogger(__name__)
 
 class LeadsService:
+    LEAD_HEADERS = [
+        "timestamp", "session_id", "name", "phone", 
+        "interest_projects", "preferred_region", "unit_type", 
+        "budget_min", "budget_max", "purpose", "timeline", 
+        "next_step", "lead_summary", "tags", "kb_version_hash"
+    ]
+    AUDIT_HEADERS = [
+        "timestamp", "session_id", "user_message", "router_intent", 
+        "retrieved_projects", "similarity_scores", "kb_version", "fields_used",
+        "stage_timings_ms"
+    ]
+
     def __init__(self):
+        self._saved: set = set()  # save_lead job ids already written, read from LEAD_JOBS_PATH
+        self._saved_offset = 0  # Bytes of LEAD_JOBS_PATH already folded into _saved
         self._init_files()
+        # Rows from every worker reach the dashboard stream by tailing the files themselves
+        event_broker.watch(Config.LEADS_PATH, "lead", self.LEAD_HEADERS)
+        event_broker.watch(Config.AUDIT_PATH, "audit", self.AUDIT_HEADERS)
 
     def _init_files(self):
         # Leads CSV
-        expected_headers = [
-            "timestamp", "session_id", "name", "phone", 
-            "interest_projects", "preferred_region", "unit_type", 
-            "budget_min", "budget_max", "purpose", "timeline", 
-            "next_step", "lead_summary", "tags", "kb_version_hash"
-        ]
+        expected_headers = self.LEAD_HEADERS
         
         if not os.path.exists(Config.LEADS_PATH):
             with open(Config.LEADS_PATH, 'w', newline='', encoding='utf-8') as f:
@@ -46,12 +61,16 @@ class LeadsService:
         if not os.path.exists(Config.AUDIT_PATH):
             with open(Config.AUDIT_PATH, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow([
-                    "timestamp", "session_id", "user_message", "router_intent", 
-                    "retrieved_projects", "similarity_scores", "kb_version", "fields_used"
-                ])
+                writer.writerow(self.AUDIT_HEADERS)
+        # Files from before a trailing column (e.g. stage_timings_ms) existed keep their
+        # header: rewriting it would race appenders in other workers. New rows carry the
+        # extra fields anyway; readers name them from AUDIT_HEADERS.
 
-    def save_lead(self, lead: Lead):
+    def save_lead(self, lead: Lead, job_id: str = None):
+        """
+        Appends the lead. With a job_id (tool executor) the save is idempotent: ids of saved
+        jobs are recorded in LEAD_JOBS_PATH under the same lock, and a replayed job is a no-op.
+        """
         row = [
             datetime.now().isoformat(),
             lead.session_id,
@@ -71,17 +90,44 @@ class LeadsService:
         ]
         
         try:
+            start = time.perf_counter()
             with open(Config.LEADS_PATH, 'a', newline='', encoding='utf-8') as f:
                 portalocker.lock(f, portalocker.LOCK_EX)
-                writer = csv.writer(f)
-                writer.writerow(row)
-                portalocker.unlock(f)
+                try:
+                    if job_id and job_id in self._saved_jobs():
+                        logger.info(f"Lead for job {job_id} already saved — skipping")
+                        return True
+                    writer = csv.writer(f)
+                    writer.writerow(row)
+                    if job_id:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        with open(Config.LEAD_JOBS_PATH, 'a', encoding='utf-8') as jobs:
+                            jobs.write(job_id + "\n")
+                            jobs.flush()
+                            os.fsync(jobs.fileno())
+                        self._saved_jobs()  # Folds this id in too
+                finally:
+                    portalocker.unlock(f)
+            CSV_WRITE_LATENCY.observe(time.perf_counter() - start, file="leads")
             return True
         except Exception as e:
             logger.error(f"Failed to save lead: {e}")
             return False
 
-    def log_audit(self, session_id: str, user_msg: str, intent: str, retrieved: list, scores: list):
+    def _saved_jobs(self) -> set:
+        # Caller holds the leads.csv lock. Only ids appended since the last call are read.
+        if not os.path.exists(Config.LEAD_JOBS_PATH):
+            return self._saved
+        with open(Config.LEAD_JOBS_PATH, 'rb') as f:
+            f.seek(self._saved_offset)
+            new = f.read()
+        end = new.rfind(b"\n") + 1
+        self._saved.update(line.strip() for line in new[:end].decode('utf-8').splitlines() if line.strip())
+        self._saved_offset += end
+        return self._saved
+
+    def log_audit(self, session_id: str, user_msg: str, intent: str, retrieved: list, scores: list, timings: dict = None):
         row = [
             datetime.now().isoformat(),
             session_id,
@@ -90,15 +136,18 @@ class LeadsService:
             json.dumps(retrieved),
             json.dumps(scores),
             "v1.0", # KB Version placeholder
-            "all" # Fields used placeholder
+            "all", # Fields used placeholder
+            json.dumps(timings or {})
         ]
         
         try:
+            start = time.perf_counter()
             with open(Config.AUDIT_PATH, 'a', newline='', encoding='utf-8') as f:
                 portalocker.lock(f, portalocker.LOCK_EX)
                 writer = csv.writer(f)
                 writer.writerow(row)
                 portalocker.unlock(f)
+            CSV_WRITE_LATENCY.observe(time.perf_counter() - start, file="audit")
         except Exception as e:
             logger.error(f"Failed to log audit: {e}")
 
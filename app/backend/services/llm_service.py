@@ -1,71 +1,160 @@
+import asyncio
+import hashlib
 import json
 import logging
-from typing import List, Optional, Dict, Any, Generator
-from openai import AzureOpenAI, OpenAI
+import threading
+from typing import List, Optional, Dict, Any, Callable, AsyncGenerator
+from openai import NOT_GIVEN
 from app.backend.config import Config
-from app.backend.models import RouterOutput, Message
+from app.backend.models import RouterOutput, Message, PromptSegments
+from app.backend.retrieval.embeddings import HashedSVDEmbedder
+from app.backend.services.history_service import count_tokens, history_compactor
+from app.backend.services.metrics_service import LLM_COALESCED, LLM_TOKENS
+from app.backend.services.provider_service import Provider, provider_pool
+from app.backend.services.scheduler_service import PRIORITY_BATCH, PRIORITY_CHAT, PRIORITY_EMBEDDING, PRIORITY_ROUTER
 
 logger = logging.getLogger(__name__)
 
+# Returned (or streamed) in place of an answer when the completion call fails
+FALLBACK_ANSWER = "I apologize, but I am having trouble connecting. Please try again."
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: the first caller for a key runs the call,
+    callers arriving while it is in flight wait and get the same result (or exception).
+    Nothing is kept once the call returns, so there is no staleness.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def do(self, key: str, fn: Callable[[], Any], label: str = "") -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            LLM_COALESCED.inc(call=label)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _estimate_tokens(messages: List[Dict], completion: int) -> int:
+    """TPM charge for a chat call: prompt tokens plus the expected completion."""
+    return sum(count_tokens(m.get("content") or "") + 4 for m in messages) + completion
+
+
 class LLMService:
     def __init__(self):
         self.client = None
+        self.async_client = None # Streaming path: native async, cancellable mid-stream
         self.embed_client = None
         self.deployment = None
         self.embed_deployment = None
         self.provider = "azure" # or 'openai'
+        self.embedding_backend = Config.EMBEDDING_BACKEND
+        self.local_embedder: Optional[HashedSVDEmbedder] = None # fitted on the KB by RAGService
+        self._single_flight = SingleFlight() # Shares router / query-embedding calls across concurrent sessions
         
         self._setup_client()
 
     def _setup_client(self):
-        # Try Azure first
-        if Config.AZURE_OPENAI_API_KEY and Config.AZURE_OPENAI_ENDPOINT:
-            try:
-                self.client = AzureOpenAI(
-                    api_key=Config.AZURE_OPENAI_API_KEY,
-                    api_version=Config.AZURE_OPENAI_API_VERSION,
-                    azure_endpoint=Config.AZURE_OPENAI_ENDPOINT
-                )
-                self.deployment = Config.AZURE_OPENAI_CHAT_DEPLOYMENT
-                self.embed_deployment = Config.AZURE_OPENAI_EMBED_DEPLOYMENT
-                self.provider = "azure"
-                logger.info("LLM Service initialized with Azure OpenAI")
-                return
-            except Exception as e:
-                logger.warning(f"Failed to init Azure OpenAI: {e}")
-
-        # Fallback to OpenAI
-        if Config.OPENAI_API_KEY:
-            self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
-            self.deployment = Config.OPENAI_MODEL
-            self.embed_deployment = Config.OPENAI_EMBED_MODEL
-            self.provider = "openai"
-            logger.info("LLM Service initialized with OpenAI Fallback")
-        else:
+        # Azure first, OpenAI as secondary; calls fail over between them at request time
+        self.providers = provider_pool
+        primary = provider_pool.primary
+        if primary is None:
             logger.error("No valid LLM credentials found.")
+            return
+        # The primary's identity: index builds, single-flight keys and usage labels
+        self.client = primary.client
+        self.async_client = primary.async_client
+        self.deployment = primary.deployment
+        self.embed_deployment = primary.embed_deployment
+        self.provider = primary.name
+        logger.info(f"LLM Service initialized with providers: {[p.name for p in provider_pool.providers]}")
 
-    def get_embedding(self, text: str) -> list[float]:
-        text = text.replace("\n", " ")
+    def get_embeddings(self, texts: List[str], backend: Optional[str] = None) -> List[list[float]]:
+        """
+        Embeds texts with the given backend ('provider' | 'local'; defaults to Config)
+        in one provider call. On failure every slot is [] — never a placeholder vector —
+        so callers can skip vector search per query.
+        """
+        if (backend or self.embedding_backend) == "local":
+            return self.local_embedder.embed_many(texts) if self.local_embedder else [[] for _ in texts]
         try:
-            if self.provider == "azure":
-                response = self.client.embeddings.create(
-                    input=[text],
-                    model=self.embed_deployment
-                )
-            else:
-                response = self.client.embeddings.create(
-                    input=[text],
-                    model=self.embed_deployment
-                )
-            return response.data[0].embedding
+            return self._coalesced_embeddings(texts)
         except Exception as e:
-            logger.error(f"Embedding failed: {e}")
-            return [0.0] * 1536
+            logger.error(f"Batch embedding failed: {e}")
+            return [[] for _ in texts]
+
+    def embed_documents(
+        self, texts: List[str], failover: bool = False, priority: int = PRIORITY_BATCH
+    ) -> List[list[float]]:
+        """
+        Provider embeddings for many texts (index builds), LLM_EMBED_BATCH_SIZE inputs per request.
+        Raises on failure so an outage can never be written into the index.
+        Only the primary is used unless `failover` — another embedding model means another vector space.
+        """
+        if not self.client:
+            raise RuntimeError("No embedding provider configured")
+        inputs = [t.replace("\n", " ") for t in texts]
+        size = max(1, Config.LLM_EMBED_BATCH_SIZE)
+        vectors = []
+        for start in range(0, len(inputs), size):
+            batch = inputs[start:start + size]
+            response = self.providers.call(
+                lambda p: p.client.embeddings.create(input=batch, model=p.embed_deployment),
+                "embedding", failover=failover,
+                priority=priority, tokens=sum(count_tokens(t) for t in batch), embedding=True
+            )
+            vectors += [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        return vectors
+
+    def _coalesced_embeddings(self, texts: List[str]) -> List[list[float]]:
+        """Query embeddings; identical concurrent requests share one provider call."""
+        key = SingleFlight.key("embeddings", self.embed_deployment, [_normalize_text(t) for t in texts])
+        return self._single_flight.do(
+            key, lambda: self.embed_documents(texts, failover=Config.LLM_EMBED_FAILOVER, priority=PRIORITY_EMBEDDING),
+            label="embedding"
+        )
 
     def router_completion(self, user_message: str, history: List[Message] = None) -> RouterOutput:
         """
         Determines user intent and extracts entities strictly, using history for context.
+        Identical concurrent requests (campaign bursts of the same opening line) share one call.
         """
+        user_message = _normalize_text(user_message)
         history_str = ""
         if history is not None and len(history) > 0:
             history_str = "\n".join([f"{m.role}: {m.content}" for m in history])
@@ -99,19 +188,41 @@ class LLMService:
         - query_rewrite: clean, standalone search query that incorporates context from history if needed. 
           (e.g., if history shows 'commercial properties' and current message is 'West Cairo', rewrite to 'commercial properties in West Cairo').
           (If the message is broad like 'list all', keep the rewrite broad e.g. 'all properties').
+        - entities: list of project names exactly as the user wrote them, [] if none is named.
+          (A follow-up like 'how much is it there?' carries the project named earlier in the history.)
+
+        Examples:
+        "Compare Badya and Hacienda Bay" →
+        {{"intent": "compare", "needs": [], "filters": {{}}, "query_rewrite": "compare Badya and Hacienda Bay", "entities": ["Badya", "Hacienda Bay"]}}
+        "Does Palm Hills Katameya 2 have a clubhouse?" →
+        {{"intent": "project_query", "needs": ["amenities"], "filters": {{}}, "query_rewrite": "Palm Hills Katameya 2 clubhouse", "entities": ["Palm Hills Katameya 2"]}}
+        "What villas do you have in West Cairo?" →
+        {{"intent": "list_projects", "needs": [], "filters": {{"region": "West Cairo"}}, "query_rewrite": "villas in West Cairo", "entities": []}}
         """
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Contextualize: {user_message}"}
-                ],
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Contextualize: {user_message}"}
+        ]
+
+        def call(p: Provider) -> str:
+            response = p.client.chat.completions.create(
+                model=p.deployment,
+                messages=messages,
                 temperature=0,
                 response_format={"type": "json_object"}
             )
-            content = response.choices[0].message.content
+            self._log_usage("router", response.usage, p.deployment)
+            return response.choices[0].message.content
+
+        try:
+            # Each caller parses its own copy, so no RouterOutput is shared between sessions
+            content = self._single_flight.do(
+                SingleFlight.key("router", self.deployment, messages),
+                # Router replies are a short JSON object
+                lambda: self.providers.call(call, "router", priority=PRIORITY_ROUTER, tokens=_estimate_tokens(messages, 200)),
+                label="router"
+            )
             data = json.loads(content)
             # Ensure intent is present
             if "intent" not in data:
@@ -127,34 +238,105 @@ class LLMService:
                 entities=[]
             )
 
+    def summarize_history(self, previous_summary: str, messages: List[Message]) -> str:
+        """
+        Folds older turns into the session's rolling summary (see HistoryCompactor).
+        Raises on failure so a broken summary is never cached.
+        """
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in messages)
+        prompt = f"""
+        Update the running summary of a PalmX sales conversation with the new turns.
+        Keep every buyer detail verbatim: name, phone, budget, currency, region, unit type,
+        purpose, timeline, projects discussed or shortlisted, objections and agreed next steps.
+        Drop greetings and small talk. Plain text, at most {Config.HISTORY_SUMMARY_MAX_TOKENS} tokens.
+
+        CURRENT SUMMARY:
+        {previous_summary or "(none)"}
+
+        NEW TURNS:
+        {transcript}
+        """
+        messages = [{"role": "system", "content": prompt}]
+        response = self.providers.call(lambda p: p.client.chat.completions.create(
+            model=p.deployment,
+            messages=messages,
+            temperature=0,
+            max_tokens=Config.HISTORY_SUMMARY_MAX_TOKENS
+        ), "summary", priority=PRIORITY_ROUTER, tokens=_estimate_tokens(messages, Config.HISTORY_SUMMARY_MAX_TOKENS))
+        return response.choices[0].message.content.strip()
+
+    def _build_messages(
+        self, prompt: PromptSegments, history: List[Message], session_id: Optional[str], history_offset: int = 0
+    ) -> List[Dict]:
+        # Construct messages most-stable first so the provider's prefix cache keeps matching:
+        # persona (never changes) → today (daily) → rolling summary → history → context → new turn.
+        # We assume history is [User, Assistant, User...] ending on the new user turn.
+        summary, recent = history_compactor.compact(session_id, history, self.summarize_history, history_offset)
+
+        final_messages = [
+            {"role": "system", "content": prompt.static},
+            {"role": "system", "content": prompt.daily},
+        ]
+        if summary:
+            final_messages.append({"role": "system", "content": f"EARLIER CONVERSATION (summary):\n{summary}"})
+        tail = recent[-1:] if recent and recent[-1].role == "user" else []
+        for m in recent[:len(recent) - len(tail)]:
+            # Ensure strict role/content structure
+            final_messages.append({"role": m.role, "content": m.content})
+        if prompt.context:
+            # Changes every turn, so it sits after the cacheable history
+            final_messages.append({"role": "system", "content": prompt.context})
+        for m in tail:
+            final_messages.append({"role": m.role, "content": m.content})
+        return final_messages
+
+    def _log_usage(self, label: str, usage: Any, model: Optional[str] = None):
+        """Logs and counts prompt/cached/completion tokens so prefix-cache hit rates are visible."""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        prompt = usage.prompt_tokens or 0
+        ratio = (cached / prompt) if prompt else 0.0
+        model = model or self.deployment
+        LLM_TOKENS.inc(prompt, model=model, call=label, direction="in")
+        LLM_TOKENS.inc(cached, model=model, call=label, direction="cached")
+        LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, call=label, direction="out")
+        logger.info(
+            f"[Usage] {label}: prompt={prompt} cached={cached} ({ratio:.0%}) "
+            f"completion={usage.completion_tokens or 0}"
+        )
+
     def answer_completion(
         self, 
-        system_msg: str, 
+        prompt: PromptSegments, 
         history: List[Message], 
-        tools: Optional[List[Dict]] = None
+        tools: Optional[List[Dict]] = None,
+        session_id: Optional[str] = None,
+        history_offset: int = 0
     ) -> Any:
         """
-        Generates answer using full history + optionally calls tools.
+        Generates answer using budgeted history + optionally calls tools.
         Returns clean content string OR tool_calls object.
         """
-        # Construct messages: System + History (excluding old systems if any)
-        # We assume history comes from frontend as [User, Assistant, User...]
-        # We prepend our fresh System Prompt.
-        
-        final_messages = [{"role": "system", "content": system_msg}]
-        for m in history:
-            # Ensure strict role/content structure
-            final_messages.append({"role": m.role, "content": m.content})
+        final_messages = self._build_messages(prompt, history, session_id, history_offset)
             
         try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=final_messages,
-                temperature=0.3,
-                tools=tools,
-                tool_choice="auto" if tools else None
+            def call(p: Provider):
+                response = p.client.chat.completions.create(
+                    model=p.deployment,
+                    messages=final_messages,
+                    temperature=0.3,
+                    tools=tools,
+                    tool_choice="auto" if tools else None
+                )
+                self._log_usage("answer", response.usage, p.deployment)
+                return response
+
+            response = self.providers.call(
+                call, "answer", priority=PRIORITY_CHAT,
+                tokens=_estimate_tokens(final_messages, Config.LLM_COMPLETION_TOKEN_ESTIMATE)
             )
-            
             message = response.choices[0].message
             
             # Check for tool usage
@@ -165,67 +347,92 @@ class LLMService:
             
         except Exception as e:
             logger.error(f"Answer completion failed: {e}")
-            return "I apologize, but I am having trouble connecting. Please try again."
+            return FALLBACK_ANSWER
 
-    def stream_answer_completion(
+    def _consume_stream_chunk(self, chunk: Any, tool_calls_buffer: Dict[int, Dict], model: str) -> Optional[str]:
+        """Returns the chunk's text, if any; tool-call fragments are accumulated into the buffer."""
+        if getattr(chunk, "usage", None):
+            # Final chunk (include_usage) carries usage and no choices
+            self._log_usage("stream", chunk.usage, model)
+        delta = chunk.choices[0].delta if chunk.choices else None
+        if not delta:
+            return None
+
+        # Tool call chunks (accumulated)
+        if delta.tool_calls:
+            for tc in delta.tool_calls:
+                idx = tc.index
+                if idx not in tool_calls_buffer:
+                    tool_calls_buffer[idx] = {
+                        "id": tc.id or "",
+                        "function": {"name": "", "arguments": ""}
+                    }
+                if tc.id:
+                    tool_calls_buffer[idx]["id"] = tc.id
+                if tc.function:
+                    if tc.function.name:
+                        tool_calls_buffer[idx]["function"]["name"] = tc.function.name
+                    if tc.function.arguments:
+                        tool_calls_buffer[idx]["function"]["arguments"] += tc.function.arguments
+
+        # Text content
+        return delta.content
+
+    async def astream_answer_completion(
         self, 
-        system_msg: str, 
+        prompt: PromptSegments, 
         history: List[Message], 
-        tools: Optional[List[Dict]] = None
-    ) -> Generator[str, None, None]:
+        tools: Optional[List[Dict]] = None,
+        session_id: Optional[str] = None,
+        history_offset: int = 0
+    ) -> AsyncGenerator[str, None]:
         """
-        Streams answer tokens as they arrive from OpenAI.
-        Yields text chunks for SSE streaming to the frontend.
-        If a tool call is detected, yields the full tool call as JSON at the end.
+        Streams answer tokens as they arrive; a tool call is yielded at the end as a
+        __TOOL_CALLS__ marker. Closing or cancelling the generator closes the upstream
+        HTTP stream, so a departed client stops token generation (and billing) instead
+        of draining the completion to the end. A failure — before or after tokens have
+        flowed — raises, so the caller knows the reply is incomplete.
         """
-        final_messages = [{"role": "system", "content": system_msg}]
-        for m in history:
-            final_messages.append({"role": m.role, "content": m.content})
-            
-        try:
-            response = self.client.chat.completions.create(
-                model=self.deployment,
+        # History compaction may call the LLM for a summary — keep it off the event loop
+        final_messages = await asyncio.to_thread(self._build_messages, prompt, history, session_id, history_offset)
+
+        async def create(p: Provider):
+            return p, await p.async_client.chat.completions.create(
+                model=p.deployment,
                 messages=final_messages,
                 temperature=0.3,
                 tools=tools,
                 tool_choice="auto" if tools else None,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True} if p.stream_usage_supported else NOT_GIVEN
             )
-            
+
+        response = None
+        try:
+            # Retries and failover cover opening the stream; once tokens flow there's no switching
+            provider, response = await self.providers.acall(
+                create, "stream", priority=PRIORITY_CHAT,
+                tokens=_estimate_tokens(final_messages, Config.LLM_COMPLETION_TOKEN_ESTIMATE)
+            )
+
             tool_calls_buffer = {}  # Accumulate tool call chunks
-            
-            for chunk in response:
-                delta = chunk.choices[0].delta if chunk.choices else None
-                if not delta:
-                    continue
-                    
-                # Text content
-                if delta.content:
-                    yield delta.content
-                
-                # Tool call chunks (accumulated)
-                if delta.tool_calls:
-                    for tc in delta.tool_calls:
-                        idx = tc.index
-                        if idx not in tool_calls_buffer:
-                            tool_calls_buffer[idx] = {
-                                "id": tc.id or "",
-                                "function": {"name": "", "arguments": ""}
-                            }
-                        if tc.id:
-                            tool_calls_buffer[idx]["id"] = tc.id
-                        if tc.function:
-                            if tc.function.name:
-                                tool_calls_buffer[idx]["function"]["name"] = tc.function.name
-                            if tc.function.arguments:
-                                tool_calls_buffer[idx]["function"]["arguments"] += tc.function.arguments
-            
+
+            async for chunk in response:
+                text = self._consume_stream_chunk(chunk, tool_calls_buffer, provider.deployment)
+                if text:
+                    yield text
+
             # If tool calls were accumulated, yield them as a special marker
             if tool_calls_buffer:
                 yield f"\n__TOOL_CALLS__{json.dumps(list(tool_calls_buffer.values()))}"
-                
+
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Stream answer completion failed: {e}")
-            yield "I apologize, but I am having trouble connecting. Please try again."
+            logger.error(f"Async stream answer completion failed: {e}")
+            raise
+        finally:
+            if response is not None:
+                await response.close()
 
 llm_service = LLMService()
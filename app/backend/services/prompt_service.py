@@ -0,0 +1,40 @@
+import threading
+from datetime import date, datetime
+from typing import Optional, Tuple
+
+from app.backend.models import PromptSegments
+
+class PromptBuilder:
+    """
+    Assembles the answer prompt from ordered segments. The persona never changes, so
+    every request shares it byte-for-byte as a cacheable prefix; the date-dependent
+    segment is rendered once per day and the retrieved context comes last.
+    """
+
+    def __init__(self, persona: str):
+        self.persona = persona.strip()
+        self._daily: Optional[Tuple[date, str]] = None
+        self._lock = threading.Lock()
+
+    def daily(self) -> str:
+        today = datetime.now().date()
+        cached = self._daily
+        if cached is None or cached[0] != today:
+            with self._lock:
+                if self._daily is None or self._daily[0] != today:
+                    self._daily = (today, self._render_daily(today))
+                cached = self._daily
+        return cached[1]
+
+    @staticmethod
+    def _render_daily(today: date) -> str:
+        return (
+            "### TODAY\n"
+            f"- **TODAY IS**: {today.strftime('%B %d, %Y')}.\n"
+            f"- Unqualified months and \"this/next month\" refer to {today.year} or later; "
+            f"the Timeline field always carries the year (e.g. {today.strftime('%B %Y')})."
+        )
+
+    def build(self, context_text: str = "") -> PromptSegments:
+        context = f"CONTEXT:\n{context_text}" if context_text else ""
+        return PromptSegments(static=self.persona, daily=self.daily(), context=context)
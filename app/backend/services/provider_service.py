@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from openai import (
+    APIConnectionError, APIStatusError, APITimeoutError, AsyncAzureOpenAI, AsyncOpenAI, AzureOpenAI,
+    InternalServerError, OpenAI, RateLimitError,
+)
+
+from app.backend.config import Config
+from app.backend.services.metrics_service import metrics
+from app.backend.services.scheduler_service import PRIORITY_CHAT, RateLimitTimeout, rate_scheduler
+
+logger = logging.getLogger(__name__)
+
+try:
+    import httpx
+except ImportError:  # The SDK's own transport still works, just without our pool settings
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+LLM_RETRIES = metrics.counter(
+    "palmx_llm_retries_total", "Provider calls retried after a transient error.", ("provider", "call"))
+LLM_FAILOVERS = metrics.counter(
+    "palmx_llm_failovers_total", "Calls served by a secondary provider.", ("provider", "call"))
+
+
+class ProviderUnavailable(Exception):
+    """Every provider is failing or has its circuit open."""
+
+
+class CircuitBreaker:
+    """
+    closed → (LLM_BREAKER_FAILURES consecutive failed calls) → open → (cooldown) →
+    half-open: a single probe call; success closes, failure re-opens.
+    """
+
+    def __init__(self, failures: int, cooldown_seconds: float):
+        self.threshold = failures
+        self.cooldown_seconds = cooldown_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.cooldown_seconds:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def settle(self, error: Exception):
+        """A non-transient error: an HTTP answer proves the provider is up; anything else is neutral."""
+        if isinstance(error, APIStatusError):
+            self.record_success()
+        else:
+            with self._lock:
+                self._probing = False
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+            return not was_open and self.opened_at is not None
+
+
+class Provider:
+    def __init__(self, name: str, client: Any, async_client: Any, deployment: str, embed_deployment: str):
+        self.name = name
+        self.client = client
+        self.async_client = async_client
+        self.deployment = deployment
+        self.embed_deployment = embed_deployment
+        self.breaker = CircuitBreaker(Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_COOLDOWN_SECONDS)
+
+    @property
+    def stream_usage_supported(self) -> bool:
+        """stream_options.include_usage: OpenAI always, Azure from API version 2024-09-01-preview."""
+        return self.name == "openai" or Config.AZURE_OPENAI_API_VERSION >= "2024-09-01"
+
+
+def _retryable(e: Exception) -> bool:
+    """Connection problems, timeouts, 429 and 5xx; other 4xx mean the request itself is wrong."""
+    if isinstance(e, (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)):
+        return True
+    return isinstance(e, APIStatusError) and e.status_code in (408, 409)
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff; a 429's Retry-After wins if it is longer."""
+    delay = random.uniform(0, min(Config.LLM_RETRY_MAX_SECONDS, Config.LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        delay = max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        pass
+    return min(delay, Config.LLM_RETRY_MAX_SECONDS)
+
+
+def _http_clients():
+    """One pooled sync and one async httpx client, shared by every provider's SDK client."""
+    if httpx is None:
+        logger.warning("httpx not importable — LLM clients use the SDK's default transport")
+        return None, None
+    http2 = Config.LLM_HTTP2 and _HTTP2_AVAILABLE
+    if Config.LLM_HTTP2 and not http2:
+        logger.warning("HTTP/2 requested but the 'h2' package is missing — using HTTP/1.1")
+    limits = httpx.Limits(
+        max_connections=Config.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=Config.LLM_HTTP_KEEPALIVE_SECONDS,
+    )
+    timeout = httpx.Timeout(Config.LLM_READ_TIMEOUT_SECONDS, connect=Config.LLM_CONNECT_TIMEOUT_SECONDS)
+    return (
+        httpx.Client(limits=limits, timeout=timeout, http2=http2),
+        httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2),
+    )
+
+
+def _timeout():
+    if httpx is None:
+        return Config.LLM_READ_TIMEOUT_SECONDS
+    return httpx.Timeout(Config.LLM_READ_TIMEOUT_SECONDS, connect=Config.LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+class ProviderPool:
+    """
+    Configured providers in priority order (Azure, then OpenAI). Each call goes to the
+    first provider whose circuit is closed, retried with jittered backoff on transient
+    errors; when its retries are exhausted (or its circuit is open) the call fails
+    over to the next provider. SDK-level retries are off so attempts aren't multiplied.
+    Every attempt first waits for rate-limit capacity on the deployment it will hit
+    (see RateScheduler); a queue timeout moves on to the next provider without
+    counting against the circuit.
+    """
+
+    def __init__(self):
+        self.providers: List[Provider] = []
+        sync_http, async_http = _http_clients()
+        common = {"max_retries": 0, "timeout": _timeout()}
+
+        if Config.AZURE_OPENAI_API_KEY and Config.AZURE_OPENAI_ENDPOINT:
+            try:
+                azure = {
+                    "api_key": Config.AZURE_OPENAI_API_KEY,
+                    "api_version": Config.AZURE_OPENAI_API_VERSION,
+                    "azure_endpoint": Config.AZURE_OPENAI_ENDPOINT,
+                    **common,
+                }
+                self.providers.append(Provider(
+                    "azure",
+                    AzureOpenAI(**azure, http_client=sync_http),
+                    AsyncAzureOpenAI(**azure, http_client=async_http),
+                    Config.AZURE_OPENAI_CHAT_DEPLOYMENT,
+                    Config.AZURE_OPENAI_EMBED_DEPLOYMENT,
+                ))
+            except Exception as e:
+                logger.warning(f"Failed to init Azure OpenAI: {e}")
+
+        if Config.OPENAI_API_KEY:
+            self.providers.append(Provider(
+                "openai",
+                OpenAI(api_key=Config.OPENAI_API_KEY, http_client=sync_http, **common),
+                AsyncOpenAI(api_key=Config.OPENAI_API_KEY, http_client=async_http, **common),
+                Config.OPENAI_MODEL,
+                Config.OPENAI_EMBED_MODEL,
+            ))
+
+    @property
+    def primary(self) -> Optional[Provider]:
+        return self.providers[0] if self.providers else None
+
+    def _candidates(self, failover: bool) -> List[Provider]:
+        return self.providers if failover else self.providers[:1]
+
+    def _failed(self, provider: Provider, label: str, error: Exception):
+        if provider.breaker.record_failure():
+            logger.error(f"Circuit opened for {provider.name} after {provider.breaker.failures} failed {label} calls: {error}")
+        else:
+            logger.warning(f"{provider.name} {label} call failed: {error}")
+
+    def _served(self, provider: Provider, label: str):
+        provider.breaker.record_success()
+        if provider is not self.primary:
+            LLM_FAILOVERS.inc(provider=provider.name, call=label)
+
+    def call(
+        self, fn: Callable[[Provider], Any], label: str, failover: bool = True,
+        priority: int = PRIORITY_CHAT, tokens: float = 0, embedding: bool = False
+    ) -> Any:
+        """`tokens` is the TPM estimate; `embedding` selects the embedding deployment's limits."""
+        last_error: Optional[Exception] = None
+        for provider in self._candidates(failover):
+            if not provider.breaker.allow():
+                continue
+            deployment = provider.embed_deployment if embedding else provider.deployment
+            for attempt in range(Config.LLM_MAX_RETRIES + 1):
+                try:
+                    rate_scheduler.acquire(deployment, tokens, priority)
+                except RateLimitTimeout as e:
+                    provider.breaker.settle(e)
+                    last_error = e
+                    break
+                try:
+                    result = fn(provider)
+                except Exception as e:
+                    if not _retryable(e):
+                        provider.breaker.settle(e)  # The request was the problem, not the provider
+                        raise
+                    last_error = e
+                    if attempt < Config.LLM_MAX_RETRIES:
+                        LLM_RETRIES.inc(provider=provider.name, call=label)
+                        time.sleep(_backoff(attempt, e))
+                    continue
+                self._served(provider, label)
+                return result
+            if not isinstance(last_error, RateLimitTimeout):
+                self._failed(provider, label, last_error)
+        raise last_error or ProviderUnavailable(f"No LLM provider available for {label}")
+
+    async def acall(
+        self, fn: Callable[[Provider], Awaitable[Any]], label: str, failover: bool = True,
+        priority: int = PRIORITY_CHAT, tokens: float = 0, embedding: bool = False
+    ) -> Any:
+        """Async twin of call(); queueing and backoff sleeps don't block the event loop."""
+        last_error: Optional[Exception] = None
+        for provider in self._candidates(failover):
+            if not provider.breaker.allow():
+                continue
+            deployment = provider.embed_deployment if embedding else provider.deployment
+            for attempt in range(Config.LLM_MAX_RETRIES + 1):
+                try:
+                    await rate_scheduler.aacquire(deployment, tokens, priority)
+                except RateLimitTimeout as e:
+                    provider.breaker.settle(e)
+                    last_error = e
+                    break
+                try:
+                    result = await fn(provider)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not _retryable(e):
+                        provider.breaker.settle(e)
+                        raise
+                    last_error = e
+                    if attempt < Config.LLM_MAX_RETRIES:
+                        LLM_RETRIES.inc(provider=provider.name, call=label)
+                        await asyncio.sleep(_backoff(attempt, e))
+                    continue
+                self._served(provider, label)
+                return result
+            if not isinstance(last_error, RateLimitTimeout):
+                self._failed(provider, label, last_error)
+        raise last_error or ProviderUnavailable(f"No LLM provider available for {label}")
+
+
+provider_pool = ProviderPool()
+
+LLM_BREAKER_OPEN = metrics.gauge(
+    "palmx_llm_circuit_open", "1 while a provider's circuit breaker is open.", ("provider",),
+    collect=lambda: {(p.name,): 1 if p.breaker.is_open else 0 for p in provider_pool.providers})
@@ -5,18 +5,29 @@ import logging
 import numpy as np
 import faiss
 from rapidfuzz import process, fuzz
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from app.backend.config import Config
 from app.backend.services.llm_service import llm_service
 from app.backend.services.kb_service import kb_service
 from app.backend.models import Project
+from app.backend.services.timing_service import StageTimer, timed
+from app.backend.services.metrics_service import metrics
+from app.backend.retrieval.embeddings import HashedSVDEmbedder
+from app.backend.retrieval.ann import build_ann_index, configure_search, index_metric, prepare_vectors, rerank, to_similarity
 
 logger = logging.getLogger(__name__)
 
+# Bump when the index layout changes so existing indexes get rebuilt
+INDEX_SCHEMA = 2  # 2: one vector per card/zone/listing group/FAQ/phase
+
 class RAGService:
     def __init__(self):
         self.index = None
         self.metadata = [] # List of dicts matching index order
+        self.chunk_projects = np.empty(0, dtype=np.int64) # Vector row → position in self.project_ids
+        self.project_ids: List[str] = []
+        self.raw_vectors = None # Memory-mapped vectors.npy for exact re-ranking of quantized hits
+        self.index_info: Dict[str, Any] = {} # Which embedding backend built the index
         self.is_ready = False
         self._load_index()
 
@@ -42,7 +53,12 @@ class RAGService:
             os.path.exists(hash_path)):
             with open(hash_path, 'r') as f:
                 stored_hash = f.read().strip()
-            if stored_hash == current_hash:
+            if stored_hash == current_hash and self._index_info_current():
+                info = self._read_index_info()
+                if (info.get("index_type", "flat_l2"), info.get("quantization", "none")) != \
+                        (Config.FAISS_INDEX_TYPE, Config.FAISS_QUANTIZATION):
+                    # Same vectors, different ANN structure — rebuild from disk without re-embedding
+                    self._reindex_from_vectors()
                 logger.info(f"✅ Index up-to-date (hash={current_hash}). Skipping rebuild — zero API calls.")
                 if not self.is_ready:
                     self._load_index()
@@ -50,7 +66,8 @@ class RAGService:
 
         # KB changed or first time → rebuild
         logger.info(f"🔨 KB changed or first run (hash={current_hash}). Building index...")
-        self.build_index()
+        if not self.build_index():
+            return
 
         # Persist the hash
         with open(hash_path, 'w') as f:
@@ -61,8 +78,21 @@ class RAGService:
         if os.path.exists(Config.INDEX_PATH) and os.path.exists(Config.META_PATH):
             try:
                 self.index = faiss.read_index(Config.INDEX_PATH)
+                configure_search(self.index)
                 with open(Config.META_PATH, 'r') as f:
                     self.metadata = json.load(f)
+                self.index_info = {"embedding_backend": "provider"} # Indexes predating index_info.json
+                if os.path.exists(Config.INDEX_INFO_PATH):
+                    with open(Config.INDEX_INFO_PATH, 'r') as f:
+                        self.index_info = json.load(f)
+                if self.index_info["embedding_backend"] == "local":
+                    llm_service.local_embedder = HashedSVDEmbedder.load(Config.LOCAL_EMBEDDER_PATH)
+                self.raw_vectors = None
+                if self.index_info.get("quantization", "none") != "none" and os.path.exists(Config.VECTORS_PATH):
+                    self.raw_vectors = np.load(Config.VECTORS_PATH, mmap_mode="r")
+                self.project_ids = sorted({m['project_id'] for m in self.metadata})
+                positions = {pid: i for i, pid in enumerate(self.project_ids)}
+                self.chunk_projects = np.array([positions[m['project_id']] for m in self.metadata], dtype=np.int64)
                 self.is_ready = True
                 logger.info("RAG Index loaded successfully.")
             except Exception as e:
@@ -70,125 +100,381 @@ class RAGService:
         else:
             logger.warning("RAG Index not found. Run build_index.py first.")
 
-    def search(self, query: str, k: int = 3, filters: Dict = None) -> List[Dict[str, Any]]:
+    def search(
+        self, query: str, k: int = 3, filters: Dict = None, timer: StageTimer = None, embedding: List[float] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Hybrid search: FAISS embedding + RapidFuzz re-ranking/matching
+        Hybrid search: FAISS embedding + BM25 lexical + RapidFuzz entity matching
+        Pass `embedding` (from embed_query) to reuse a query vector already computed.
         """
+        embeddings = [embedding] if embedding is not None else None
+        return self.search_batch([(query, k, filters)], timer=timer, embeddings=embeddings)[0]
+
+    @property
+    def kb_version(self) -> str:
+        """Hash of the KB the loaded index was built from."""
+        return str(self.index_info.get("kb_hash", "")) or self._compute_kb_hash()
+
+    def embed_query(self, query: str, timer: StageTimer = None) -> List[float]:
+        """Query vector in the index's embedding space; [] if there is no index or embedding failed."""
         if not self.is_ready:
-            # Fallback to pure rapidfuzz on loaded KB if index missing
-            return self._fallback_search(query, k)
+            return []
+        with timed(timer, "embedding"):
+            return llm_service.get_embeddings([query], backend=self.index_info["embedding_backend"])[0]
 
-        # 1. Embedding Search
-        q_emb = llm_service.get_embedding(query)
-        if not q_emb or len(q_emb) == 0:
-            return self._fallback_search(query, k)
+    def resolve_entities(self, entities: List[str]) -> List[Dict[str, Any]]:
+        """
+        Direct path for turns that name their projects ("compare Badya and Hacienda Bay").
+        Resolves every router entity through the KB name index; returns results shaped
+        like search() only if *all* of them resolve confidently, else [] so the caller
+        falls back to hybrid search. No embedding call, no FAISS.
+        """
+        if not entities:
+            return []
+        matches = {}
+        for name in entities:
+            match = kb_service.resolve_entity(name)
+            if match is None:
+                return []
+            pid, confidence = match
+            matches.setdefault(pid, confidence / 100.0)
+        return self.results_for_projects(matches, "entity")[:Config.RAG_ENTITY_MAX]
+
+    def list_projects(self, filters: Dict = None, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Default listing for broad turns that no retriever scores well ("show me all properties"):
+        every KB project passing the router filters, in KB order, shaped like search().
+        """
+        limit = limit or Config.RAG_LISTING_MAX
+        pids = [pid for pid, p in kb_service.projects.items() if self._passes_filters(p, filters)]
+        return self.results_for_projects({pid: Config.RAG_MIN_RELEVANCE for pid in pids[:limit]}, "listing")
+
+    def results_for_projects(self, scores: Dict[str, float], source: str) -> List[Dict[str, Any]]:
+        """search()-shaped results for known project_ids; no chunks, so the full card is the context."""
+        results = []
+        for pid, score in scores.items():
+            proj = kb_service.get_project(pid)
+            if proj:
+                results.append({"project": proj, "score": round(score, 4), "source": source, "chunks": []})
+        return results
+
+    def search_batch(
+        self, requests: List[Tuple[str, int, Dict]], timer: StageTimer = None, embeddings: List[List[float]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Hybrid search for many (query, k, filters) at once: one embedding call and one
+        matrix FAISS search for the whole batch; the local retrievers run per query.
+        Returns one result list per request, in order, shaped like search().
+        Stage times (embedding, faiss, bm25, fuzzy, fusion) go to `timer` when given.
+        """
+        faiss_by_row: Dict[int, Tuple[str, List[Tuple[str, float]], Dict[str, List[Dict[str, Any]]]]] = {}
+
+        # 1. Embedding Search (skipped if the index is missing or the embedding failed)
+        if self.is_ready and requests:
+            backend = self.index_info["embedding_backend"]
+            if embeddings is None:
+                with timed(timer, "embedding"):
+                    embeddings = llm_service.get_embeddings([r[0] for r in requests], backend=backend)
+            live = [i for i, e in enumerate(embeddings) if e and any(e)]
+            if live:
+                # Local LSA similarities live on a different scale, so they calibrate separately
+                source = "faiss" if backend == "provider" else "faiss_local"
+                with timed(timer, "faiss"):
+                    Q = prepare_vectors(np.array([embeddings[i] for i in live]), self.index_info.get("index_type", "flat_l2"))
+                    per_row = self._search_chunks(Q, [requests[i][1] * 2 for i in live]) # Get more for filtering
+                for i, (hits, evidence) in zip(live, per_row):
+                    faiss_by_row[i] = (source, hits, evidence)
 
-        D, I = self.index.search(np.array([q_emb], dtype=np.float32), k * 2) # Get more for filtering
-        
-        candidates = []
-        seen_ids = set()
-        
-        # Collect FAISS candidates
-        for idx in I[0]:
-            if idx < 0 or idx >= len(self.metadata): continue
-            meta = self.metadata[idx]
-            pid = meta['project_id']
-            if pid not in seen_ids:
-                proj = kb_service.get_project(pid)
-                if proj:
-                    candidates.append({"project": proj, "score": 0.0, "source": "faiss"})
-                    seen_ids.add(pid)
-
-        # 2. RapidFuzz Search (Entity Matching)
         all_ids = list(kb_service.projects.keys())
-        fuzzy_matches = process.extract(
-            query, 
-            all_ids, 
-            scorer=fuzz.WRatio, 
-            limit=k, 
-            score_cutoff=60
-        )
-        for match in fuzzy_matches:
+        results = []
+        for i, (query, k, filters) in enumerate(requests):
+            # Each retriever contributes a ranked list of (project_id, raw score)
+            hits_by_source: Dict[str, List[Tuple[str, float]]] = {}
+            chunk_evidence: Dict[str, List[Dict[str, Any]]] = {}
+            if i in faiss_by_row:
+                source, hits_by_source[source], chunk_evidence = faiss_by_row[i]
+
+            # 2. BM25 over cards, amenities, zones, units and FAQ text (local, no network)
+            with timed(timer, "bm25"):
+                hits_by_source["bm25"] = kb_service.lexical_search(query, k * 2)
+
+            # 3. RapidFuzz Search (Entity Matching)
+            with timed(timer, "fuzzy"):
+                fuzzy_matches = process.extract(
+                    query, 
+                    all_ids, 
+                    scorer=fuzz.WRatio, 
+                    limit=k, 
+                    score_cutoff=60
+                )
             # match is (match_string, score, index)
-            pid = match[0]
-            if pid not in seen_ids:
-                proj = kb_service.get_project(pid)
-                if proj:
-                    candidates.append({"project": proj, "score": match[1]/100.0, "source": "fuzzy"})
-                    seen_ids.add(pid)
-
-        # 3. Apply Filters
-        filtered = []
-        for c in candidates:
-            p = c['project']
-            if filters:
-                # Region Filter (Check both region and city_area)
-                if filters.get('region'):
-                    region_val = (p.region or '').lower()
-                    city_val = (p.city_area or '').lower()
-                    target_region = filters['region'].lower()
-                    if target_region not in region_val and target_region not in city_val and region_val not in target_region:
-                        continue
-                
-                # Project Type Filter
-                if filters.get('project_type'):
-                    p_type = (p.project_type or '').lower()
-                    target_type = filters['project_type'].lower()
-                    if target_type == 'commercial' and p_type != 'commercial':
-                        continue
-                    if target_type == 'residential' and p_type != 'residential':
-                        continue
+            hits_by_source["fuzzy"] = [(match[0], match[1] / 100.0) for match in fuzzy_matches]
+
+            # 4. Fuse, apply filters and the relevance cutoff
+            with timed(timer, "fusion"):
+                results.append(self._fuse(hits_by_source, k, filters, chunk_evidence))
+        return results
+
+    def _search_chunks(
+        self, Q: np.ndarray, ks: List[int]
+    ) -> List[Tuple[List[Tuple[str, float]], Dict[str, List[Dict[str, Any]]]]]:
+        """
+        Chunk-level FAISS search for a matrix of queries, aggregated back to projects.
+        Per query row returns ranked [(project_id, best chunk similarity)] and, per project,
+        its best-matching chunks. Ranking uses max-sim or sum-sim (RAG_CHUNK_AGGREGATION).
+        """
+        ns = [min(self.index.ntotal, k * Config.RAG_CHUNK_FANOUT) for k in ks]
+        factor = 1 if self.raw_vectors is None else Config.FAISS_RERANK_FACTOR
+        D, I = self.index.search(Q, min(self.index.ntotal, max(ns) * factor))
+        return [self._aggregate_row(Q[r], D[r, :n * factor], I[r, :n * factor], n, k)
+                for r, (n, k) in enumerate(zip(ns, ks))]
+
+    def _aggregate_row(
+        self, q: np.ndarray, dists: np.ndarray, ids: np.ndarray, n: int, k: int
+    ) -> Tuple[List[Tuple[str, float]], Dict[str, List[Dict[str, Any]]]]:
+        valid = (ids >= 0) & (ids < len(self.metadata))
+        rows = ids[valid]
+        if not rows.size:
+            return [], {}
+        if self.raw_vectors is None:
+            sims = to_similarity(dists[valid], self.index_info.get("metric", "l2"))
+        else:
+            # Quantized scores are approximate: re-score candidates exactly, keep the best n
+            sims = rerank(q, rows, self.raw_vectors)
+            order = np.argsort(-sims, kind="stable")[:n]
+            rows, sims = rows[order], sims[order]
+        owners = self.chunk_projects[rows]
 
-                # Project Status Filter
-                if filters.get('project_status'):
-                    status_val = (p.project_status or '').lower()
-                    target_status = filters['project_status'].lower()
-                    if target_status not in status_val:
+        # FAISS returns hits best-first, so each project's first row is its max-sim chunk
+        uniq, first = np.unique(owners, return_index=True)
+        best = np.zeros(len(self.project_ids))
+        best[uniq] = sims[first]
+        if Config.RAG_CHUNK_AGGREGATION == "sum":
+            rank_key = np.bincount(owners, weights=sims, minlength=len(self.project_ids))
+        else:
+            rank_key = best
+        ranked = uniq[np.argsort(-rank_key[uniq], kind="stable")][:k]
+
+        hits = [(self.project_ids[p], round(float(best[p]), 4)) for p in ranked]
+        evidence = {}
+        for p in ranked:
+            chunk_rows = rows[owners == p][:Config.RAG_CHUNKS_PER_PROJECT]
+            evidence[self.project_ids[p]] = [self.metadata[r] for r in chunk_rows]
+        return hits, evidence
+
+    def _fuse(
+        self,
+        hits_by_source: Dict[str, List[Tuple[str, float]]],
+        k: int,
+        filters: Dict = None,
+        chunk_evidence: Dict[str, List[Dict[str, Any]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Combines per-retriever hits into one ranking.
+        Every raw score is calibrated to [0, 1] per source and weighted; a project's
+        relevance is the probabilistic OR of its weighted evidence, so agreement between
+        retrievers reinforces a hit. Ranking uses that relevance ("weighted") or
+        reciprocal-rank fusion ("rrf"). Projects below RAG_MIN_RELEVANCE are dropped,
+        which leaves off-topic turns with no context at all (broad listing turns fall back
+        to list_projects()).
+        """
+        fused: Dict[str, Dict[str, Any]] = {}
+        for source, hits in hits_by_source.items():
+            weight = Config.RAG_SOURCE_WEIGHTS.get(source, 1.0)
+            for rank, (pid, raw) in enumerate(hits):
+                entry = fused.get(pid)
+                if entry is None:
+                    proj = kb_service.get_project(pid)
+                    if not proj or not self._passes_filters(proj, filters):
                         continue
+                    entry = fused[pid] = {"project": proj, "miss": 1.0, "rrf": 0.0, "sources": []}
+                if source in entry["sources"]:
+                    continue  # Only a source's best-ranked hit per project counts
+                entry["miss"] *= 1.0 - weight * self._calibrate(source, raw)
+                entry["rrf"] += weight / (Config.RAG_RRF_K + rank + 1)
+                entry["sources"].append(source)
+
+        results = []
+        for entry in fused.values():
+            relevance = round(1.0 - entry["miss"], 4)
+            if relevance < Config.RAG_MIN_RELEVANCE:
+                continue
+            results.append({
+                "project": entry["project"],
+                "score": relevance,
+                "source": "+".join(entry["sources"]),
+                "chunks": (chunk_evidence or {}).get(entry["project"].project_id, []),
+                "_rank_key": entry["rrf"] if Config.RAG_FUSION_METHOD == "rrf" else relevance,
+            })
+
+        results.sort(key=lambda r: r["_rank_key"], reverse=True)
+        for r in results:
+            del r["_rank_key"]
+        return results[:k]
+
+    def _score_bounds(self, source: str) -> Tuple[float, float]:
+        """(floor, ceiling) for a retriever; FAISS similarities are banded by the index's embedding model."""
+        if source == "faiss":
+            model = str(self.index_info.get("embedding_model") or "")
+            for name, bounds in Config.RAG_FAISS_MODEL_BOUNDS.items():
+                if name in model:
+                    return bounds
+        return Config.RAG_SCORE_BOUNDS.get(source, (0.0, 1.0))
+
+    def _calibrate(self, source: str, raw: float) -> float:
+        """Map a retriever's raw score onto [0, 1] using its configured floor/ceiling."""
+        floor, ceil = self._score_bounds(source)
+        if ceil <= floor:
+            return 1.0 if raw >= ceil else 0.0
+        return min(1.0, max(0.0, (raw - floor) / (ceil - floor)))
+
+    @staticmethod
+    def _passes_filters(p: Project, filters: Dict = None) -> bool:
+        if not filters:
+            return True
+
+        # Region Filter (Check both region and city_area)
+        if filters.get('region'):
+            region_val = (p.region or '').lower()
+            city_val = (p.city_area or '').lower()
+            target_region = filters['region'].lower()
+            if target_region not in region_val and target_region not in city_val and region_val not in target_region:
+                return False
+        
+        # Project Type Filter
+        if filters.get('project_type'):
+            p_type = (p.project_type or '').lower()
+            target_type = filters['project_type'].lower()
+            if target_type == 'commercial' and p_type != 'commercial':
+                return False
+            if target_type == 'residential' and p_type != 'residential':
+                return False
 
-            filtered.append(c)
+        # Project Status Filter
+        if filters.get('project_status'):
+            status_val = (p.project_status or '').lower()
+            target_status = filters['project_status'].lower()
+            if target_status not in status_val:
+                return False
 
-        # Return top k
-        return filtered[:k]
+        return True
 
-    def _fallback_search(self, query: str, k: int) -> List[Dict[str, Any]]:
-        # Simple name text search using kb_service
-        matches = kb_service.search_projects(query)
-        return [{"project": p, "score": 1.0, "source": "basic"} for p in matches[:k]]
+    def _read_index_info(self) -> Dict[str, Any]:
+        if not os.path.exists(Config.INDEX_INFO_PATH):
+            return {}
+        with open(Config.INDEX_INFO_PATH, 'r') as f:
+            return json.load(f)
 
-    def build_index(self):
+    def _index_info_current(self) -> bool:
+        """False when the stored index predates INDEX_SCHEMA or was built by a backend Config no longer asks for."""
+        info = self._read_index_info()
+        if info.get("schema") != INDEX_SCHEMA:
+            return False
+        built_with = info.get("embedding_backend")
+        if Config.EMBEDDING_BACKEND == "auto":
+            # A local index from an earlier outage gets retried against the provider
+            return built_with == "provider"
+        return built_with == Config.EMBEDDING_BACKEND
+
+    def _embed_corpus(self, texts: List[str]) -> Tuple[List[list], str, str]:
+        """Embeds index documents; returns (embeddings, backend, model)."""
+        if Config.EMBEDDING_BACKEND in ("provider", "auto"):
+            try:
+                return llm_service.embed_documents(texts), "provider", llm_service.embed_deployment
+            except Exception as e:
+                if Config.EMBEDDING_BACKEND == "provider":
+                    raise
+                logger.warning(f"Provider embeddings unavailable ({e}); building with the local backend.")
+
+        embedder = HashedSVDEmbedder(dim=Config.LOCAL_EMBED_DIM).fit(texts)
+        embedder.save(Config.LOCAL_EMBEDDER_PATH)
+        llm_service.local_embedder = embedder
+        return embedder.embed_many(texts), "local", embedder.name
+
+    def build_index(self) -> bool:
         """
-        Generates embeddings for all projects and saves to disk.
+        Embeds every project chunk (card, zones, listing groups, FAQs, phases) and saves to disk.
+        Returns False (keeping any previous index) if no backend could embed the KB.
         """
         logger.info("Building Index...")
         projects = list(kb_service.projects.values())
         if not projects:
             logger.error("No projects to index.")
-            return
+            return False
 
-        embeddings = []
+        texts = []
         meta = []
-
         for p in projects:
-            card_text = kb_service.build_project_card(p)
-            emb = llm_service.get_embedding(card_text)
-            embeddings.append(emb)
-            meta.append({
-                "project_id": p.project_id,
-                "project_name": p.project_name
-            })
+            for i, chunk in enumerate(kb_service.build_chunks(p)):
+                # The project name travels with every chunk so zone/listing vectors stay disambiguated
+                texts.append(f"{p.project_name} — {chunk['label']}\n{chunk['body']}")
+                meta.append({
+                    "project_id": p.project_id,
+                    "project_name": p.project_name,
+                    "chunk_id": f"{p.project_id}#{i}",
+                    **chunk,
+                })
             print(f"Indexed {p.project_name}")
 
-        dim = len(embeddings[0])
-        index = faiss.IndexFlatL2(dim)
-        index.add(np.array(embeddings, dtype=np.float32))
+        try:
+            embeddings, backend, model = self._embed_corpus(texts)
+        except Exception as e:
+            logger.error(f"Embedding the KB failed, keeping the previous index: {e}")
+            return False
+
+        return self._write_index(np.array(embeddings, dtype=np.float32), meta, backend, model)
 
-        # Save
+    def _write_index(self, vectors: np.ndarray, meta: List[Dict[str, Any]], backend: str, model: str) -> bool:
+        """Builds the configured ANN structure and persists it with raw vectors, metadata and index info."""
+        index_type, quantization = Config.FAISS_INDEX_TYPE, Config.FAISS_QUANTIZATION
+        index = build_ann_index(vectors, index_type, quantization)
+
+        # Save — raw vectors stay on disk so the ANN structure can be rebuilt without re-embedding
         faiss.write_index(index, Config.INDEX_PATH)
+        # Write-then-rename: a live mmap of the previous vectors.npy keeps its own inode
+        tmp_vectors = Config.VECTORS_PATH + ".tmp.npy"
+        np.save(tmp_vectors, vectors)
+        os.replace(tmp_vectors, Config.VECTORS_PATH)
         with open(Config.META_PATH, 'w') as f:
             json.dump(meta, f)
+        with open(Config.INDEX_INFO_PATH, 'w') as f:
+            json.dump({
+                "schema": INDEX_SCHEMA,
+                "embedding_backend": backend,
+                "embedding_model": model,
+                "index_type": index_type,
+                "quantization": quantization,
+                "metric": index_metric(index),
+                "dim": int(vectors.shape[1]),
+                "kb_hash": self._compute_kb_hash(),
+            }, f)
         
-        logger.info(f"Index built with {len(projects)} items.")
+        logger.info(f"Index built with {len(meta)} chunks ({backend} embeddings, {index_type}/{quantization}, dim={vectors.shape[1]}).")
         self._load_index()
+        return True
+
+    def _reindex_from_vectors(self) -> bool:
+        if not os.path.exists(Config.VECTORS_PATH):
+            logger.warning("No stored vectors; keeping the existing index type until the next full rebuild.")
+            return False
+        info = self._read_index_info()
+        with open(Config.META_PATH, 'r') as f:
+            meta = json.load(f)
+        logger.info(f"Re-indexing stored vectors as {Config.FAISS_INDEX_TYPE}/{Config.FAISS_QUANTIZATION}...")
+        return self._write_index(np.load(Config.VECTORS_PATH), meta, info["embedding_backend"], info["embedding_model"])
 
 rag_service = RAGService()
+
+# Scrape-time gauges: read straight from the loaded index, nothing on the search path
+metrics.gauge(
+    "palmx_faiss_vectors", "Vectors in the loaded FAISS index.",
+    collect=lambda: {(): rag_service.index.ntotal if rag_service.index is not None else 0})
+metrics.gauge(
+    "palmx_index_info", "Loaded index build: KB hash, embedding backend, index type and quantization.",
+    ("kb_hash", "embedding_backend", "index_type", "quantization"),
+    collect=lambda: {(
+        str(rag_service.index_info.get("kb_hash", "")),
+        str(rag_service.index_info.get("embedding_backend", "")),
+        str(rag_service.index_info.get("index_type", "")),
+        str(rag_service.index_info.get("quantization", "")),
+    ): 1} if rag_service.is_ready else {})
@@ -0,0 +1,251 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.backend.config import Config
+from app.backend.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+PRIORITY_CHAT = 0  # Answer completions (streamed or not) — a user is watching
+PRIORITY_ROUTER = 1  # Router and history summaries, on the path to an answer
+PRIORITY_EMBEDDING = 2  # Query embeddings
+PRIORITY_BATCH = 3  # Index builds and other background work
+PRIORITY_NAMES = {PRIORITY_CHAT: "chat", PRIORITY_ROUTER: "router", PRIORITY_EMBEDDING: "embedding", PRIORITY_BATCH: "batch"}
+
+LLM_QUEUE_WAIT = metrics.histogram(
+    "palmx_llm_queue_wait_seconds", "Time provider calls waited for rate-limit capacity.", ("priority",))
+LLM_QUEUE_TIMEOUTS = metrics.counter(
+    "palmx_llm_queue_timeouts_total", "Provider calls dropped after their queue deadline.", ("deployment", "priority"))
+
+
+class RateLimitTimeout(Exception):
+    """The call's deadline passed while it was queued for rate-limit capacity."""
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """'gpt-4o=300:90000,text-embedding-3-small=1000:350000' → {deployment: (rpm, tpm)}; 0 = unlimited."""
+    limits = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        try:
+            name, values = item.rsplit("=", 1)
+            rpm, tpm = values.split(":")
+            limits[name.strip()] = (float(rpm), float(tpm))
+        except ValueError:
+            logger.warning(f"Ignoring malformed LLM_RATE_LIMITS entry '{item}'")
+    return limits
+
+
+class TokenBucket:
+    """Refills continuously at capacity-per-minute; `level` may dip below zero after a clamp."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)."""
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class _Waiter:
+    def __init__(self, tokens: float, priority: int, deadline: Optional[float], loop=None):
+        self.tokens = tokens
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.error: Optional[Exception] = None
+        self.cancelled = False
+        self.event = threading.Event()
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+    def resolve(self, error: Optional[Exception] = None):
+        self.error = error
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._set_future)
+
+    def _set_future(self):
+        if not self.future.done():
+            if self.error is not None:
+                self.future.set_exception(self.error)
+            else:
+                self.future.set_result(None)
+
+
+class _DeploymentQueue:
+    """Request and token buckets for one deployment plus its priority queue of waiters."""
+
+    def __init__(self, name: str, rpm: float, tpm: float):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.heap: List[Tuple[int, int, _Waiter]] = []
+
+    def buckets(self) -> List[Tuple[TokenBucket, str]]:
+        return [(b, kind) for b, kind in ((self.requests, "requests"), (self.tokens, "tokens")) if b is not None]
+
+    def wait_for(self, waiter: _Waiter, now: float) -> float:
+        """Seconds until the waiter fits; batch work must also leave the reserve untouched."""
+        reserve = Config.LLM_BATCH_RESERVE if waiter.priority >= PRIORITY_BATCH else 0.0
+        wait = 0.0
+        for bucket, kind in self.buckets():
+            bucket.refill(now)
+            amount = 1.0 if kind == "requests" else min(waiter.tokens, bucket.capacity)
+            wait = max(wait, bucket.wait_for(min(bucket.capacity, amount + reserve * bucket.capacity)))
+        return wait
+
+    def consume(self, waiter: _Waiter):
+        for bucket, kind in self.buckets():
+            bucket.level -= 1.0 if kind == "requests" else min(waiter.tokens, bucket.capacity)
+
+
+class RateScheduler:
+    """
+    RPM/TPM token buckets per deployment (LLM_RATE_LIMITS), shared by every caller in
+    the process. Calls queue in priority order — chat, router, embeddings, batch — and
+    the head of the queue is granted as soon as both buckets can cover it, so a rebuild
+    never gets ahead of a live chat. Batch work additionally leaves LLM_BATCH_RESERVE of
+    each bucket free. A queued call that passes its deadline fails with RateLimitTimeout.
+    Deployments without a configured limit are never queued.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self.limits = limits
+        self._queues: Dict[str, _DeploymentQueue] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+
+    def _queue_for(self, deployment: str) -> Optional[_DeploymentQueue]:
+        rpm, tpm = self.limits.get(deployment, (0.0, 0.0))
+        if rpm <= 0 and tpm <= 0:
+            return None
+        queue = self._queues.get(deployment)
+        if queue is None:
+            queue = self._queues[deployment] = _DeploymentQueue(deployment, rpm, tpm)
+        return queue
+
+    @staticmethod
+    def _deadline(priority: int, timeout: Optional[float]) -> Optional[float]:
+        if timeout is None:
+            timeout = Config.LLM_QUEUE_DEADLINE_SECONDS if priority < PRIORITY_BATCH else 0
+        return time.monotonic() + timeout if timeout > 0 else None
+
+    def _enqueue(self, deployment: str, tokens: float, priority: int, timeout: Optional[float], loop=None) -> Optional[_Waiter]:
+        with self._cond:
+            queue = self._queue_for(deployment)
+            if queue is None:
+                return None
+            waiter = _Waiter(tokens, priority, self._deadline(priority, timeout), loop)
+            if not queue.heap and queue.wait_for(waiter, time.monotonic()) == 0:
+                queue.consume(waiter)  # Fast path: nothing queued and capacity available
+                waiter.resolve()
+            else:
+                heapq.heappush(queue.heap, (priority, next(self._seq), waiter))
+                self._ensure_dispatcher()
+                self._cond.notify()
+        return waiter
+
+    def _observe(self, deployment: str, waiter: _Waiter):
+        LLM_QUEUE_WAIT.observe(time.monotonic() - waiter.enqueued, priority=PRIORITY_NAMES[waiter.priority])
+        if waiter.error is not None:
+            LLM_QUEUE_TIMEOUTS.inc(deployment=deployment, priority=PRIORITY_NAMES[waiter.priority])
+            raise waiter.error
+
+    def acquire(self, deployment: str, tokens: float, priority: int, timeout: Optional[float] = None):
+        """Blocks until the call may go out; raises RateLimitTimeout past the deadline."""
+        waiter = self._enqueue(deployment, tokens, priority, timeout)
+        if waiter is None:
+            return
+        waiter.event.wait()
+        self._observe(deployment, waiter)
+
+    async def aacquire(self, deployment: str, tokens: float, priority: int, timeout: Optional[float] = None):
+        """acquire() for the event loop: waits on a future, never on the thread."""
+        waiter = self._enqueue(deployment, tokens, priority, timeout, loop=asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            waiter.cancelled = True  # The dispatcher drops it; capacity granted already is not returned
+            raise
+        except RateLimitTimeout:
+            pass  # Counted and re-raised by _observe
+        self._observe(deployment, waiter)
+
+    def depths(self) -> Dict[Tuple[str, str], int]:
+        with self._cond:
+            out = {}
+            for name, queue in self._queues.items():
+                for priority in PRIORITY_NAMES.values():
+                    out[(name, priority)] = 0
+                for _, _, waiter in queue.heap:
+                    key = (name, PRIORITY_NAMES[waiter.priority])
+                    out[key] += 1
+            return out
+
+    # --- Dispatcher ---
+    def _ensure_dispatcher(self):
+        # Caller holds the condition
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name="palmx-llm-scheduler", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        with self._cond:
+            while True:
+                sleep_for = None
+                now = time.monotonic()
+                for queue in self._queues.values():
+                    wait = self._drain(queue, now)
+                    if wait is not None:
+                        sleep_for = wait if sleep_for is None else min(sleep_for, wait)
+                self._cond.wait(timeout=sleep_for)
+
+    def _drain(self, queue: _DeploymentQueue, now: float) -> Optional[float]:
+        """Grants from the head while capacity lasts; returns seconds until the next check, None if idle."""
+        live = []
+        for entry in queue.heap:
+            waiter = entry[2]
+            if waiter.cancelled:
+                continue
+            if waiter.deadline is not None and now >= waiter.deadline:
+                waiter.resolve(RateLimitTimeout(f"Queued {now - waiter.enqueued:.1f}s for {queue.name} without capacity"))
+                continue
+            live.append(entry)
+        if len(live) != len(queue.heap):
+            heapq.heapify(live)
+            queue.heap[:] = live
+
+        while queue.heap:
+            _, _, waiter = queue.heap[0]
+            wait = queue.wait_for(waiter, now)
+            if wait > 0:
+                # Wake for the head's capacity or the next deadline, whichever comes first
+                deadlines = [w.deadline - now for _, _, w in queue.heap if w.deadline is not None]
+                return max(0.001, min([wait] + deadlines))
+            heapq.heappop(queue.heap)
+            queue.consume(waiter)
+            waiter.resolve()
+        return None
+
+
+rate_scheduler = RateScheduler(parse_rate_limits(Config.LLM_RATE_LIMITS))
+
+LLM_QUEUE_DEPTH = metrics.gauge(
+    "palmx_llm_queue_depth", "Provider calls waiting for rate-limit capacity.", ("deployment", "priority"),
+    collect=rate_scheduler.depths)
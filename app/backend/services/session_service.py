@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.backend.config import Config
+from app.backend.models import ChatRequest, Message, RouterOutput, SessionState
+
+logger = logging.getLogger(__name__)
+
+class SessionStore:
+    """
+    Server-side chat state per session_id: history, the last RouterOutput and the
+    projects retrieved last turn, with an idle TTL. Session ids are minted here by
+    create() — never by clients — so they can't be guessed or chosen to collide with
+    someone else's conversation. With a directory configured (the
+    default) every session is written through to disk as JSON and read back from it,
+    so it survives restarts and any worker process can serve the next turn. Without
+    one, sessions live in an in-process LRU only.
+    """
+
+    def __init__(self, ttl_seconds: int = 7200, max_sessions: int = 5000, store_dir: str = "", purge_seconds: float = 300.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.store_dir = store_dir
+        self.purge_seconds = purge_seconds
+        self._next_purge = time.time() + purge_seconds
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.store_dir:
+            os.makedirs(self.store_dir, exist_ok=True)
+
+    def create(self) -> SessionState:
+        """A new, empty session under an unguessable server-minted id."""
+        state = SessionState(session_id=secrets.token_urlsafe(Config.SESSION_ID_BYTES))
+        self.save(state)
+        return state
+
+    def lookup(self, session_id: str) -> Optional[SessionState]:
+        """The live state for a session minted by create(); None if unknown or expired."""
+        if not session_id:
+            return None
+        if self.store_dir:
+            # Disk is authoritative: another worker may have served this session's last turn
+            state = self._load(session_id)
+        else:
+            with self._lock:
+                state = self._sessions.get(session_id)
+                if state is not None:
+                    self._sessions.move_to_end(session_id)
+        if state is None or time.time() - state.updated_at > self.ttl_seconds:
+            return None
+        return state
+
+    def get(self, session_id: str) -> SessionState:
+        """The live state for a session — a fresh one if unknown or expired."""
+        state = self.lookup(session_id)
+        if state is None:
+            state = SessionState(session_id=session_id, updated_at=time.time())
+        return state
+
+    def save(self, state: SessionState):
+        state.updated_at = time.time()
+        overflow = len(state.history) - Config.SESSION_MAX_MESSAGES
+        if overflow > 0:
+            state.history = state.history[overflow:]
+            state.trimmed += overflow
+        if self.store_dir:
+            self._persist(state)
+        else:
+            with self._lock:
+                self._sessions[state.session_id] = state
+                self._sessions.move_to_end(state.session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        if state.updated_at >= self._next_purge:
+            self._next_purge = state.updated_at + self.purge_seconds
+            self.purge_expired()
+
+    def history_for(self, request: ChatRequest, state: Optional[SessionState] = None) -> List[Message]:
+        """
+        Conversation to answer, ending with the new user turn. A legacy request carrying
+        the full `messages` list is taken as-is; otherwise the stored history (`state`,
+        if already loaded) is extended with `message`.
+        """
+        if request.messages:
+            return list(request.messages)
+        state = state or self.get(request.session_id)
+        return state.history + [Message(role="user", content=request.message)]
+
+    def record_turn(
+        self,
+        state: SessionState,
+        history: List[Message],
+        reply: str,
+        router_out: Optional[RouterOutput] = None,
+        retrieved_project_ids: Optional[List[str]] = None,
+    ):
+        """Stores a finished turn on the state loaded when it started — no second read."""
+        state.history = history + ([Message(role="assistant", content=reply)] if reply else [])
+        if router_out is not None:
+            state.last_router = router_out
+        if retrieved_project_ids is not None:
+            state.retrieved_project_ids = retrieved_project_ids
+        self.save(state)
+
+    def purge_expired(self) -> int:
+        """
+        Drops sessions idle past the TTL and, on disk, the oldest files beyond
+        max_sessions. Runs from save() every purge_seconds; returns how many went.
+        """
+        if self.store_dir:
+            return self._purge_files()
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if s.updated_at < cutoff]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    # --- Disk backend ---
+    def _path(self, session_id: str) -> str:
+        # Hashed file names: session ids come from clients and must never become paths
+        return os.path.join(self.store_dir, hashlib.sha1(session_id.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, session_id: str) -> Optional[SessionState]:
+        if not self.store_dir:
+            return None
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return SessionState.model_validate_json(f.read())
+        except Exception as e:
+            logger.warning(f"Failed to load session {session_id}: {e}")
+            return None
+
+    def _purge_files(self) -> int:
+        # A file's mtime is its session's last save, so no file needs parsing
+        files = []
+        for entry in os.scandir(self.store_dir):
+            if entry.name.endswith((".json", ".tmp")):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass  # Purged by another worker meanwhile
+        files.sort(reverse=True)
+        cutoff = time.time() - self.ttl_seconds
+        sessions = [path for _, path in files if path.endswith(".json")]
+        doomed = set(sessions[self.max_sessions:])  # Least recently saved beyond the cap
+        doomed.update(path for mtime, path in files if mtime < cutoff)  # Idle sessions, abandoned temp files
+        removed = 0
+        for path in doomed:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Purged {removed} expired session files")
+        return removed
+
+    def _persist(self, state: SessionState):
+        if not self.store_dir:
+            return
+        path = self._path(state.session_id)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Workers may write the same session
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(state.model_dump_json())
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.error(f"Failed to persist session {state.session_id}: {e}")
+
+session_store = SessionStore(
+    ttl_seconds=Config.SESSION_TTL_SECONDS,
+    max_sessions=Config.SESSION_MAX_SESSIONS,
+    store_dir=Config.SESSION_STORE_DIR,
+    purge_seconds=Config.SESSION_PURGE_SECONDS,
+)
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+async def relay(
+    request: Request,
+    frames: AsyncIterator[str],
+    heartbeat_seconds: float = 15.0,
+    queue_size: int = 32,
+    disconnect_check_seconds: float = 1.0,
+) -> AsyncIterator[str]:
+    """
+    Forwards pre-formatted SSE frames to the client.
+    - Backpressure: a pump task fills a bounded queue; when a slow client stops
+      draining it, the pump (and with it the upstream read) pauses.
+    - Heartbeats: a comment frame whenever nothing was sent for heartbeat_seconds,
+      so proxies keep long, quiet streams open.
+    - Disconnects: polled at most every disconnect_check_seconds, and on every
+      heartbeat tick; leaving this generator for any reason (including the server
+      closing it on disconnect) cancels the pump, which closes `frames` and with it
+      the upstream request.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def pump():
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"SSE source failed: {e}")
+        await queue.put(_END)
+
+    task = asyncio.create_task(pump())
+    loop = asyncio.get_running_loop()
+    last_check = loop.time()
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                frame = None
+            if frame is _END:
+                break
+
+            if frame is None or loop.time() - last_check >= disconnect_check_seconds:
+                last_check = loop.time()
+                if await request.is_disconnected():
+                    logger.info("SSE client disconnected — cancelling upstream")
+                    break
+            yield ": heartbeat\n\n" if frame is None else frame
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        aclose = getattr(frames, "aclose", None)
+        if aclose is not None:
+            await aclose()
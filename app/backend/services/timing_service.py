@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+class StageTimer:
+    """
+    Wall-clock milliseconds per pipeline stage for one request. Repeated stages
+    (e.g. BM25 for every query of a batch) accumulate under the same name.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000.0)
+
+    def add(self, name: str, ms: float):
+        self.timings[name] = round(self.timings.get(name, 0.0) + ms, 2)
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._started) * 1000.0, 2)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, readable in browser dev tools."""
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.timings.items())
+
+
+@contextmanager
+def timed(timer: Optional[StageTimer], name: str):
+    """timer.stage(name), or a no-op when no timer is attached."""
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield
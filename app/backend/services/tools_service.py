@@ -0,0 +1,339 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import portalocker
+
+from app.backend.config import Config
+from app.backend.models import Lead
+from app.backend.services.leads_service import leads_service
+from app.backend.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+TOOL_JOBS = metrics.counter(
+    "palmx_tool_jobs_total", "Tool jobs by tool and outcome (queued, done, retried, failed).", ("tool", "outcome"))
+TOOL_QUEUE_DEPTH = metrics.gauge(
+    "palmx_tool_queue_depth", "Tool jobs waiting for the background executor.",
+    collect=lambda: {(): tool_executor.depth()})
+
+
+class Tool:
+    """
+    One LLM-callable tool.
+    prepare(session_id, args) validates the model's arguments into a JSON-safe payload
+    (raising rejects the call before anything is queued); handler(payload, job_id) does
+    the slow work on the executor and raises to be retried — a job can run more than
+    once, so it should do nothing for a job_id it already completed; confirm(payload)
+    is the reply text.
+    """
+
+    def __init__(
+        self,
+        definition: Dict[str, Any],
+        handler: Callable[[Dict[str, Any], str], None],
+        prepare: Callable[[str, Dict[str, Any]], Dict[str, Any]] = None,
+        confirm: Callable[[Dict[str, Any]], str] = None,
+    ):
+        self.definition = definition
+        self.name = definition["function"]["name"]
+        self.handler = handler
+        self.prepare = prepare or (lambda session_id, args: {"session_id": session_id, **args})
+        self.confirm = confirm or (lambda payload: "")
+
+
+class ToolRegistry:
+    def __init__(self):
+        self._tools: Dict[str, Tool] = {}
+
+    def register(self, tool: Tool) -> Tool:
+        self._tools[tool.name] = tool
+        return tool
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self._tools.get(name)
+
+    def definitions(self) -> List[Dict[str, Any]]:
+        """The `tools` list for the chat completion API."""
+        return [t.definition for t in self._tools.values()]
+
+
+class ToolExecutor:
+    """
+    Runs tool handlers on a background thread so a tool call never stalls the stream.
+    submit() appends the job to an fsync'ed JSONL journal — that append is the
+    acknowledgement. Completion is journaled too.
+
+    Every worker process journals, but only one — whichever holds the owner lock —
+    executes: its own submissions go straight to a bounded in-memory queue, and when
+    idle it replays whatever else is pending in the journal (other workers' jobs,
+    overflow, jobs left by a crash or restart). The owner keeps the pending set in
+    memory and only reads what was appended since its last look; once a batch drains
+    it compacts the journal down to that set. The other processes keep trying for
+    the owner lock, so a dead owner is replaced. Appends, reads and compaction all
+    hold a cross-process lock on the journal. Handlers get the job id, which stays
+    the same across retries and replays, to make their side effect idempotent.
+    """
+
+    def __init__(
+        self, registry: ToolRegistry, journal_path: str, max_queue: int = 256, max_attempts: int = 3,
+        poll_seconds: float = 1.0
+    ):
+        self.registry = registry
+        self.journal_path = journal_path
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._journal_lock = threading.Lock()
+        self._owner_file = None  # Open while this process holds the owner lock
+        self._pending: Dict[str, Dict[str, Any]] = {}  # Owner only: journal state up to _offset
+        self._offset = 0
+        self._dirty = False  # Jobs finished since the last compaction
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def is_owner(self) -> bool:
+        return self._owner_file is not None
+
+    def submit(self, name: str, session_id: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Validates, journals and queues a tool call. Returns the acknowledged job."""
+        tool = self.registry.get(name)
+        if tool is None:
+            raise KeyError(f"Unknown tool '{name}'")
+        job = {
+            "id": uuid.uuid4().hex,
+            "tool": name,
+            "payload": tool.prepare(session_id, args),
+            "attempts": 0,
+            "ts": time.time(),
+        }
+        self._journal({"event": "queued", "job": job})
+        TOOL_JOBS.inc(tool=name, outcome="queued")
+        self._ensure_worker()
+        if self.is_owner:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                # Already durable; the worker picks it up from the journal once it catches up
+                logger.warning(f"Tool queue full — job {job['id']} deferred to journal replay")
+        return job
+
+    # --- Worker ---
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="palmx-tools", daemon=True)
+                self._worker.start()
+
+    def start(self):
+        """Starts the worker; if this process wins the owner lock it replays the pending jobs."""
+        self._claim_ownership()
+        self._ensure_worker()
+
+    def _claim_ownership(self) -> bool:
+        """Non-blocking: True if this process is (now) the one executing jobs."""
+        with self._start_lock:
+            if self._owner_file is not None:
+                return True
+            f = open(self.journal_path + ".owner", "a")
+            try:
+                portalocker.lock(f, portalocker.LOCK_EX | portalocker.LOCK_NB)
+            except portalocker.LockException:
+                f.close()
+                return False
+            self._owner_file = f
+            self._pending, self._offset = {}, 0
+        pending = self._compact()
+        logger.info(f"Tool executor owner (pid {os.getpid()}); {len(pending)} pending jobs to replay")
+        return True
+
+    def _run(self):
+        while True:
+            if not self._claim_ownership():
+                time.sleep(self.poll_seconds)
+                continue
+            try:
+                job = self._queue.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                if self._dirty:
+                    self._compact()  # Batch drained: shrink the journal to what's still pending
+                self._replay()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: Dict[str, Any]):
+        tool = self.registry.get(job["tool"])
+        job["attempts"] += 1
+        try:
+            if tool is None:
+                raise KeyError(f"Unknown tool '{job['tool']}'")
+            tool.handler(job["payload"], job["id"])
+        except Exception as e:
+            if job["attempts"] < self.max_attempts:
+                logger.warning(f"Tool {job['tool']} job {job['id']} failed (attempt {job['attempts']}): {e}")
+                TOOL_JOBS.inc(tool=job["tool"], outcome="retried")
+                time.sleep(min(2.0, 0.2 * 2 ** job["attempts"]))
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    pass  # Still pending in the journal; the next idle replay retries it
+                return
+            logger.error(f"Tool {job['tool']} job {job['id']} failed permanently: {e}")
+            self._journal({"event": "failed", "id": job["id"], "error": str(e)})
+            TOOL_JOBS.inc(tool=job["tool"], outcome="failed")
+            self._dirty = True
+            return
+        self._journal({"event": "done", "id": job["id"]})
+        TOOL_JOBS.inc(tool=job["tool"], outcome="done")
+        self._dirty = True
+
+    # --- Journal ---
+    @contextmanager
+    def _locked(self):
+        """Cross-process lock over the journal, on a side file so compaction can replace the journal."""
+        with self._journal_lock, open(self.journal_path + ".lock", "a") as lock:
+            portalocker.lock(lock, portalocker.LOCK_EX)
+            try:
+                yield
+            finally:
+                portalocker.unlock(lock)
+
+    def _journal(self, record: Dict[str, Any]):
+        line = json.dumps(record) + "\n"
+        with self._locked(), open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_new(self):
+        """Folds records appended since the last read into _pending. Caller holds _locked()."""
+        try:
+            if os.path.getsize(self.journal_path) == self._offset:
+                return  # The idle poll: nothing new, nothing read
+        except OSError:
+            return
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # A line still being written waits for the next read
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn line after a crash
+            if record.get("event") == "queued":
+                self._pending[record["job"]["id"]] = record["job"]
+            else:
+                self._pending.pop(record.get("id"), None)
+        self._offset += end
+
+    def _compact(self) -> List[Dict[str, Any]]:
+        """Rewrites the journal down to its pending jobs; returns them."""
+        with self._locked():
+            self._read_new()
+            pending = list(self._pending.values())
+            tmp = self.journal_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for job in pending:
+                    f.write(json.dumps({"event": "queued", "job": job}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                self._offset = f.tell()
+            os.replace(tmp, self.journal_path)
+            self._dirty = False
+        return pending
+
+    def _replay(self):
+        with self._locked():
+            self._read_new()
+            pending = list(self._pending.values())
+        in_queue = {j["id"] for j in list(self._queue.queue)}
+        for job in pending:
+            if job["id"] in in_queue:
+                continue
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                return
+
+
+# --- PalmX tools ---
+SAVE_LEAD_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "save_lead",
+        "description": "Save a verified, confirmed lead with ALL gathered details. Call ONLY after the buyer explicitly confirms their information is correct. Populate every field you have gathered during the conversation — leave unknown fields empty rather than guessing.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "description": "The buyer's full name"},
+                "phone": {"type": "string", "description": "Phone or WhatsApp number"},
+                "interest_projects": {"type": "string", "description": "Comma-separated list of project names they showed interest in"},
+                "preferred_region": {"type": "string", "description": "Their preferred region", "enum": ["West", "East", "Coast", "New Capital", "Alex", "Sokhna"]},
+                "unit_type": {"type": "string", "description": "Villa, Apartment, Townhouse, Duplex, Penthouse, Commercial, etc."},
+                "budget_min": {"type": "string", "description": "Minimum budget in EGP (e.g. '5000000')"},
+                "budget_max": {"type": "string", "description": "Maximum budget in EGP (e.g. '15000000')"},
+                "purpose": {"type": "string", "description": "Buy, Rent, or Invest", "enum": ["Buy", "Rent", "Invest"]},
+                "timeline": {"type": "string", "description": "When they plan to purchase — Immediately, 3 months, 6 months, 1 year, etc."},
+                "next_step": {"type": "string", "description": "Agreed next action", "enum": ["callback", "site_visit", "send_details"]},
+                "lead_summary": {"type": "string", "description": "A 2-3 line natural-language summary of the entire conversation and the buyer's needs, preferences, and any notable context"},
+                "tags": {"type": "string", "description": "Auto-generated comma-separated tags capturing key attributes: e.g. 'high-budget,villa,west-cairo,investor,urgent'"},
+                "kb_version_hash": {"type": "string", "description": "Version hash of the knowledge base used"}
+            },
+            "required": ["name", "phone"]
+        }
+    }
+}
+
+
+def _prepare_lead(session_id: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    lead = Lead(
+        session_id=session_id,
+        name=args.get('name'),
+        phone=args.get('phone'),
+        interest_projects=args.get('interest_projects', '').split(',') if args.get('interest_projects') else [],
+        preferred_region=args.get('preferred_region'),
+        unit_type=args.get('unit_type'),
+        budget_min=args.get('budget_min'),
+        budget_max=args.get('budget_max'),
+        purpose=args.get('purpose'),
+        timeline=args.get('timeline'),
+        next_step=args.get('next_step'),
+        lead_summary=args.get('lead_summary'),
+        tags=args.get('tags', '').split(',') if args.get('tags') else [],
+        kb_version_hash=args.get('kb_version_hash', 'v1.0')
+    )
+    return lead.model_dump()
+
+
+def _save_lead(payload: Dict[str, Any], job_id: str):
+    if not leads_service.save_lead(Lead(**payload), job_id=job_id):
+        raise RuntimeError("leads.csv write failed")
+
+
+tool_registry = ToolRegistry()
+tool_registry.register(Tool(
+    SAVE_LEAD_TOOL,
+    handler=_save_lead,
+    prepare=_prepare_lead,
+    confirm=lambda p: f"Thank you {p['name']}. Your details have been saved. A sales representative will contact you at {p['phone']} shortly.",
+))
+
+tool_executor = ToolExecutor(
+    tool_registry,
+    journal_path=Config.TOOL_JOURNAL_PATH,
+    max_queue=Config.TOOL_QUEUE_SIZE,
+    max_attempts=Config.TOOL_MAX_ATTEMPTS,
+)
@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState, useEffect, useMemo } from "react";
+import React, { useState, useEffect, useMemo, useRef } from "react";
 import Image from "next/image";
 import Link from "next/link";
 import {
@@ -364,8 +364,8 @@ export default function Dashboard() {
     // --------------------------------------------------
     // Fetch data
     // --------------------------------------------------
-    const fetchAll = async (sheet = activeSheet, range = timeRange) => {
-        setLoading(true);
+    const fetchAll = async (sheet = activeSheet, range = timeRange, quiet = false) => {
+        if (!quiet) setLoading(true);
         setError(null);
         try {
             const [h, s, a, l, au] = await Promise.all([
@@ -383,7 +383,7 @@ export default function Dashboard() {
         } catch (e: any) {
             setError(e.message || "Failed to load data");
         } finally {
-            setLoading(false);
+            if (!quiet) setLoading(false);
         }
     };
 
@@ -392,6 +392,22 @@ export default function Dashboard() {
         // eslint-disable-next-line react-hooks/exhaustive-deps
     }, []);
 
+    // Live updates: new leads / audit rows arrive over SSE; refetch once a burst settles
+    const selection = useRef({ sheet: activeSheet, range: timeRange });
+    selection.current = { sheet: activeSheet, range: timeRange };
+    useEffect(() => {
+        let timer: ReturnType<typeof setTimeout> | undefined;
+        const unsubscribe = adminApi.subscribe(() => {
+            clearTimeout(timer);
+            timer = setTimeout(() => fetchAll(selection.current.sheet, selection.current.range, true), 1000);
+        });
+        return () => {
+            clearTimeout(timer);
+            unsubscribe();
+        };
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, []);
+
     const handleRangeChange = (r: string) => {
         setTimeRange(r);
         fetchAll(activeSheet, r);
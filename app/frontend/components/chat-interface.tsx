@@ -5,7 +5,7 @@ import Image from "next/image";
 import Link from "next/link";
 import { Send, MapPin, Building2, User, Sparkles, ArrowRight, Loader2 } from "lucide-react";
 import ReactMarkdown from "react-markdown";
-import { api, ChatMessage, Lead } from "@/lib/api";
+import { api, ChatMessage, Lead, SessionExpiredError } from "@/lib/api";
 import { cn } from "@/lib/utils";
 
 const SESSION_ID_KEY = "palmx_sess_id";
@@ -21,6 +21,7 @@ export default function ChatInterface() {
     const [messages, setMessages] = useState<ChatMessage[]>([]);
     const [input, setInput] = useState("");
     const [loading, setLoading] = useState(false);
+    const [pendingProjects, setPendingProjects] = useState<string[]>([]);
     const [sessionId, setSessionId] = useState("");
     const [mode, setMode] = useState<'concierge' | 'lead_capture'>('concierge');
     const [systemReady, setSystemReady] = useState(false);
@@ -57,14 +58,18 @@ export default function ChatInterface() {
     }, []);
 
     useEffect(() => {
-        let sid = localStorage.getItem(SESSION_ID_KEY);
-        if (!sid) {
-            sid = Math.random().toString(36).substring(7);
-            localStorage.setItem(SESSION_ID_KEY, sid);
-        }
-        setSessionId(sid);
+        const sid = localStorage.getItem(SESSION_ID_KEY);
+        if (sid) setSessionId(sid);
     }, []);
 
+    // Session ids come from the backend; a fresh one replaces a missing or expired id
+    const newSession = async () => {
+        const sid = await api.createSession();
+        localStorage.setItem(SESSION_ID_KEY, sid);
+        setSessionId(sid);
+        return sid;
+    };
+
     useEffect(() => {
         if (scrollRef.current) {
             scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
@@ -80,14 +85,14 @@ export default function ChatInterface() {
         setMessages(prev => [...prev, userMsg]);
         setInput("");
         setLoading(true);
+        setPendingProjects([]);
 
         try {
-            const history = [...messages, userMsg];
             let firstToken = true;
 
-            await api.chatStream(
-                sessionId,
-                history,
+            const send = (sid: string) => api.chatStream(
+                sid,
+                text,
                 // onToken — insert message on first token, then append
                 (token: string) => {
                     if (firstToken) {
@@ -115,8 +120,21 @@ export default function ChatInterface() {
                     } else {
                         setMode(data.mode);
                     }
+                },
+                // onMeta — show what the concierge is reviewing before the answer arrives
+                (meta) => {
+                    if (meta.router) setMode(meta.router.mode);
+                    if (meta.retrieval) setPendingProjects(meta.retrieval.projects.map(p => p.project_name));
                 }
             );
+
+            try {
+                await send(sessionId || await newSession());
+            } catch (err) {
+                // Rejected before any token was streamed: retry once on a new session
+                if (!(err instanceof SessionExpiredError)) throw err;
+                await send(await newSession());
+            }
         } catch (err) {
             console.error(err);
             setMessages(prev => [...prev, { role: "assistant", content: "I'm having trouble connecting to PalmX. Please try again." }]);
@@ -469,7 +487,9 @@ export default function ChatInterface() {
                                 />
                             </div>
                             <div className="bg-white px-8 py-5 rounded-3xl rounded-tl-sm flex items-center space-x-3 shadow-sm border border-gray-50">
-                                <span className="text-xs uppercase tracking-widest text-gray-400 mr-2">Concierge Thinking</span>
+                                <span className="text-xs uppercase tracking-widest text-gray-400 mr-2">
+                                    {pendingProjects.length > 0 ? `Reviewing ${pendingProjects.join(' · ')}` : 'Concierge Thinking'}
+                                </span>
                                 <div className="flex space-x-1">
                                     <div className="w-1 h-1 bg-black rounded-full animate-bounce [animation-delay:-0.3s]"></div>
                                     <div className="w-1 h-1 bg-black rounded-full animate-bounce [animation-delay:-0.15s]"></div>
@@ -97,6 +97,11 @@ export interface HealthData {
     server_time: string;
 }
 
+export interface StreamEvent {
+    type: 'lead' | 'audit';
+    data: Record<string, string>;
+}
+
 // ---------------------------------------------------------------------------
 // Fetcher
 // ---------------------------------------------------------------------------
@@ -104,7 +109,8 @@ export interface HealthData {
 async function adminFetch<T>(path: string, init?: RequestInit): Promise<T> {
     const res = await fetch(`${ADMIN_BASE}${path}`, {
         ...init,
-        cache: 'no-store',
+        // Revalidate with ETag/Last-Modified so unchanged data comes back as a 304
+        cache: 'no-cache',
     });
     if (!res.ok) {
         const text = await res.text().catch(() => '');
@@ -135,4 +141,19 @@ export const adminApi = {
         adminFetch<AnalyticsData>(`/analytics?sheet=${encodeURIComponent(sheet)}&range=${range}`),
 
     audit: () => adminFetch<AuditData>('/audit'),
+
+    /** Subscribe to newly saved leads and audit events. Returns an unsubscribe function. */
+    subscribe: (onEvent: (event: StreamEvent) => void) => {
+        const source = new EventSource(`${ADMIN_BASE}/stream`);
+        const handler = (type: StreamEvent['type']) => (e: MessageEvent) => {
+            try {
+                onEvent({ type, data: JSON.parse(e.data) });
+            } catch {
+                // Skip malformed events
+            }
+        };
+        source.addEventListener('lead', handler('lead'));
+        source.addEventListener('audit', handler('audit'));
+        return () => source.close();
+    },
 };
@@ -10,6 +10,25 @@ export interface ChatResponse {
     mode: 'concierge' | 'lead_capture';
 }
 
+export interface RetrievedProject {
+    project_id: string;
+    project_name: string;
+    region?: string;
+    city_area?: string;
+    project_type?: string;
+    project_status?: string;
+    official_project_url?: string;
+    score: number;
+    source: string;
+}
+
+// Early stream events, sent before the first answer token
+export interface StreamMeta {
+    router?: { intent: string; mode: 'concierge' | 'lead_capture'; entities: string[]; filters: Record<string, string> };
+    retrieval?: { projects: RetrievedProject[] };
+    tool?: { name: string; status: 'queued' | 'rejected'; job_id?: string };
+}
+
 export interface Lead {
     name: string;
     phone: string;
@@ -26,28 +45,48 @@ export interface Lead {
 
 const API_BASE = ''; // Relative path handled by Next.js rewrites
 
+// The server no longer knows the session (expired or never minted) — start a new one
+export class SessionExpiredError extends Error {
+    constructor() {
+        super('Session expired');
+        this.name = 'SessionExpiredError';
+    }
+}
+
 export const api = {
-    chat: async (sessionId: string, messages: ChatMessage[]): Promise<ChatResponse> => {
+    // Session ids are minted by the backend; clients never make them up
+    createSession: async (): Promise<string> => {
+        const res = await fetch(`${API_BASE}/api/session`, { method: 'POST' });
+        if (!res.ok) throw new Error('Session creation failed');
+        const data = await res.json();
+        return data.session_id;
+    },
+
+    // History lives server-side per session_id; only the new user turn is sent
+    chat: async (sessionId: string, message: string): Promise<ChatResponse> => {
         const res = await fetch(`${API_BASE}/api/chat`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ session_id: sessionId, messages, locale: 'en' }),
+            body: JSON.stringify({ session_id: sessionId, message, locale: 'en' }),
         });
+        if (res.status === 404) throw new SessionExpiredError();
         if (!res.ok) throw new Error('Chat request failed');
         return res.json();
     },
 
     chatStream: async (
         sessionId: string,
-        messages: ChatMessage[],
+        message: string,
         onToken: (token: string) => void,
-        onDone: (data: { retrieved_projects: string[]; mode: 'concierge' | 'lead_capture' }) => void
+        onDone: (data: { retrieved_projects: string[]; mode: 'concierge' | 'lead_capture' }) => void,
+        onMeta?: (meta: StreamMeta) => void
     ) => {
         const res = await fetch(`${API_BASE}/api/chat/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ session_id: sessionId, messages, locale: 'en' }),
+            body: JSON.stringify({ session_id: sessionId, message, locale: 'en' }),
         });
+        if (res.status === 404) throw new SessionExpiredError();
         if (!res.ok) throw new Error('Stream request failed');
 
         const reader = res.body?.getReader();
@@ -64,21 +103,29 @@ export const api = {
             const lines = buffer.split('\n\n');
             buffer = lines.pop() || '';
 
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    try {
-                        const data = JSON.parse(line.slice(6));
-                        if (data.done) {
-                            onDone({
-                                retrieved_projects: data.retrieved_projects || [],
-                                mode: data.mode || 'concierge'
-                            });
-                        } else if (data.token) {
-                            onToken(data.token);
-                        }
-                    } catch (e) {
-                        // Skip malformed lines
+            for (const block of lines) {
+                // Each block: optional "event: <type>" line + "data: <json>" (comments = heartbeats)
+                let event = 'message';
+                let payload = '';
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7).trim();
+                    else if (line.startsWith('data: ')) payload += line.slice(6);
+                }
+                if (!payload) continue;
+                try {
+                    const data = JSON.parse(payload);
+                    if (event === 'router' || event === 'retrieval' || event === 'tool') {
+                        onMeta?.({ [event]: data });
+                    } else if (data.done) {
+                        onDone({
+                            retrieved_projects: data.retrieved_projects || [],
+                            mode: data.mode || 'concierge'
+                        });
+                    } else if (data.token) {
+                        onToken(data.token);
                     }
+                } catch (e) {
+                    // Skip malformed lines
                 }
             }
         }
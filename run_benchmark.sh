@@ -0,0 +1 @@
+python3 -m app.backend.retrieval.benchmark "$@"
@@ -0,0 +1 @@
+python3 -m app.backend.loadtest.run "$@"
@@ -0,0 +1,15 @@
+"""
+Tests run against a throwaway runtime directory so importing the app never touches
+the tracked runtime/ files, with the real KB and the CPU-only embedding backend.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+os.environ["PALMX_RUNTIME_DIR"] = tempfile.mkdtemp(prefix="palmx-test-runtime-")
+os.environ["KB_CSV_PATH"] = str(REPO_ROOT / "engine-KB" / "PalmX-buyerKB.csv")
+os.environ["EMBEDDING_BACKEND"] = "local"
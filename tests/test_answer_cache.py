@@ -0,0 +1,61 @@
+import asyncio
+
+from app.backend.models import Message, RouterOutput
+from app.backend.services.answer_cache_service import AnswerCache, answer_cache
+from app.backend.services.chat_pipeline import ChatPipeline, ChatTurn
+from app.backend.services.llm_service import FALLBACK_ANSWER, llm_service
+
+
+def _turn(text, entities=()):
+    turn = ChatTurn("test-cache", [Message(role="user", content=text)])
+    turn.router_out = RouterOutput(intent="project_query", query_rewrite=text, entities=list(entities))
+    return turn
+
+
+def test_named_projects_come_from_the_message_and_router_entities():
+    assert ChatPipeline._named_projects(_turn("Tell me about Badya")) == ["badya"]
+    assert ChatPipeline._named_projects(_turn("Tell me about it", ["Hacienda Bay"])) == ["hacienda_bay"]
+    assert ChatPipeline._named_projects(_turn("What do you have?")) == []
+
+
+def test_answers_for_different_projects_never_share_a_key():
+    cache = AnswerCache(max_entries=10)
+    vector = [1.0, 0.0, 0.0]  # Identical embeddings: only the key tells the questions apart
+    badya = cache.key("kb", "project_query", {}, ChatPipeline._named_projects(_turn("Tell me about Badya")))
+    hacienda = cache.key("kb", "project_query", {}, ChatPipeline._named_projects(_turn("Tell me about Hacienda Bay")))
+    cache.put(badya, vector, "Badya is ...", ["Badya is ..."], [("badya", 1.0, "entity")])
+
+    assert cache.get(badya, vector).answer == "Badya is ..."
+    assert cache.get(hacienda, vector) is None
+
+
+def test_a_stream_that_fails_midway_is_not_cached(monkeypatch):
+    async def broken_stream(*args, **kwargs):
+        yield "Badya is "
+        raise ConnectionError("upstream reset")
+
+    stored = []
+    monkeypatch.setattr(llm_service, "astream_answer_completion", broken_stream)
+    monkeypatch.setattr(answer_cache, "put", lambda *args: stored.append(args))
+    pipeline = ChatPipeline(prompt_builder=None, tools=[])
+    monkeypatch.setattr(pipeline, "finish", lambda turn, reply: None)
+    turn = _turn("Tell me about Badya")
+    turn.cache_key = ("kb", "project_query", (), ("badya",))
+    turn.query_embedding = [1.0, 0.0, 0.0]
+
+    async def drain():
+        return [data["token"] async for event, data in pipeline.astream(turn) if event == "token"]
+
+    assert asyncio.run(drain()) == ["Badya is ", FALLBACK_ANSWER]
+    assert stored == []
+
+
+def test_turns_with_contact_details_bypass_the_cache():
+    personal = [
+        RouterOutput(intent="pricing", query_rewrite="Badya prices, my name is Omar"),
+        RouterOutput(intent="project_query", query_rewrite="villas in Badya, call me on 01012345678"),
+        RouterOutput(intent="project_query", query_rewrite="Badya brochure to +20 100 123 4567"),
+        RouterOutput(intent="lead_capture", query_rewrite="Badya villa"),
+    ]
+    assert all(ChatPipeline._personal(r) for r in personal)
+    assert not ChatPipeline._personal(RouterOutput(intent="pricing", query_rewrite="villas in Badya under 15000000 EGP"))
@@ -0,0 +1,30 @@
+from app.backend.config import Config
+from app.backend.models import Message
+from app.backend.services.history_service import HistoryCompactor
+from app.backend.services.session_service import SessionStore
+
+
+def test_summary_survives_the_store_trimming_history(monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_MAX_MESSAGES", 20)
+    monkeypatch.setattr(Config, "HISTORY_TOKEN_BUDGET", 400)
+    monkeypatch.setattr(Config, "HISTORY_SUMMARY_MAX_TOKENS", 50)
+    monkeypatch.setattr(Config, "HISTORY_KEEP_RECENT", 4)
+    store = SessionStore()
+    compactor = HistoryCompactor()
+    calls = []
+
+    def summarize(previous, messages):
+        calls.append(len(messages))
+        return f"{previous}+{len(messages)}"
+
+    for i in range(30):
+        state = store.get("s")
+        history = state.history + [Message(role="user", content=f"question {i} " + "word " * 20)]
+        compactor.compact("s", history, summarize, state.trimmed)
+        state.history = history + [Message(role="assistant", content=f"answer {i} " + "word " * 20)]
+        store.save(state)
+
+    assert store.get("s").trimmed > 0
+    # Extended once per HISTORY_SUMMARY_STEP messages, never rebuilt from scratch after a trim
+    assert len(calls) > 1
+    assert max(calls[1:]) <= Config.HISTORY_SUMMARY_STEP
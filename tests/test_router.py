@@ -0,0 +1,88 @@
+import json
+from types import SimpleNamespace
+
+from app.backend.models import Message
+from app.backend.services.chat_pipeline import ChatPipeline, ChatTurn
+from app.backend.services.llm_service import llm_service
+from app.backend.services.rag_service import rag_service
+
+
+def _router_reply(monkeypatch, payload):
+    """Every provider call answers with `payload` as the router's JSON."""
+    monkeypatch.setattr(llm_service.providers, "call", lambda fn, label, **kwargs: json.dumps(payload))
+
+
+def test_router_entities_reach_entity_resolution(monkeypatch):
+    _router_reply(monkeypatch, {
+        "intent": "compare",
+        "needs": [],
+        "filters": {},
+        "query_rewrite": "compare Badya and Hacienda Bay",
+        "entities": ["Badya", "Hacienda Bay"],
+    })
+    seen = []
+    resolve_entities = rag_service.resolve_entities
+
+    def spy(entities):
+        seen.append(list(entities))
+        return resolve_entities(entities)
+
+    monkeypatch.setattr(rag_service, "resolve_entities", spy)
+
+    pipeline = ChatPipeline(prompt_builder=None, tools=[])
+    turn = ChatTurn("test-router", [Message(role="user", content="Compare Badya and Hacienda Bay")])
+    pipeline.route(turn)
+    pipeline.retrieve(turn)
+
+    assert turn.router_out.entities == ["Badya", "Hacienda Bay"]
+    assert seen == [["Badya", "Hacienda Bay"]]
+    assert [p.project_id for p in turn.retrieved_docs] == ["badya", "hacienda_bay"]
+    assert set(turn.retrieved_sources) == {"entity"}
+
+
+def test_router_prompt_asks_for_entities(monkeypatch):
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs["messages"])
+        content = json.dumps({"intent": "list_projects", "query_rewrite": "all properties"})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    provider = SimpleNamespace(
+        deployment="router-test",
+        client=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))),
+    )
+    monkeypatch.setattr(llm_service.providers, "call", lambda fn, label, **kwargs: fn(provider))
+    router_out = llm_service.router_completion("What do you have?")
+
+    assert '"entities": ["Badya", "Hacienda Bay"]' in sent[0][0]["content"]
+    assert router_out.entities == []
+
+
+def test_resolved_entities_skip_the_query_embedding(monkeypatch):
+    _router_reply(monkeypatch, {
+        "intent": "project_query",
+        "needs": [],
+        "filters": {},
+        "query_rewrite": "Tell me about Badya",
+        "entities": ["Badya"],
+    })
+    embedded = []
+    monkeypatch.setattr(rag_service, "embed_query", lambda query, timer=None: embedded.append(query) or [])
+
+    pipeline = ChatPipeline(prompt_builder=None, tools=[])
+    turn = ChatTurn("test-router", [Message(role="user", content="Tell me about Badya")])
+    pipeline.route(turn)
+    pipeline.retrieve(turn)
+
+    assert [p.project_id for p in turn.retrieved_docs] == ["badya"]
+    assert embedded == []
+
+
+def test_area_names_do_not_resolve_to_projects():
+    from app.backend.services.kb_service import kb_service
+
+    assert kb_service.mentioned_projects("villas in New Cairo or October") == []
+    assert kb_service.resolve_entity("Alexandria") is None
+    assert kb_service.resolve_entity("Palm Hills New Cairo") == ("palm_hills_new_cairo", 100.0)
+    assert kb_service.mentioned_projects("price of Katameya 2?") == ["palm_hills_katameya_2"]